@@ -0,0 +1,501 @@
+"""Load and latency benchmarks for the emulator.
+
+    python -m klvr_emulator.bench run --duration 10 --pollers 16 --ws-clients 1,10,100 -o results.json
+    python -m klvr_emulator.bench run --url http://10.0.0.5:8000 --pid 4242
+    python -m klvr_emulator.bench compare baseline.json results.json --threshold 10
+    python -m klvr_emulator.bench run --scenarios startup --startup-runs 20
+
+Four scenarios, each selectable with --scenarios:
+
+  http  status pollers (optionally conditional, with If-None-Match) plus
+        slot mutators at a fixed rate; latency percentiles and histogram
+  ws    WebSocket subscribers, swept over --ws-clients, while mutators keep
+        state changing; delivered messages and bytes per second
+  tick  the simulation step alone at fleet scale (no server); tick duration
+  startup
+        cold starts, each in a fresh interpreter: importing the app module,
+        create_app(), the ASGI startup event, the first status request and
+        shutdown; not part of the default set
+
+Without --url the app is served in-process on a free localhost port (CPU
+and RSS then include the load generator). With --url, pass --pid to sample
+the server's CPU/RSS from /proc; a comma-separated --url list (e.g. the
+worker ports of `run.py --workers`) spreads the load over those chargers.
+--format requests a compact status encoding (klvr_emulator.encoding) from
+both pollers and subscribers. Results are written as JSON; `compare`
+reports the change of every latency/throughput metric between two runs and
+exits non-zero when one regressed by more than --threshold percent.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from klvr_emulator.encoding import FORMATS
+
+RESULTS_VERSION = 1
+PERCENTILES = (50, 90, 99, 99.9)
+HISTOGRAM_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# metric -> True if higher is better; everything else in a result is informational
+COMPARED = {
+    "p50_ms": False, "p99_ms": False, "mean_ms": False,
+    "rps": True, "msgs_per_s": True, "cpu_percent": False, "rss_mb": False,
+}
+
+
+def summarize(samples_ms: list[float]) -> dict:
+    """Latency percentiles plus a fixed-bucket histogram (upper bounds in ms)."""
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+    result = {"count": len(ordered), "mean_ms": round(statistics.fmean(ordered), 4),
+              "min_ms": round(ordered[0], 4), "max_ms": round(ordered[-1], 4)}
+    for p in PERCENTILES:
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        result[f"p{p:g}_ms".replace(".", "_")] = round(ordered[index], 4)
+    histogram = {}
+    i = 0
+    for bound in HISTOGRAM_MS:
+        n = 0
+        while i < len(ordered) and ordered[i] <= bound:
+            n += 1
+            i += 1
+        histogram[f"le_{bound:g}"] = n
+    histogram["le_inf"] = len(ordered) - i
+    result["histogram"] = histogram
+    return result
+
+
+class Usage:
+    """CPU seconds and RSS of a process, from /proc when available."""
+
+    def __init__(self, pid: int | None = None):
+        self.pid = pid if pid is not None else os.getpid()
+        self.start_cpu = self.cpu()
+        self.start_wall = time.monotonic()
+
+    def cpu(self) -> float:
+        if self.pid == os.getpid():
+            t = os.times()
+            return t.user + t.system
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def rss_mb(self) -> tuple[float, float]:
+        """(current, peak) resident set size in MiB."""
+        try:
+            values = {}
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in ("VmRSS", "VmHWM"):
+                        values[key] = int(value.split()[0]) / 1024
+            return round(values["VmRSS"], 1), round(values["VmHWM"], 1)
+        except (OSError, KeyError):
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            return round(peak, 1), round(peak, 1)
+
+    def report(self) -> dict:
+        wall = time.monotonic() - self.start_wall
+        cpu = self.cpu() - self.start_cpu
+        rss, peak = self.rss_mb()
+        return {"cpu_seconds": round(cpu, 3), "cpu_percent": round(100 * cpu / wall, 1) if wall else 0.0,
+                "rss_mb": rss, "rss_peak_mb": peak}
+
+
+def charger_urls(base_url: str, fleet: int) -> list[str]:
+    """API base URL of every charger: a prefix-mode fleet under `base_url`, or a comma-separated list."""
+    if "," in base_url:
+        return [url.rstrip("/") for url in base_url.split(",") if url]
+    return [base_url] + [f"{base_url}/chargers/{i}" for i in range(1, fleet)]
+
+
+async def _poller(client, path: str, deadline: float, conditional: bool, accept: str, latencies: list, codes: dict):
+    etag = None
+    while time.monotonic() < deadline:
+        headers = {"Accept": accept}
+        if conditional and etag:
+            headers["If-None-Match"] = etag
+        start = time.perf_counter()
+        try:
+            r = await client.get(f"{path}/api/v2/charger/status", headers=headers)
+        except Exception:
+            codes["error"] = codes.get("error", 0) + 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        codes[str(r.status_code)] = codes.get(str(r.status_code), 0) + 1
+        etag = r.headers.get("etag", etag)
+
+
+async def _mutator(client, paths: list[str], deadline: float, rate: float, latencies: list, codes: dict,
+                   rng: random.Random):
+    """Insert/eject random slots at `rate` requests per second."""
+    interval = 1.0 / rate
+    next_at = time.monotonic()
+    while time.monotonic() < deadline:
+        path = rng.choice(paths)
+        slot = rng.randrange(48)
+        if rng.random() < 0.5:
+            url = f"{path}/api/v2/charger/insert/{slot}?type={rng.choice(('KLVR-AA', 'KLVR-AAA'))}"
+        else:
+            url = f"{path}/api/v2/charger/eject/{slot}"
+        start = time.perf_counter()
+        try:
+            r = await client.post(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+            codes[str(r.status_code)] = codes.get(str(r.status_code), 0) + 1
+        except Exception:
+            codes["error"] = codes.get("error", 0) + 1
+        next_at += interval
+        await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+
+def _mutation_tasks(client, paths, deadline, args, latencies, codes):
+    rng = random.Random(args.seed)
+    return [_mutator(client, paths, deadline, args.mutation_rate / args.mutators, latencies, codes, rng)
+            for _ in range(args.mutators)] if args.mutators and args.mutation_rate > 0 else []
+
+
+async def bench_http(base_url: str, args, usage_pid: int | None) -> dict:
+    import httpx
+
+    paths = charger_urls(base_url, args.fleet)
+    limits = httpx.Limits(max_connections=args.pollers + args.mutators)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        poll_ms, poll_codes, mut_ms, mut_codes = [], {}, [], {}
+        usage = Usage(usage_pid)
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(
+            *(_poller(client, paths[i % len(paths)], deadline, args.conditional, FORMATS[args.format], poll_ms,
+                      poll_codes)
+              for i in range(args.pollers)),
+            *_mutation_tasks(client, paths, deadline, args, mut_ms, mut_codes),
+        )
+        elapsed = time.monotonic() - started
+    status = summarize(poll_ms)
+    status.update({"rps": round(len(poll_ms) / elapsed, 1), "codes": poll_codes})
+    mutations = summarize(mut_ms)
+    mutations.update({"rps": round(len(mut_ms) / elapsed, 1), "codes": mut_codes})
+    return {"status": status, "mutations": mutations, "process": usage.report()}
+
+
+async def _subscriber(ws_url: str, deadline: float, counts: list, index: int):
+    import websockets
+
+    try:
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    message = await asyncio.wait_for(ws.recv(), remaining)
+                except asyncio.TimeoutError:
+                    return
+                counts[index][0] += 1
+                counts[index][1] += len(message)
+    except Exception:
+        counts[index][2] = True
+
+
+async def bench_ws(base_url: str, clients: int, args, usage_pid: int | None) -> dict:
+    import httpx
+
+    paths = charger_urls(base_url, args.fleet)
+    query = "?" + "&".join((["mode=delta"] if args.ws_delta else []) + [f"format={args.format}"])
+    counts = [[0, 0, False] for _ in range(clients)]
+    mut_ms, mut_codes = [], {}
+    async with httpx.AsyncClient(timeout=30) as client:
+        usage = Usage(usage_pid)
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(
+            *(_subscriber(f"ws{paths[i % len(paths)][4:]}/api/v2/ws{query}", deadline, counts, i)
+              for i in range(clients)),
+            *_mutation_tasks(client, paths, deadline, args, mut_ms, mut_codes),
+        )
+        elapsed = time.monotonic() - started
+        try:
+            scheduler = (await client.get(f"{paths[0]}/api/v2/emulator/broadcasts")).json()
+        except Exception:
+            scheduler = None
+    messages = [c[0] for c in counts]
+    return {
+        "clients": clients,
+        "failed_clients": sum(1 for c in counts if c[2]),
+        "messages": sum(messages),
+        "msgs_per_s": round(sum(messages) / elapsed, 1),
+        "bytes_per_s": round(sum(c[1] for c in counts) / elapsed, 1),
+        "per_client_min": min(messages) if messages else 0,
+        "per_client_max": max(messages) if messages else 0,
+        "mutation_rps": round(len(mut_ms) / elapsed, 1),
+        "scheduler": scheduler,
+        "process": usage.report(),
+    }
+
+
+def bench_tick(chargers: int, args) -> dict:
+    """Step a fleet of fully loaded chargers and time each tick."""
+    from klvr_emulator.charger import Fleet
+    from klvr_emulator.clock import Clock
+    from klvr_emulator.engine import NUM_SLOTS, TICK_SECONDS, make_engine
+    from klvr_emulator.ops import insert_fields
+
+    clock = Clock(manual=True)
+    fleet = Fleet(make_engine(args.engine, clock), clock)
+    rng = random.Random(args.seed)
+    for i in range(chargers):
+        charger = fleet.new_charger(str(i), "127.0.0.1")
+        for slot in range(NUM_SLOTS):
+            fields = insert_fields(rng.choice(("KLVR-AA", "KLVR-AAA")))
+            fields["stateOfChargePercent"] = rng.uniform(5.0, 60.0)
+            charger.write_slot(slot, fields)
+    usage = Usage()
+    samples = []
+    for _ in range(args.tick_iterations):
+        start = time.perf_counter()
+        fleet.advance(TICK_SECONDS)
+        samples.append((time.perf_counter() - start) * 1000)
+    result = summarize(samples)
+    result.update({"chargers": chargers, "engine": args.engine, "process": usage.report()})
+    return result
+
+
+def start_server(args) -> tuple[str, object]:
+    """Serve the app in a background thread on a free localhost port."""
+    import uvicorn
+    from klvr_emulator.config import Config
+    from klvr_emulator.fleet import build_fleet, raise_fd_limit
+    from klvr_emulator.main import create_app
+
+    app = create_app(Config(engine=args.engine, clock=args.clock, host_ip="127.0.0.1", mdns=False,
+                            ws_max_clients=max(2, max(args.ws_clients, default=0))))
+    raise_fd_limit()
+    if args.fleet > 1:
+        socks = build_fleet(app.state.emulator, args.fleet, "prefix", 0, "127.0.0.1")
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        socks = [sock]
+        app.state.emulator.port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": socks}, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("❌ In-process server failed to start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{socks[0].getsockname()[1]}", server
+
+
+# One cold start, run with `python -c` so every import is paid again; the
+# first request is a bare ASGI call so no HTTP client is imported
+STARTUP_SCRIPT = """
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+from klvr_emulator.config import Config
+from klvr_emulator.main import create_app
+t1 = time.perf_counter()
+app = create_app(Config(engine=sys.argv[1], host_ip="127.0.0.1", mdns=False))
+t2 = time.perf_counter()
+
+async def request():
+    sent = []
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        sent.append(message)
+    await app({"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+               "scheme": "http", "path": "/api/v2/charger/status", "raw_path": b"/api/v2/charger/status",
+               "root_path": "", "query_string": b"", "headers": [], "client": ("127.0.0.1", 1),
+               "server": ("127.0.0.1", 8000)}, receive, send)
+    return sent[0]["status"]
+
+async def cycle():
+    global t3, t4
+    async with app.router.lifespan_context(app):
+        t3 = time.perf_counter()
+        assert await request() == 200
+        t4 = time.perf_counter()
+
+asyncio.run(cycle())
+t5 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1, "startup": t3 - t2, "first_request": t4 - t3,
+                  "shutdown": t5 - t4, "total": t5 - t0}))
+"""
+
+
+def bench_startup(args) -> dict:
+    """Time `--startup-runs` cold starts, phase by phase."""
+    phases: dict[str, list[float]] = {}
+    for _ in range(args.startup_runs):
+        out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, args.engine],
+                             capture_output=True, text=True, check=True)
+        for phase, seconds in json.loads(out.stdout.strip().splitlines()[-1]).items():
+            phases.setdefault(phase, []).append(seconds * 1000)
+    result = {phase: summarize(samples) for phase, samples in phases.items()}
+    result["engine"] = args.engine
+    return result
+
+
+def run(args) -> dict:
+    scenarios = set(args.scenarios)
+    results = {}
+    server = None
+    if scenarios & {"http", "ws"}:
+        if args.url:
+            base_url, usage_pid = args.url.rstrip("/"), args.pid
+        else:
+            (base_url, server), usage_pid = start_server(args), None
+        try:
+            if "http" in scenarios:
+                print(f"⏱  http: {args.pollers} pollers, {args.mutation_rate:g} mutations/s for {args.duration:g}s")
+                results["http"] = asyncio.run(bench_http(base_url, args, usage_pid))
+            if "ws" in scenarios:
+                results["ws"] = {}
+                for clients in args.ws_clients:
+                    print(f"⏱  ws: {clients} subscribers for {args.duration:g}s")
+                    results["ws"][f"clients_{clients}"] = asyncio.run(bench_ws(base_url, clients, args, usage_pid))
+        finally:
+            if server is not None:
+                server.should_exit = True
+    if "tick" in scenarios:
+        results["tick"] = {}
+        for chargers in args.tick_chargers:
+            print(f"⏱  tick: {chargers} chargers × {args.tick_iterations} ticks ({args.engine} engine)")
+            results["tick"][f"chargers_{chargers}"] = bench_tick(chargers, args)
+    if "startup" in scenarios:
+        print(f"⏱  startup: {args.startup_runs} cold starts ({args.engine} engine)")
+        results["startup"] = bench_startup(args)
+    return {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": args.url or "in-process",
+            "args": {k: v for k, v in vars(args).items() if k != "func"},
+        },
+        "results": results,
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """{"http.status.p99_ms": 1.2, ...} for every compared metric."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif key in COMPARED and isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> tuple[list[dict], bool]:
+    """Per-metric change in percent; a regression is a change in the wrong direction beyond `threshold`."""
+    before, after = flatten(baseline["results"]), flatten(current["results"])
+    rows, regressed = [], False
+    for name in sorted(before.keys() & after.keys()):
+        old, new = before[name], after[name]
+        change = (new - old) / old * 100 if old else 0.0
+        worse = -change if COMPARED[name.rsplit(".", 1)[1]] else change
+        bad = worse > threshold
+        regressed |= bad
+        rows.append({"metric": name, "baseline": old, "current": new, "change_percent": round(change, 1),
+                     "regression": bad})
+    return rows, regressed
+
+
+def print_summary(data: dict):
+    for name, value in sorted(flatten(data["results"]).items()):
+        print(f"  {name:<45} {value}")
+
+
+def print_comparison(rows: list[dict]):
+    for row in rows:
+        flag = "❌" if row["regression"] else "  "
+        print(f"{flag} {row['metric']:<45} {row['baseline']:>12} → {row['current']:>12} ({row['change_percent']:+.1f}%)")
+
+
+def _counts(text: str) -> list[int]:
+    return [int(n) for n in text.split(",") if n]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m klvr_emulator.bench", description="KLVR emulator benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    r = sub.add_parser("run", help="run the benchmarks")
+    r.add_argument("--url", help="benchmark a running emulator instead of an in-process one; "
+                                 "several comma-separated charger URLs spread the load across them")
+    r.add_argument("--pid", type=int, help="with --url: server process to sample CPU/RSS from")
+    r.add_argument("--scenarios", type=lambda s: s.split(","), default=["http", "ws", "tick"],
+                   metavar="http,ws,tick,startup")
+    r.add_argument("--duration", type=float, default=10.0, help="seconds per http/ws run")
+    r.add_argument("--pollers", type=int, default=8, help="concurrent status pollers")
+    r.add_argument("--conditional", action="store_true", help="poll with If-None-Match")
+    r.add_argument("--mutators", type=int, default=1, help="concurrent insert/eject clients")
+    r.add_argument("--mutation-rate", type=float, default=20.0, help="total mutations per second")
+    r.add_argument("--ws-clients", type=_counts, default=[1, 10, 100], metavar="N,N,...",
+                   help="WebSocket subscriber counts to sweep")
+    r.add_argument("--ws-delta", action="store_true", help="subscribe with ?mode=delta")
+    r.add_argument("--format", choices=tuple(FORMATS), default="json",
+                   help="status encoding to request (Accept on http, ?format= on ws)")
+    r.add_argument("--fleet", type=int, default=1, help="chargers (prefix mode); load is spread across them")
+    r.add_argument("--engine", choices=("dict", "array", "event"), default="dict")
+    r.add_argument("--clock", default="real", metavar="real|manual|SCALE")
+    r.add_argument("--tick-chargers", type=_counts, default=[1, 100, 1000], metavar="N,N,...")
+    r.add_argument("--tick-iterations", type=int, default=200)
+    r.add_argument("--startup-runs", type=int, default=10, help="cold starts to time")
+    r.add_argument("--seed", type=int, default=0)
+    r.add_argument("-o", "--output", help="write results JSON here")
+    r.add_argument("--baseline", help="compare against this results file")
+    r.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+
+    c = sub.add_parser("compare", help="compare two results files")
+    c.add_argument("baseline")
+    c.add_argument("current")
+    c.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = run(args)
+        print_summary(current)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(current, f, indent=2)
+            print(f"📄 Results written to {args.output}")
+        if not args.baseline:
+            return 0
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    rows, regressed = compare(baseline, current, args.threshold)
+    print_comparison(rows)
+    if regressed:
+        print(f"❌ Regression beyond {args.threshold:g}%")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
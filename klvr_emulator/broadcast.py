@@ -0,0 +1,142 @@
+"""One scheduler for every WebSocket push trigger.
+
+Endpoint mutations, simulation ticks and the heartbeat all go through
+`request()`. Requests are collected for one debounce window and flushed
+together, so a charger is pushed (and serialized) at most once per window
+however many triggers fired. The heartbeat only pushes chargers that have
+not been pushed within the last heartbeat interval. It keeps wall-clock
+(event loop) time, not the emulated clock: it is a keepalive for real
+clients, so a sped-up clock must not multiply it.
+
+The same triggers wake long-poll and SSE requests parked in
+`wait_for_change()`: one future per waiting request, resolved without a
+debounce, so waiting costs nothing until the charger changes.
+"""
+import asyncio
+
+WS_DEBOUNCE_SECONDS = 0.25   # WS_DEBOUNCE_MS=250
+WS_HEARTBEAT_SECONDS = 10.0  # WS_HEARTBEAT_MS=10000
+
+
+class BroadcastScheduler:
+    def __init__(self, clock, send, chargers, debounce: float = WS_DEBOUNCE_SECONDS,
+                 heartbeat: float = WS_HEARTBEAT_SECONDS):
+        """`send(charger, heartbeat=False)` pushes one charger; `chargers` iterates the fleet."""
+        self.clock = clock
+        self.send = send
+        self.chargers = chargers
+        self.debounce = debounce
+        self.heartbeat = heartbeat
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.pending: set = set()
+        self.last_push: dict = {}  # charger -> loop time of its last push
+        self._flush_task: asyncio.Task | None = None
+        self._heartbeat_task: asyncio.Task | None = None
+        self.waiters: dict = {}  # charger -> futures of requests waiting for its next change
+        self.stats = {
+            "requested": 0,           # triggers for chargers with clients
+            "coalesced": 0,           # triggers merged into an already pending push
+            "pushed": 0,              # pushes actually sent
+            "heartbeats_sent": 0,
+            "heartbeats_skipped": 0,  # a push went out within the heartbeat interval
+            "woken": 0,               # long-poll/SSE waiters woken by a change
+        }
+
+    def start(self):
+        """Bind to the running event loop and start the heartbeat."""
+        self.loop = asyncio.get_running_loop()
+        self._heartbeat_task = self.loop.create_task(self._heartbeat())
+
+    def stop(self):
+        for task in (self._flush_task, self._heartbeat_task):
+            if task is not None:
+                task.cancel()
+        self._flush_task = self._heartbeat_task = None
+        self.pending.clear()
+        for futures in self.waiters.values():
+            for future in futures:
+                if not future.done():
+                    future.set_result(None)
+        self.waiters.clear()
+        self.loop = None
+
+    def request(self, *chargers):
+        """Ask for a push of `chargers`. Safe from any thread; never blocks."""
+        loop = self.loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._request(chargers)
+        else:
+            loop.call_soon_threadsafe(self._request, chargers)
+
+    def _request(self, chargers):
+        for charger in chargers:
+            futures = self.waiters.pop(charger, None)
+            if futures:
+                for future in futures:
+                    if not future.done():
+                        future.set_result(None)
+                self.stats["woken"] += len(futures)
+            if not charger.ws_clients:
+                continue
+            self.stats["requested"] += 1
+            if charger in self.pending:
+                self.stats["coalesced"] += 1
+            else:
+                self.pending.add(charger)
+        if self.pending and self._flush_task is None and self.loop is not None:
+            self._flush_task = self.loop.create_task(self._flush_later())
+
+    async def wait_for_change(self, charger, since: int, timeout: float) -> bool:
+        """Wait until `charger.version` passes `since`, for up to `timeout` wall-clock seconds.
+
+        True once it has (at once if it already had), False on timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while charger.version <= since:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            future = loop.create_future()
+            futures = self.waiters.setdefault(charger, set())
+            futures.add(future)
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                futures.discard(future)
+                if not futures and self.waiters.get(charger) is futures:
+                    del self.waiters[charger]
+        return True
+
+    async def _flush_later(self):
+        await self.clock.sleep(self.debounce)
+        self._flush_task = None
+        pending, self.pending = self.pending, set()
+        now = self.loop.time()
+        for charger in pending:
+            self.last_push[charger] = now
+            self.stats["pushed"] += 1
+            await self.send(charger)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            now = self.loop.time()
+            for charger in self.chargers:
+                if not charger.ws_clients:
+                    continue
+                last = self.last_push.get(charger)
+                if last is not None and now - last < self.heartbeat:
+                    self.stats["heartbeats_skipped"] += 1
+                    continue
+                self.last_push[charger] = now
+                self.stats["heartbeats_sent"] += 1
+                await self.send(charger, heartbeat=True)
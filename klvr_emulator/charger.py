@@ -0,0 +1,342 @@
+import itertools
+import os
+import threading
+import time
+from klvr_emulator.clock import Clock
+from klvr_emulator.encoding import FORMAT_NAMES, JSON, Frame, encode_status
+from klvr_emulator.engine import NUM_SLOTS, EMPTY_SLOT, DictEngine, new_battery
+
+DEFAULT_MAC_ADDRESS = "00:B0:D0:63:C2:26"
+
+# Distinguishes this process's ETags from those of an earlier run at the same version
+ETAG_EPOCH = f"{os.getpid():x}{int(time.time()):x}"
+
+
+def new_charger_state(host_ip: str, mac_address: str = DEFAULT_MAC_ADDRESS) -> dict:
+    return {
+        "name": "KLVR Emulator",
+        "deviceInternalTemperatureC": 24.01,
+        "firmwareVersion": "0.1.0",
+        "firmwareBuild": "abc123",
+        "deviceStatus": "ok",
+        "network": {
+            "ipAddress": host_ip,
+            "gatewayAddress": "10.0.0.1",
+            "mask": "255.255.255.0",
+            "macAddress": mac_address,
+            "method": "dhcp"
+        },
+        "batteries": [new_battery(i) for i in range(NUM_SLOTS)]
+    }
+
+
+def new_firmware_state() -> dict:
+    return {
+        "main_firmware_pending": False,
+        "rear_firmware_pending": False,
+        "main_firmware_size": 0,
+        "rear_firmware_size": 0,
+        "main_firmware_sha256": None,
+        "rear_firmware_sha256": None,
+        "main_firmware_path": None,
+        "rear_firmware_path": None,
+        "main_firmware_version": None,
+        "rear_firmware_version": None,
+        "target_version": None,
+        "main_rebooting": False,
+        "rear_rebooting": False
+    }
+
+
+class Charger:
+    """One emulated charger: its device state, firmware state and WS clients.
+
+    `port` is the TCP port the charger answers on (None means its emulator's
+    port, `Config.port`), `prefix` the URL path it is mounted under in fleet mode.
+    Slot state lives in one row of the fleet's simulation `engine`; with the
+    dict engine `state["batteries"]` is that row, otherwise it is absent.
+    Emulated delays run on `clock`, shared with the rest of the fleet.
+
+    `version` goes up on every slot mutation and simulation step; serialized
+    status payloads are cached per version so unchanged state is never
+    re-encoded. Mutations also sample the slots into the fleet's `history`
+    (klvr_emulator.history), when it keeps one.
+    """
+
+    def __init__(self, charger_id: str, host_ip: str, engine=None, port: int | None = None,
+                 prefix: str = "", mac_suffix: int | None = None, clock: Clock | None = None):
+        self.id = charger_id
+        self.host_ip = host_ip
+        self.port = port
+        self.prefix = prefix
+        self.mac_suffix = mac_suffix
+        if mac_suffix is None:
+            mac_address = DEFAULT_MAC_ADDRESS
+        else:
+            mac_address = "00:80:E1:" + ":".join(f"{(mac_suffix >> s) & 0xff:02X}" for s in (16, 8, 0))
+        self.state = new_charger_state(host_ip, mac_address)
+        self.firmware = new_firmware_state()
+        self.clock = clock if clock is not None else Clock()
+        self.engine = engine if engine is not None else DictEngine(self.clock)
+        if isinstance(self.engine, DictEngine):
+            self.row = self.engine.add_row(self.state["batteries"])
+        else:
+            self.row = self.engine.add_row()
+            del self.state["batteries"]
+
+        # WebSocket state — connected clients (klvr_emulator.ws.WSClient)
+        self.ws_clients: list = []
+        self.delta_seq = 0
+        self.delta_base: list[dict] | None = None  # slots as of the last delta sent
+        self.delta_version = -1
+
+        self._versions = itertools.count(1)
+        self.version = 0
+        self._cache: dict[str, object] = {}
+        self._cache_version = -1
+        self.recorder = None  # klvr_emulator.record.Recorder while the fleet records
+        self.history = None  # klvr_emulator.history.History, shared with the fleet
+
+    def touch(self, sample: bool = True):
+        """Record a state change: bumps `version`, invalidating cached payloads.
+
+        `sample=False` leaves the history to the caller (the simulation tick
+        samples every changed charger at once).
+        """
+        self.version = next(self._versions)
+        if sample and self.history is not None:
+            self.history.record(self.engine, [self.row], self.clock.now())
+
+    def status(self) -> dict:
+        return {
+            "deviceStatus": self.state.get("deviceStatus", "ok"),
+            "batteries": self.batteries()
+        }
+
+    def _cached(self, kind: str, build):
+        version = self.version
+        if self._cache_version != version:
+            self._cache = {}
+            self._cache_version = version
+        value = self._cache.get(kind)
+        if value is None:
+            value = self._cache[kind] = build()
+        return version, value
+
+    def status_snapshot(self, media_type: str = JSON) -> tuple[int, bytes]:
+        """(version, GET /api/v2/charger/status body) — serialized once per version and format."""
+        return self._cached(media_type, lambda: encode_status(self.status(), media_type))
+
+    def status_event(self) -> Frame:
+        """The battery_status WebSocket frame for the current version."""
+        return self._cached("ws", lambda: Frame({"event": "battery_status", "data": self.status()}))[1]
+
+    def take_delta(self) -> tuple[int, Frame] | None:
+        """(seq, next battery_delta frame), or None if no slot changed since the last.
+
+        Each changed slot carries its index and the new values of the fields
+        that changed. Values are absolute, so re-applying a delta is harmless.
+        """
+        if self.delta_version == self.version and self.delta_base is not None:
+            return None
+        self.delta_version = self.version
+        current = [dict(b) for b in self.batteries()]
+        base, self.delta_base = self.delta_base, current
+        if base is None:
+            return None
+        changes = []
+        for old, new in zip(base, current):
+            if old != new:
+                changes.append({"index": new["index"], **{k: v for k, v in new.items() if old.get(k) != v}})
+        if not changes:
+            return None
+        self.delta_seq += 1
+        return self.delta_seq, Frame({"event": "battery_delta", "seq": self.delta_seq, "data": {"batteries": changes}})
+
+    def delta_snapshot(self) -> tuple[int, Frame]:
+        """(seq, full battery_status frame matching the delta baseline, tagged with that seq)."""
+        if self.delta_base is None:
+            self.take_delta()
+        return self.delta_seq, Frame({
+            "event": "battery_status",
+            "seq": self.delta_seq,
+            "data": {"deviceStatus": self.state.get("deviceStatus", "ok"), "batteries": self.delta_base}
+        })
+
+    def etag(self, version: int, media_type: str = JSON) -> str:
+        if media_type == JSON:
+            return f'"{ETAG_EPOCH}-{self.id}-{version}"'
+        return f'"{ETAG_EPOCH}-{self.id}-{version}-{FORMAT_NAMES[media_type]}"'
+
+    def batteries(self) -> list[dict]:
+        return self.engine.batteries(self.row)
+
+    def battery(self, slot: int) -> dict:
+        return self.engine.battery(self.row, slot)
+
+    def write_slot(self, slot: int, fields: dict):
+        """Update a slot without bumping the version; call touch() once when done."""
+        recorder = self.recorder
+        if recorder is None:
+            self.engine.update(self.row, slot, fields)
+            return
+        with recorder.lock:
+            self.engine.update(self.row, slot, fields)
+            recorder.set(self, slot, fields)
+
+    def update_slot(self, slot: int, **fields):
+        self.write_slot(slot, fields)
+        self.touch()
+
+    def clear_slots(self):
+        for slot in range(NUM_SLOTS):
+            self.write_slot(slot, EMPTY_SLOT)
+        self.touch()
+
+    def display_name(self, default_port: int) -> str:
+        port = self.port if self.port is not None else default_port
+        if self.prefix:
+            return f"KLVR Emulator Port {port} #{self.id}"
+        return f"KLVR Emulator Port {port}"
+
+    def service_mac(self, default_port: int) -> str:
+        """Simulated MAC used for the Bonjour service name (klvr<mac>)."""
+        suffix = self.mac_suffix
+        if suffix is None:
+            suffix = self.port if self.port is not None else default_port
+        return f"0080e1{suffix:06x}"
+
+
+class Fleet:
+    """Registry of every charger served by this process, by id, port and engine row.
+
+    Also owns the simulation: the shared engine and the clock it runs on,
+    and the slot history when one is kept.
+    """
+
+    def __init__(self, engine=None, clock: Clock | None = None, history=None):
+        self.clock = clock if clock is not None else Clock()
+        self.engine = engine if engine is not None else DictEngine(self.clock)
+        self.clock.add_listener(self.engine.wakeup.set)
+        self.lock = threading.Lock()
+        self.last_tick = self.clock.now()
+        self.chargers: dict[str, Charger] = {}
+        self.by_port: dict[int, Charger] = {}
+        self.by_row: dict[int, Charger] = {}
+        self.recorder = None
+        self.history = history
+
+    def add(self, charger: Charger) -> Charger:
+        if charger.id in self.chargers:
+            raise ValueError(f"Duplicate charger id: {charger.id}")
+        if charger.engine is not self.engine:
+            raise ValueError("Charger must share the fleet's engine")
+        self.chargers[charger.id] = charger
+        self.by_row[charger.row] = charger
+        charger.recorder = self.recorder
+        charger.history = self.history
+        if charger.port is not None:
+            self.by_port[charger.port] = charger
+        if self.history is not None:
+            self.history.add(self.engine, charger.row, self.clock.now())
+        return charger
+
+    def assign_port(self, charger: Charger, port: int):
+        if charger.port is not None:
+            self.by_port.pop(charger.port, None)
+        charger.port = port
+        self.by_port[port] = charger
+
+    def new_charger(self, charger_id: str, host_ip: str, **kwargs) -> Charger:
+        return self.add(Charger(charger_id, host_ip, self.engine, clock=self.clock, **kwargs))
+
+    def tick(self) -> list[Charger]:
+        """Catch the simulation up with the clock; return the chargers whose slots changed."""
+        with self.lock:
+            now = self.clock.now()
+            dt, self.last_tick = now - self.last_tick, now
+            recorder = self.recorder
+            if recorder is None:
+                rows = self.engine.step(dt)
+            else:
+                with recorder.lock:
+                    rows = self.engine.step(dt)
+                    recorder.step(dt)
+            if self.history is not None:
+                self.history.tick(self.engine, rows, self.engine.finished, now)
+            changed = [self.by_row[row] for row in rows if row in self.by_row]
+        for charger in changed:
+            charger.touch(sample=False)
+        return changed
+
+    def advance(self, seconds: float) -> list[Charger]:
+        """Move simulated time forward and apply it before returning."""
+        self.clock.advance(seconds)
+        return self.tick()
+
+    def start_recording(self, recorder):
+        """Log every slot change and simulation step to `recorder` (klvr_emulator.record)."""
+        with self.lock:
+            if self.recorder is not None:
+                raise ValueError("Already recording")
+            recorder.snapshot(self.engine, self.chargers.values())
+            self.recorder = recorder
+            for charger in self.chargers.values():
+                charger.recorder = recorder
+
+    def stop_recording(self):
+        """Detach and close the recorder; returns it (None if not recording)."""
+        with self.lock:
+            recorder, self.recorder = self.recorder, None
+            for charger in self.chargers.values():
+                charger.recorder = None
+        if recorder is not None:
+            recorder.close()
+        return recorder
+
+    def wait(self, timeout: float, min_real: float = 0.02) -> float | None:
+        """Block the simulation thread until the next tick, deadline or wakeup.
+
+        Returns the real-time timeout if it expired, None if woken early.
+        """
+        self.engine.wakeup.clear()
+        delay = self.clock.real_delay(self.engine.next_timeout(timeout))
+        real_timeout = None if delay is None else max(delay, min_real)
+        if self.engine.wakeup.wait(real_timeout):
+            return None
+        return real_timeout
+
+    def query(self, chargers=None, soc_min: float | None = None, soc_max: float | None = None,
+              limit: int | None = None, **filters) -> list[tuple[Charger, dict]]:
+        """(charger, battery) for every slot matching the indexed `filters` and the SoC range.
+
+        Looks slots up in the engine's SlotIndex (klvr_emulator.index), so the
+        cost follows the number of matches, not the fleet size. `chargers`
+        restricts the search; `limit` stops after that many matches.
+        """
+        rows = None if chargers is None else [c.row for c in chargers]
+        matches = []
+        for row, slot in self.engine.index.find(rows=rows, **filters):
+            charger = self.by_row.get(row)
+            if charger is None:
+                continue
+            battery = self.engine.battery(row, slot)
+            soc = battery["stateOfChargePercent"]
+            if (soc_min is not None and soc < soc_min) or (soc_max is not None and soc > soc_max):
+                continue
+            matches.append((charger, dict(battery)))
+            if limit is not None and len(matches) >= limit:
+                break
+        return matches
+
+    def get(self, charger_id: str) -> Charger | None:
+        return self.chargers.get(charger_id)
+
+    def for_port(self, port: int) -> Charger | None:
+        return self.by_port.get(port)
+
+    def __iter__(self):
+        return iter(list(self.chargers.values()))
+
+    def __len__(self):
+        return len(self.chargers)
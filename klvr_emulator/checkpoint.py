@@ -0,0 +1,300 @@
+"""Checkpoint and restore of slot and firmware state through a memory-mapped file.
+
+The snapshot has a fixed layout: a 64-byte header followed by `capacity`
+fixed-size charger records (NumPy structured dtype, little-endian), so a
+checkpoint fills a mapping with vectorized writes and a restore reads it
+with zero-copy views — with the array engine a whole fleet is copied back
+in a few vectorized assignments.
+
+  header   magic "KLVRCKP1", layout version, slots per charger, capacity,
+           charger count, complete flag, wall-clock time of the checkpoint
+  record   charger id, firmware state, firmwareVersion, then NUM_SLOTS
+           slots of (slotState, SoC, time remaining, bay temperature,
+           errorMsg, batteryDetected)
+
+A checkpoint is written to `<path>.tmp`, synced, then renamed over
+`path`, so a crash mid-write leaves the previous snapshot in place. The
+complete flag is only set once the records are written, so a torn file
+(copied mid-write, say) is ignored on restore instead of half-applied.
+Reboots in progress are not saved: nothing would finish them after a
+restore, so chargers always come back with both boards up. Strings longer
+than their field (see RECORD) are truncated.
+"""
+import os
+import threading
+import time
+import numpy as np
+from klvr_emulator.engine import NUM_SLOTS, SLOT_STATES, STATE_CODES, ArrayEngine
+
+MAGIC = b"KLVRCKP1"
+LAYOUT_VERSION = 1
+HEADER_SIZE = 64
+
+# Seconds between periodic checkpoints (Config.checkpoint_interval)
+CHECKPOINT_INTERVAL = 30.0
+
+HEADER = np.dtype([
+    ("magic", "S8"), ("version", "<u4"), ("slots", "<u4"), ("capacity", "<u4"), ("count", "<u4"),
+    ("complete", "u1"), ("written_at", "<f8"),
+])
+SLOT = np.dtype([
+    ("state", "u1"), ("soc", "<f8"), ("remaining", "<f8"), ("temp", "<f8"),
+    ("error", "S32"), ("detected", "S32"),
+])
+RECORD = np.dtype([
+    ("id", "S32"),
+    ("main_pending", "u1"), ("rear_pending", "u1"),
+    ("main_rebooting", "u1"), ("rear_rebooting", "u1"),  # always 0: reboots are not saved
+    ("main_size", "<u8"), ("rear_size", "<u8"),
+    ("main_sha256", "S64"), ("rear_sha256", "S64"),
+    ("main_version", "S32"), ("rear_version", "S32"), ("target_version", "S32"),
+    ("main_path", "S256"), ("rear_path", "S256"),
+    ("firmware_version", "S32"),
+    ("slots", SLOT, (NUM_SLOTS,)),
+])
+
+# firmware_state key -> record field; None round-trips as an empty string
+FIRMWARE_FIELDS = {
+    "main_firmware_pending": "main_pending", "rear_firmware_pending": "rear_pending",
+    "main_firmware_size": "main_size", "rear_firmware_size": "rear_size",
+    "main_firmware_sha256": "main_sha256", "rear_firmware_sha256": "rear_sha256",
+    "main_firmware_version": "main_version", "rear_firmware_version": "rear_version",
+    "target_version": "target_version",
+    "main_firmware_path": "main_path", "rear_firmware_path": "rear_path",
+}
+_FLAGS = {"main_pending", "rear_pending"}
+# Set only while a reboot task runs; a restored charger is never mid-reboot
+TRANSIENT_FIRMWARE = {"main_rebooting": False, "rear_rebooting": False}
+_SIZES = {"main_size", "rear_size"}
+
+
+def _encode(value) -> bytes:
+    return b"" if value is None else str(value).encode("utf-8")
+
+
+def _decode(value: bytes) -> str | None:
+    return value.decode("utf-8", "replace") if value else None
+
+
+def layout_size(capacity: int) -> int:
+    return HEADER_SIZE + capacity * RECORD.itemsize
+
+
+def views(data: np.ndarray, capacity: int):
+    """Header (a length-1 array) and record views over a uint8 buffer in this layout."""
+    header = data[:HEADER.itemsize].view(HEADER)[0:1]
+    records = data[HEADER_SIZE:layout_size(capacity)].view(RECORD)
+    return header, records
+
+
+def _create(path: str, capacity: int):
+    """Map a new, zeroed file at `path` with room for `capacity` chargers."""
+    data = np.memmap(path, dtype=np.uint8, mode="w+", shape=(layout_size(capacity),))
+    return (data, *views(data, capacity))
+
+
+def _fsync(path: str, directory: bool = False):
+    fd = os.open(path, os.O_RDONLY | (getattr(os, "O_DIRECTORY", 0) if directory else 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def checkpoint(fleet, path: str) -> dict:
+    """Write the state of every charger in `fleet` to `path`, replacing the last checkpoint atomically."""
+    started = time.perf_counter()
+    chargers = list(fleet)
+    count = len(chargers)
+    capacity = max(16, 1 << (count - 1).bit_length())
+    tmp = path + ".tmp"
+    try:
+        data, header, records = _create(tmp, capacity)
+        write_records(fleet, chargers, records)
+        header["magic"] = MAGIC
+        header["version"] = LAYOUT_VERSION
+        header["slots"] = NUM_SLOTS
+        header["capacity"] = capacity
+        header["count"] = count
+        header["written_at"] = time.time()
+        data.flush()
+        header["complete"] = 1
+        data.flush()
+        del data, header, records
+        _fsync(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    if os.name == "posix":
+        _fsync(os.path.dirname(os.path.abspath(path)), directory=True)  # make the rename durable
+    return {"path": path, "chargers": count, "bytes": os.path.getsize(path),
+            "ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+def write_records(fleet, chargers, records):
+    """Fill records[:len(chargers)] with the state of `chargers`, members of `fleet`."""
+    with fleet.lock:
+        _write_slots(fleet.engine, chargers, records)
+    for i, charger in enumerate(chargers):
+        rec = records[i]
+        rec["id"] = _encode(charger.id)
+        rec["firmware_version"] = _encode(charger.state.get("firmwareVersion"))
+        for key, field in FIRMWARE_FIELDS.items():
+            value = charger.firmware.get(key)
+            if field in _FLAGS:
+                rec[field] = bool(value)
+            elif field in _SIZES:
+                rec[field] = value or 0
+            else:
+                rec[field] = _encode(value)
+
+
+def record_status(rec) -> dict:
+    """A charger's /api/v2/charger/status body, rebuilt from its record."""
+    slot = rec["slots"]
+    state, soc, remaining = slot["state"].tolist(), slot["soc"].tolist(), slot["remaining"].tolist()
+    temp, error, detected = slot["temp"].tolist(), slot["error"].tolist(), slot["detected"].tolist()
+    return {
+        "deviceStatus": "ok",
+        "batteries": [{
+            "index": s,
+            "batteryBayTempC": temp[s],
+            "slotState": SLOT_STATES[state[s]],
+            "stateOfChargePercent": soc[s],
+            "timeRemainingSeconds": int(remaining[s]),
+            "errorMsg": _decode(error[s]) or "",
+            "batteryDetected": _decode(detected[s]) or "",
+        } for s in range(NUM_SLOTS)],
+    }
+
+
+def _write_slots(engine, chargers, records):
+    slots = records["slots"]
+    if isinstance(engine, ArrayEngine):
+        rows = np.array([c.row for c in chargers], dtype=np.intp)
+        n = len(rows)
+        slots["state"][:n] = engine.state[rows]
+        slots["soc"][:n] = engine.soc[rows]
+        slots["remaining"][:n] = engine.remaining[rows]
+        slots["temp"][:n] = engine.temp[rows]
+        slots["error"][:n] = np.array([_encode(v) for v in engine.error_names], dtype="S32")[engine.error[rows]]
+        slots["detected"][:n] = np.array([_encode(v) for v in engine.detected_names], dtype="S32")[engine.detected[rows]]
+        return
+    for i, charger in enumerate(chargers):
+        batteries = charger.batteries()
+        slot = slots[i]
+        slot["state"] = [STATE_CODES[b["slotState"]] for b in batteries]
+        slot["soc"] = [b["stateOfChargePercent"] for b in batteries]
+        slot["remaining"] = [b["timeRemainingSeconds"] for b in batteries]
+        slot["temp"] = [b["batteryBayTempC"] for b in batteries]
+        slot["error"] = [_encode(b["errorMsg"]) for b in batteries]
+        slot["detected"] = [_encode(b["batteryDetected"]) for b in batteries]
+
+
+def restore(fleet, path: str) -> dict | None:
+    """Load a checkpoint into the chargers of `fleet` with matching ids.
+
+    Returns None when there is no usable checkpoint at `path`.
+    """
+    started = time.perf_counter()
+    if not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE:
+        return None
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    header = data[:HEADER.itemsize].view(HEADER)[0]
+    if (header["magic"] != MAGIC or header["version"] != LAYOUT_VERSION or header["slots"] != NUM_SLOTS
+            or not header["complete"] or len(data) != HEADER_SIZE + int(header["capacity"]) * RECORD.itemsize):
+        return None
+    records = data[HEADER_SIZE:].view(RECORD)[:int(header["count"])]
+    matched = []
+    for i, charger_id in enumerate(records["id"]):
+        charger = fleet.get(_decode(charger_id) or "")
+        if charger is not None:
+            matched.append((i, charger))
+    with fleet.lock:
+        _read_slots(fleet.engine, matched, records["slots"])
+    for i, charger in matched:
+        rec = records[i]
+        firmware_version = _decode(rec["firmware_version"])
+        if firmware_version is not None:
+            charger.state["firmwareVersion"] = firmware_version
+        for key, field in FIRMWARE_FIELDS.items():
+            if field in _FLAGS:
+                charger.firmware[key] = bool(rec[field])
+            elif field in _SIZES:
+                charger.firmware[key] = int(rec[field])
+            else:
+                charger.firmware[key] = _decode(rec[field])
+        charger.firmware.update(TRANSIENT_FIRMWARE)
+        charger.touch()
+    return {"path": path, "chargers": len(matched), "skipped": len(records) - len(matched),
+            "written_at": float(header["written_at"]), "ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+def _read_slots(engine, matched, slots):
+    if not matched:
+        return
+    if isinstance(engine, ArrayEngine):
+        index = np.array([i for i, _ in matched], dtype=np.intp)
+        rows = np.array([c.row for _, c in matched], dtype=np.intp)
+        chosen = slots[index]
+        engine.state[rows] = chosen["state"]
+        engine.soc[rows] = chosen["soc"]
+        engine.remaining[rows] = chosen["remaining"]
+        engine.temp[rows] = chosen["temp"]
+        for field, names, target in (("error", engine.error_names, engine.error),
+                                     ("detected", engine.detected_names, engine.detected)):
+            values, inverse = np.unique(chosen[field], return_inverse=True)
+            codes = np.array([engine._code(names, _decode(v) or "") for v in values], dtype=np.uint8)
+            target[rows] = codes[inverse].reshape(len(rows), NUM_SLOTS)
+        for row in rows.tolist():
+            engine.index.load_row(row, engine.batteries(row))
+        return
+    for i, charger in matched:
+        slot = slots[i]
+        state, soc, remaining = slot["state"].tolist(), slot["soc"].tolist(), slot["remaining"].tolist()
+        temp, error, detected = slot["temp"].tolist(), slot["error"].tolist(), slot["detected"].tolist()
+        for s in range(NUM_SLOTS):
+            charger.write_slot(s, {
+                "batteryBayTempC": temp[s],
+                "slotState": SLOT_STATES[state[s]],
+                "stateOfChargePercent": soc[s],
+                "timeRemainingSeconds": int(remaining[s]),
+                "errorMsg": _decode(error[s]) or "",
+                "batteryDetected": _decode(detected[s]) or "",
+            })
+
+
+class Checkpointer:
+    """Writes a checkpoint every `interval` wall-clock seconds on a background thread."""
+
+    def __init__(self, fleet, path: str, interval: float = CHECKPOINT_INTERVAL):
+        self.fleet = fleet
+        self.path = path
+        self.interval = interval
+        self.last: dict | None = None
+        self._lock = threading.Lock()  # the periodic thread, the admin endpoint and stop() all save
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def save(self) -> dict:
+        with self._lock:
+            self.last = checkpoint(self.fleet, self.path)
+            return self.last
+
+    def stop(self) -> dict:
+        """Stop the thread and write a final checkpoint."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.save()
@@ -0,0 +1,128 @@
+"""Simulated time for the emulator.
+
+One Clock per emulator instance drives the charge simulation, the WebSocket
+debounce timer and the emulated firmware/reboot delays. It runs in one of
+three modes and can be switched at runtime without jumping:
+
+  real    simulated seconds are wall-clock seconds (scale 1)
+  scaled  simulated time runs `scale` times faster than the wall clock
+  manual  time stands still until advance() is called
+
+Anything waiting on the clock is woken when its mode changes or it is
+advanced, and re-checks its deadline against the new time.
+"""
+import asyncio
+import threading
+import time
+
+CLOCK_MODES = ("real", "scaled", "manual")
+
+
+class Clock:
+    def __init__(self, scale: float = 1.0, manual: bool = False):
+        if scale <= 0:
+            raise ValueError("Clock scale must be positive")
+        self._lock = threading.Lock()
+        # (simulated origin, real origin, scale, manual): replaced as a whole under
+        # the lock, so now() can read it without one and never mix old and new
+        self._timeline = (0.0, time.monotonic(), float(scale), manual)
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._listeners = []
+
+    @property
+    def scale(self) -> float:
+        return self._timeline[2]
+
+    @property
+    def manual(self) -> bool:
+        return self._timeline[3]
+
+    @property
+    def mode(self) -> str:
+        if self.manual:
+            return "manual"
+        return "real" if self.scale == 1.0 else "scaled"
+
+    def now(self) -> float:
+        """Simulated seconds since the clock was created."""
+        origin_sim, origin_real, scale, manual = self._timeline
+        if manual:
+            return origin_sim
+        return origin_sim + (time.monotonic() - origin_real) * scale
+
+    def real_delay(self, seconds: float | None) -> float | None:
+        """Wall-clock seconds until `seconds` of simulated time pass (None: unknown)."""
+        if seconds is None or self.manual:
+            return None
+        return max(0.0, seconds) / self.scale
+
+    def set_mode(self, mode: str, scale: float | None = None):
+        if mode not in CLOCK_MODES:
+            raise ValueError(f"Invalid clock mode. Must be one of: {', '.join(CLOCK_MODES)}")
+        if scale is not None and scale <= 0:
+            raise ValueError("Clock scale must be positive")
+        with self._lock:
+            if mode == "real":
+                scale = 1.0
+            elif scale is None:
+                scale = self.scale
+            self._timeline = (self.now(), time.monotonic(), float(scale), mode == "manual")
+        self._changed()
+
+    def advance(self, seconds: float):
+        """Jump simulated time forward; works in every mode."""
+        if seconds < 0:
+            raise ValueError("Cannot advance the clock backwards")
+        with self._lock:
+            origin_sim, origin_real, scale, manual = self._timeline
+            self._timeline = (origin_sim + seconds, origin_real, scale, manual)
+        self._changed()
+
+    def add_listener(self, callback):
+        """Call `callback()` (from any thread) whenever the clock changes."""
+        self._listeners.append(callback)
+
+    def _changed(self):
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(_wake, fut)
+        for callback in self._listeners:
+            callback()
+
+    async def sleep(self, seconds: float):
+        """asyncio.sleep() in simulated seconds."""
+        target = self.now() + seconds
+        loop = asyncio.get_running_loop()
+        while True:
+            remaining = target - self.now()
+            if remaining <= 0:
+                return
+            fut = loop.create_future()
+            with self._lock:
+                self._waiters.append((loop, fut))
+            try:
+                await asyncio.wait([fut], timeout=self.real_delay(remaining))
+            finally:
+                if not fut.done():
+                    fut.cancel()
+                    with self._lock:
+                        if (loop, fut) in self._waiters:
+                            self._waiters.remove((loop, fut))
+
+    def info(self) -> dict:
+        return {"mode": self.mode, "scale": self.scale, "now": round(self.now(), 3)}
+
+
+def _wake(fut: asyncio.Future):
+    if not fut.done():
+        fut.set_result(None)
+
+
+def parse_clock(spec: str) -> Clock:
+    """Build a clock from a CLI/env spec: "real", "manual" or a time scale like "100"."""
+    if spec == "manual":
+        return Clock(manual=True)
+    if spec == "real":
+        return Clock()
+    return Clock(scale=float(spec))
@@ -0,0 +1,84 @@
+"""Settings for one emulator app (see klvr_emulator.main.create_app).
+
+Every field has a KLVR_* environment variable; `Config.from_env()` reads
+them, so `uvicorn klvr_emulator.main:app` and run.py configure the same way.
+
+  engine               KLVR_ENGINE               dict | array | event
+  clock                KLVR_CLOCK                real | manual | time scale like "100"
+  port                 KLVR_PORT                 port the default charger reports and advertises
+  first_charger        KLVR_FIRST_CHARGER        id of the default charger; fleet chargers follow it
+  host_ip              KLVR_HOST_IP              address to advertise (unset: detected at startup)
+  ws_max_clients       KLVR_WS_MAX_CLIENTS       WebSocket clients per charger
+  seed                 KLVR_SEED                 bulk_insert RNG seed
+  record               KLVR_RECORD               recording log path
+  checkpoint           KLVR_CHECKPOINT           snapshot path
+  checkpoint_interval  KLVR_CHECKPOINT_INTERVAL  seconds between checkpoints
+  firmware_throughput  KLVR_FIRMWARE_THROUGHPUT  upload link speed, bytes per simulated second (0: unlimited)
+  flash_throughput     KLVR_FLASH_THROUGHPUT     flash write speed, bytes per simulated second (0: off)
+  firmware_spill_dir   KLVR_FIRMWARE_SPILL_DIR   keep received images here (unset: hash and discard)
+  profile              KLVR_PROFILE              device profile preset or JSON file
+  mdns                 KLVR_MDNS                 "0" skips the Bonjour registration
+  simulate             KLVR_SIMULATE             "0" skips the simulation thread (step by hand)
+  history              KLVR_HISTORY              slot history samples kept per charger (0: none, the default)
+  history_interval     KLVR_HISTORY_INTERVAL     simulated seconds between history samples
+  log_level            KLVR_LOG_LEVEL            debug | info | warning | error (debug dumps request details)
+  log_format           KLVR_LOG_FORMAT           text | json (one event object per line) | none
+"""
+import os
+from dataclasses import dataclass
+
+
+def _flag(value: str) -> bool:
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+@dataclass
+class Config:
+    engine: str = "dict"
+    clock: str = "real"
+    port: int = 8000
+    first_charger: int = 0
+    host_ip: str | None = None
+    ws_max_clients: int = 2  # firmware supports WS_MAX_CLIENTS=8
+    seed: int | None = None
+    record: str | None = None
+    checkpoint: str | None = None
+    checkpoint_interval: float = 30.0
+    firmware_throughput: float = 0.0
+    flash_throughput: float = 0.0
+    firmware_spill_dir: str | None = None
+    profile: str | None = None
+    mdns: bool = True
+    simulate: bool = True
+    history: int = 0  # opt-in: 720 samples (2 hours) hold about 316 KB per charger
+    history_interval: float = 10.0
+    log_level: str = "info"
+    log_format: str = "text"
+
+    @classmethod
+    def from_env(cls, environ=None, **overrides) -> "Config":
+        env = os.environ if environ is None else environ
+        values = {
+            "engine": env.get("KLVR_ENGINE", "dict"),
+            "clock": env.get("KLVR_CLOCK", "real"),
+            "port": int(env.get("KLVR_PORT", "8000")),
+            "first_charger": int(env.get("KLVR_FIRST_CHARGER", "0")),
+            "host_ip": env.get("KLVR_HOST_IP") or None,
+            "ws_max_clients": int(env.get("KLVR_WS_MAX_CLIENTS", "2")),
+            "seed": int(env["KLVR_SEED"]) if env.get("KLVR_SEED") else None,
+            "record": env.get("KLVR_RECORD") or None,
+            "checkpoint": env.get("KLVR_CHECKPOINT") or None,
+            "checkpoint_interval": float(env.get("KLVR_CHECKPOINT_INTERVAL", "30")),
+            "firmware_throughput": float(env.get("KLVR_FIRMWARE_THROUGHPUT", "0")),
+            "flash_throughput": float(env.get("KLVR_FLASH_THROUGHPUT", "0")),
+            "firmware_spill_dir": env.get("KLVR_FIRMWARE_SPILL_DIR") or None,
+            "profile": env.get("KLVR_PROFILE") or None,
+            "mdns": _flag(env.get("KLVR_MDNS", "1")),
+            "simulate": _flag(env.get("KLVR_SIMULATE", "1")),
+            "history": int(env.get("KLVR_HISTORY", "0")),
+            "history_interval": float(env.get("KLVR_HISTORY_INTERVAL", "10")),
+            "log_level": env.get("KLVR_LOG_LEVEL", "info"),
+            "log_format": env.get("KLVR_LOG_FORMAT", "text"),
+        }
+        values.update(overrides)
+        return cls(**values)
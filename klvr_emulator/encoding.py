@@ -0,0 +1,264 @@
+"""Wire encodings for status payloads.
+
+The default is the firmware's JSON. When orjson is installed it is used
+for that JSON, and its output is checked so the bytes match the stdlib
+encoding exactly. Clients can opt into compact encodings, through `Accept`
+on HTTP and `?format=` or a `klvr.<format>` subprotocol on /api/v2/ws:
+
+  json              application/json                       the firmware format (default)
+  msgpack           application/msgpack                    same structure, MessagePack
+  columnar          application/vnd.klvr.columnar+json     one array per slot field
+  columnar-msgpack  application/vnd.klvr.columnar+msgpack  columnar, MessagePack
+
+The columnar forms replace the `batteries` list of slot objects with one
+object of equal-length arrays, `{"slotState": [...], ...}`, so field names
+are sent once rather than 48 times.
+"""
+import json
+import struct
+from functools import lru_cache
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder gives the same bytes, only slower
+    orjson = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+COLUMNAR_JSON = "application/vnd.klvr.columnar+json"
+COLUMNAR_MSGPACK = "application/vnd.klvr.columnar+msgpack"
+FORMATS = {"json": JSON, "msgpack": MSGPACK, "columnar": COLUMNAR_JSON, "columnar-msgpack": COLUMNAR_MSGPACK}
+FORMAT_NAMES = {media_type: name for name, media_type in FORMATS.items()}
+MEDIA_ALIASES = {"application/x-msgpack": MSGPACK}
+
+# Where orjson and json.dumps disagree: exponents ("1e-7" vs "1e-07", "1e16" vs
+# "1e+16"), small floats in fixed notation ("0.00003" vs "3e-05"), and NaN or
+# infinity written as null instead of refused. Output showing any of these is
+# encoded again with the stdlib, which also covers the rare false positive.
+# Mapping digits to "0" finds a digit followed by "e" faster than a regex.
+_DIGITS = bytes.maketrans(b"123456789E", b"000000000e")
+
+
+def _orjson_differs(body: bytes) -> bool:
+    return b"0e" in body.translate(_DIGITS) or b"0.0000" in body or b"null" in body
+
+
+def _stdlib_json(content) -> bytes:
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def json_bytes(content) -> bytes:
+    """Encode exactly like FastAPI's JSONResponse, so cached bodies are byte-identical."""
+    if orjson is not None:
+        try:
+            body = orjson.dumps(content)
+        except TypeError:  # non-str keys, ints beyond 64 bits: the stdlib decides
+            pass
+        else:
+            if not _orjson_differs(body):
+                return body
+    return _stdlib_json(content)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded by json_bytes: the same bytes, faster."""
+
+    def render(self, content) -> bytes:
+        return json_bytes(content)
+
+
+def ws_text(content) -> str:
+    """Encode a WebSocket event the way ws_broadcast always has (json.dumps defaults)."""
+    return json.dumps(content)
+
+
+_FLOAT = struct.Struct(">Bd").pack
+
+
+@lru_cache(maxsize=1024)  # slot states, battery types and field names repeat
+def _pack_str(value: str) -> bytes:
+    data = value.encode("utf-8")
+    n = len(data)
+    if n < 32:
+        return bytes((0xa0 | n,)) + data
+    if n < 0x100:
+        return struct.pack(">BB", 0xd9, n) + data
+    if n < 0x10000:
+        return struct.pack(">BH", 0xda, n) + data
+    return struct.pack(">BI", 0xdb, n) + data
+
+
+def _pack_items(value, value_type: str, type_byte: int) -> bytes:
+    """Pack a column of floats (">f8") or ints (">i8") in one go as (type byte, big-endian value) records."""
+    import numpy as np  # only here: importing it costs more than most payloads take to pack
+
+    items = np.empty(len(value), [("type", "u1"), ("value", value_type)])
+    items["type"] = type_byte
+    items["value"] = value
+    return items.tobytes()
+
+
+def _pack(out: bytearray, value):
+    if value is None:
+        out.append(0xc0)
+    elif value is True:
+        out.append(0xc3)
+    elif value is False:
+        out.append(0xc2)
+    elif isinstance(value, float):
+        out += _FLOAT(0xcb, value)
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            out.append(value)
+        elif -32 <= value < 0:
+            out.append(value & 0xff)
+        elif 0 <= value < 1 << 64:
+            out += struct.pack(">BQ", 0xcf, value)
+        elif -(1 << 63) <= value < 0:
+            out += struct.pack(">Bq", 0xd3, value)
+        else:
+            raise ValueError(f"Integer out of MessagePack range: {value}")
+    elif isinstance(value, str):
+        out += _pack_str(value)
+    elif isinstance(value, (list, tuple)):
+        n = len(value)
+        if n < 16:
+            out.append(0x90 | n)
+        elif n < 0x10000:
+            out += struct.pack(">BH", 0xdc, n)
+        else:
+            out += struct.pack(">BI", 0xdd, n)
+        types = set(map(type, value)) if n >= 16 else None
+        if types == {str}:
+            out += b"".join(map(_pack_str, value))
+        elif types == {float}:
+            out += _pack_items(value, ">f8", 0xcb)
+        elif types == {int} and 0 <= min(value) and max(value) < 0x80:
+            out += bytes(value)
+        elif types == {int} and -(1 << 63) <= min(value) and max(value) < 1 << 63:
+            out += _pack_items(value, ">i8", 0xd3)
+        else:
+            for item in value:
+                _pack(out, item)
+    elif isinstance(value, dict):
+        n = len(value)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n < 0x10000:
+            out += struct.pack(">BH", 0xde, n)
+        else:
+            out += struct.pack(">BI", 0xdf, n)
+        for key, item in value.items():
+            _pack(out, key)
+            _pack(out, item)
+    elif isinstance(value, (bytes, bytearray)):
+        n = len(value)
+        if n < 0x100:
+            out += struct.pack(">BB", 0xc4, n)
+        elif n < 0x10000:
+            out += struct.pack(">BH", 0xc5, n)
+        else:
+            out += struct.pack(">BI", 0xc6, n)
+        out += value
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+
+def msgpack_bytes(content) -> bytes:
+    """MessagePack for JSON-like values. Floats are always float64, so values round-trip exactly."""
+    out = bytearray()
+    _pack(out, content)
+    return bytes(out)
+
+
+def columnar(status: dict) -> dict:
+    """A status payload with `batteries` turned into one array per slot field."""
+    batteries = status["batteries"]
+    fields = list(batteries[0]) if batteries else []
+    return {**status, "batteries": {field: [b[field] for b in batteries] for field in fields}}
+
+
+def encode_status(status: dict, media_type: str = JSON) -> bytes:
+    """A status payload ({"deviceStatus", "batteries"}) in one of the FORMATS media types."""
+    if media_type in (COLUMNAR_JSON, COLUMNAR_MSGPACK):
+        status = columnar(status)
+    if media_type in (MSGPACK, COLUMNAR_MSGPACK):
+        return msgpack_bytes(status)
+    return json_bytes(status)
+
+
+@lru_cache(maxsize=256)
+def negotiate(accept: str | None) -> str:
+    """Pick the status media type for an Accept header.
+
+    Explicit types beat `application/*`, which beats `*/*`; ties go to JSON.
+    Anything unsupported gets JSON rather than a 406, as on the firmware.
+    """
+    if not accept:
+        return JSON
+    ranges = {}
+    for item in accept.split(","):
+        media, _, params = item.partition(";")
+        media = media.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        media = MEDIA_ALIASES.get(media, media)
+        ranges[media] = max(q, ranges.get(media, 0.0))
+    best, best_q = JSON, 0.0
+    for media_type in FORMATS.values():
+        q = ranges.get(media_type, ranges.get("application/*", ranges.get("*/*", 0.0)))
+        if q > best_q:
+            best, best_q = media_type, q
+    return best
+
+
+class Frame:
+    """One WebSocket event, encoded at most once per format for all clients."""
+
+    __slots__ = ("event", "encoded")
+
+    def __init__(self, event: dict):
+        self.event = event
+        self.encoded: dict[str, str | bytes] = {}
+
+    def encode(self, fmt: str = "json") -> str | bytes:
+        """Text for the JSON formats, bytes for the MessagePack ones."""
+        data = self.encoded.get(fmt)
+        if data is None:
+            event = self.event
+            if fmt == "json":
+                data = ws_text(event)
+            else:
+                if fmt.startswith("columnar") and event.get("event") == "battery_status":
+                    event = {**event, "data": columnar(event["data"])}
+                data = msgpack_bytes(event) if fmt.endswith("msgpack") else json_bytes(event).decode("utf-8")
+            self.encoded[fmt] = data
+        return data
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """RFC 9110 weak comparison of an If-None-Match header against `etag`."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,364 @@
+"""Slot simulation engines.
+
+An engine owns the battery slots of every charger in the fleet; each charger
+is one row of NUM_SLOTS slots. Chargers read slots back as the dicts served
+by /api/v2/charger/status and mutate them only through `update()`, so the
+storage behind them can change:
+
+  dict   one dict per slot, stepped slot by slot (the original behaviour)
+  array  struct-of-arrays in NumPy; one tick updates every slot of every
+         charger in a handful of array operations
+  event  no per-slot ticking: SoC and time remaining are derived on read
+         from when the slot started charging, and charging -> done comes
+         from a heap of completion deadlines
+
+The simulation thread calls `step(dt)` with the simulated seconds elapsed
+since the last call, then sleeps for `next_timeout()` simulated seconds or
+until `wakeup` is set.
+
+Every engine keeps a SlotIndex (klvr_emulator.index) of slotState,
+errorMsg and batteryDetected current through update() and step(), and
+after each step() lists in `finished` the rows where a slot finished
+charging.
+"""
+import heapq
+import threading
+import time
+from klvr_emulator.index import SlotIndex
+
+NUM_SLOTS = 48
+
+# 95% in 2 hours = 0.0264% every 2 seconds
+TICK_SECONDS = 2
+TICK_SOC_PERCENT = 0.0264
+CHARGE_RATE = TICK_SOC_PERCENT / TICK_SECONDS  # % per second
+FULL_CHARGE_SECONDS = 7200
+
+SLOT_STATES = ("empty", "charging", "done", "error", "cold", "warm")
+STATE_CODES = {name: code for code, name in enumerate(SLOT_STATES)}
+EMPTY, CHARGING, DONE, ERROR, COLD, WARM = range(len(SLOT_STATES))
+
+
+def new_battery(index: int) -> dict:
+    return {
+        "index": index,
+        "batteryBayTempC": 24.0,
+        "slotState": "empty",
+        "stateOfChargePercent": 0.0,
+        "timeRemainingSeconds": 0,
+        "errorMsg": "",
+        "batteryDetected": ""
+    }
+
+
+EMPTY_SLOT = {k: v for k, v in new_battery(0).items() if k != "index"}
+
+
+class DictEngine:
+    name = "dict"
+
+    def __init__(self, clock=None):
+        self.rows: list[list[dict]] = []
+        self.wakeup = threading.Event()
+        self.carry = 0.0  # fractional seconds not yet taken off timeRemainingSeconds
+        self.index = SlotIndex()
+        self.finished: list[int] = []
+
+    def add_row(self, batteries: list[dict] | None = None) -> int:
+        self.rows.append(batteries if batteries is not None else [new_battery(i) for i in range(NUM_SLOTS)])
+        row = len(self.rows) - 1
+        self.index.load_row(row, self.rows[row])
+        return row
+
+    def batteries(self, row: int) -> list[dict]:
+        """The live slot dicts; callers must not mutate them."""
+        return self.rows[row]
+
+    def battery(self, row: int, slot: int) -> dict:
+        return self.rows[row][slot]
+
+    def update(self, row: int, slot: int, fields: dict):
+        b = self.rows[row][slot]
+        b.update(fields)
+        self.index.set(row, slot, b["slotState"], b["errorMsg"], b["batteryDetected"])
+
+    def step(self, dt: float = TICK_SECONDS) -> list[int]:
+        """Advance charging by `dt` seconds; return the rows that changed."""
+        soc_step = CHARGE_RATE * dt
+        # timeRemainingSeconds stays an int; carry the fraction to the next step
+        self.carry += dt
+        whole = int(self.carry)
+        self.carry -= whole
+        changed = []
+        finished = []
+        for row, batteries in enumerate(self.rows):
+            row_changed = False
+            for slot, b in enumerate(batteries):
+                if b["slotState"] == "charging":
+                    b["stateOfChargePercent"] = min(100.0, b["stateOfChargePercent"] + soc_step)
+                    b["timeRemainingSeconds"] = max(0, b["timeRemainingSeconds"] - whole)
+                    if b["stateOfChargePercent"] >= 100.0:
+                        b["slotState"] = "done"
+                        b["timeRemainingSeconds"] = 0
+                        self.index.set_state(row, slot, "done")
+                        if not finished or finished[-1] != row:
+                            finished.append(row)
+                    row_changed = True
+            if row_changed:
+                changed.append(row)
+        self.finished = finished
+        return changed
+
+    def next_timeout(self, timeout: float) -> float | None:
+        return timeout
+
+
+class ArrayEngine:
+    """Struct-of-arrays slot storage, shape (chargers, NUM_SLOTS).
+
+    slotState, errorMsg and batteryDetected are enum-coded uint8; the string
+    tables grow on demand since `insert` accepts any battery type.
+    """
+    name = "array"
+
+    def __init__(self, clock=None, capacity: int = 16):
+        import numpy as np
+        self.np = np
+        self.wakeup = threading.Event()
+        self.count = 0
+        self.state = np.zeros((capacity, NUM_SLOTS), dtype=np.uint8)
+        self.soc = np.zeros((capacity, NUM_SLOTS), dtype=np.float64)
+        self.remaining = np.zeros((capacity, NUM_SLOTS), dtype=np.float64)
+        self.temp = np.full((capacity, NUM_SLOTS), 24.0, dtype=np.float64)
+        self.error = np.zeros((capacity, NUM_SLOTS), dtype=np.uint8)
+        self.detected = np.zeros((capacity, NUM_SLOTS), dtype=np.uint8)
+        self.error_names = [""]
+        self.detected_names = [""]
+        self.index = SlotIndex()
+        self.finished: list[int] = []
+
+    def _grow(self):
+        np = self.np
+        capacity = len(self.state) * 2
+        for attr, fill in (("state", 0), ("soc", 0.0), ("remaining", 0.0), ("temp", 24.0),
+                           ("error", 0), ("detected", 0)):
+            old = getattr(self, attr)
+            new = np.full((capacity, NUM_SLOTS), fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, attr, new)
+
+    @staticmethod
+    def _code(names: list[str], value: str) -> int:
+        try:
+            return names.index(value)
+        except ValueError:
+            if len(names) >= 256:
+                raise ValueError(f"Too many distinct values (max 256): {value!r}")
+            names.append(value)
+            return len(names) - 1
+
+    def add_row(self, batteries: list[dict] | None = None) -> int:
+        if self.count == len(self.state):
+            self._grow()
+        row = self.count
+        self.count += 1
+        self.index.load_row(row, self.batteries(row))
+        for b in batteries or ():
+            self.update(row, b["index"], b)
+        return row
+
+    def battery(self, row: int, slot: int) -> dict:
+        return {
+            "index": slot,
+            "batteryBayTempC": float(self.temp[row, slot]),
+            "slotState": SLOT_STATES[self.state[row, slot]],
+            "stateOfChargePercent": float(self.soc[row, slot]),
+            "timeRemainingSeconds": int(self.remaining[row, slot]),
+            "errorMsg": self.error_names[self.error[row, slot]],
+            "batteryDetected": self.detected_names[self.detected[row, slot]]
+        }
+
+    def batteries(self, row: int) -> list[dict]:
+        """Build the dict view of one charger from the arrays."""
+        temp = self.temp[row].tolist()
+        state = self.state[row].tolist()
+        soc = self.soc[row].tolist()
+        remaining = self.remaining[row].astype(int).tolist()
+        error = self.error[row].tolist()
+        detected = self.detected[row].tolist()
+        return [
+            {
+                "index": i,
+                "batteryBayTempC": temp[i],
+                "slotState": SLOT_STATES[state[i]],
+                "stateOfChargePercent": soc[i],
+                "timeRemainingSeconds": remaining[i],
+                "errorMsg": self.error_names[error[i]],
+                "batteryDetected": self.detected_names[detected[i]]
+            } for i in range(NUM_SLOTS)
+        ]
+
+    def update(self, row: int, slot: int, fields: dict):
+        for key, value in fields.items():
+            if key == "slotState":
+                self.state[row, slot] = STATE_CODES[value]
+            elif key == "stateOfChargePercent":
+                self.soc[row, slot] = value
+            elif key == "timeRemainingSeconds":
+                self.remaining[row, slot] = value
+            elif key == "batteryBayTempC":
+                self.temp[row, slot] = value
+            elif key == "errorMsg":
+                self.error[row, slot] = self._code(self.error_names, value)
+            elif key == "batteryDetected":
+                self.detected[row, slot] = self._code(self.detected_names, value)
+        self.index.set(row, slot, SLOT_STATES[self.state[row, slot]], self.error_names[self.error[row, slot]],
+                       self.detected_names[self.detected[row, slot]])
+
+    def step(self, dt: float = TICK_SECONDS) -> list[int]:
+        """Advance every charging slot of every charger at once."""
+        np = self.np
+        n = self.count
+        charging = self.state[:n] == CHARGING
+        rows = np.flatnonzero(charging.any(axis=1))
+        if not len(rows):
+            self.finished = []
+            return []
+        soc = self.soc[:n]
+        remaining = self.remaining[:n]
+        np.add(soc, CHARGE_RATE * dt, out=soc, where=charging)
+        np.minimum(soc, 100.0, out=soc, where=charging)
+        np.subtract(remaining, dt, out=remaining, where=charging)
+        np.maximum(remaining, 0, out=remaining, where=charging)
+        finished = charging & (soc >= 100.0)
+        self.state[:n][finished] = DONE
+        remaining[finished] = 0
+        for row, slot in np.argwhere(finished).tolist():
+            self.index.set_state(row, slot, "done")
+        self.finished = np.flatnonzero(finished.any(axis=1)).tolist()
+        return rows.tolist()
+
+    def next_timeout(self, timeout: float) -> float | None:
+        return timeout
+
+
+class EventEngine:
+    """Charge progress computed on read instead of stepped every tick.
+
+    A charging slot stores the SoC and time remaining it had at `since`;
+    reads extrapolate at CHARGE_RATE. Each (re)scheduled slot pushes its
+    completion deadline onto a heap, tagged with a per-slot generation so
+    deadlines superseded by a later update are skipped when popped.
+    """
+    name = "event"
+
+    def __init__(self, clock=None):
+        self.now = clock.now if clock is not None else time.monotonic
+        self.rows: list[list[dict]] = []
+        self.since: list[list[float]] = []
+        self.generation: list[list[int]] = []
+        self.charging: dict[int, int] = {}  # row -> number of charging slots
+        self.active = 0  # total charging slots
+        self.deadlines: list[tuple[float, int, int, int]] = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.index = SlotIndex()
+        self.finished: list[int] = []
+
+    def add_row(self, batteries: list[dict] | None = None) -> int:
+        with self.lock:
+            row = len(self.rows)
+            self.rows.append([new_battery(i) for i in range(NUM_SLOTS)])
+            self.since.append([0.0] * NUM_SLOTS)
+            self.generation.append([0] * NUM_SLOTS)
+            self.index.load_row(row, self.rows[row])
+        for b in batteries or ():
+            self.update(row, b["index"], b)
+        return row
+
+    def _view(self, b: dict, since: float, now: float) -> dict:
+        if b["slotState"] != "charging":
+            return dict(b)
+        elapsed = now - since
+        if elapsed * CHARGE_RATE >= 100.0 - b["stateOfChargePercent"]:
+            # Past the deadline but not popped yet — report what step() will set
+            return {**b, "slotState": "done", "stateOfChargePercent": 100.0, "timeRemainingSeconds": 0}
+        return {
+            **b,
+            "stateOfChargePercent": b["stateOfChargePercent"] + elapsed * CHARGE_RATE,
+            "timeRemainingSeconds": max(0, int(b["timeRemainingSeconds"] - elapsed))
+        }
+
+    def battery(self, row: int, slot: int) -> dict:
+        return self._view(self.rows[row][slot], self.since[row][slot], self.now())
+
+    def batteries(self, row: int) -> list[dict]:
+        now = self.now()
+        since = self.since[row]
+        return [self._view(b, since[i], now) for i, b in enumerate(self.rows[row])]
+
+    def update(self, row: int, slot: int, fields: dict):
+        with self.lock:
+            now = self.now()
+            b = self.rows[row][slot]
+            was_charging = b["slotState"] == "charging"
+            if was_charging:
+                b.update(self._view(b, self.since[row][slot], now))
+            b.update((k, v) for k, v in fields.items() if k != "index")
+            self.index.set(row, slot, b["slotState"], b["errorMsg"], b["batteryDetected"])
+            is_charging = b["slotState"] == "charging"
+            if was_charging != is_charging:
+                delta = 1 if is_charging else -1
+                self.charging[row] = self.charging.get(row, 0) + delta
+                self.active += delta
+            self.generation[row][slot] += 1
+            if is_charging:
+                self.since[row][slot] = now
+                entry = (now + max(0.0, 100.0 - b["stateOfChargePercent"]) / CHARGE_RATE,
+                         row, slot, self.generation[row][slot])
+                heapq.heappush(self.deadlines, entry)
+                if self.deadlines[0] is entry:
+                    self.wakeup.set()
+            if len(self.deadlines) > 2 * self.active + 64:
+                self.deadlines = [d for d in self.deadlines if d[3] == self.generation[d[1]][d[2]]]
+                heapq.heapify(self.deadlines)
+
+    def step(self, dt: float = TICK_SECONDS) -> list[int]:
+        """Fire due completions; return them plus every row still charging.
+
+        `dt` is ignored — progress is a function of time, not of ticks.
+        """
+        with self.lock:
+            now = self.now()
+            changed = {row for row, count in self.charging.items() if count}
+            finished = set()
+            while self.deadlines and self.deadlines[0][0] <= now:
+                _, row, slot, generation = heapq.heappop(self.deadlines)
+                if generation != self.generation[row][slot]:
+                    continue
+                self.rows[row][slot].update(slotState="done", stateOfChargePercent=100.0, timeRemainingSeconds=0)
+                self.index.set_state(row, slot, "done")
+                self.generation[row][slot] += 1
+                self.charging[row] -= 1
+                self.active -= 1
+                changed.add(row)
+                finished.add(row)
+            self.finished = sorted(finished)
+            return sorted(changed)
+
+    def next_timeout(self, timeout: float) -> float | None:
+        """Until the next tick or deadline; None (wait for wakeup) while nothing charges."""
+        with self.lock:
+            if not self.active:
+                return None
+            return min(timeout, max(0.0, self.deadlines[0][0] - self.now()))
+
+
+ENGINES = {"dict": DictEngine, "array": ArrayEngine, "event": EventEngine}
+
+
+def make_engine(name: str, clock=None):
+    try:
+        return ENGINES[name](clock)
+    except KeyError:
+        raise ValueError(f"Invalid engine. Must be one of: {', '.join(ENGINES)}") from None
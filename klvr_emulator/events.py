@@ -0,0 +1,138 @@
+"""The emulator's event log, in place of print() on request paths.
+
+Each event is a dict: seq, time, level, event name, message, the charger it
+concerns and any extra fields. emit() only appends it to an in-memory ring
+(served by GET /api/v2/emulator/events) and hands it to a bounded queue;
+a writer thread formats and writes it to stdout. A slow or blocked stdout
+therefore stalls only the writer: when its queue is full, events are
+dropped from the output (they stay in the ring) and counted, never waited
+for. Events below the log level are discarded before anything is built,
+and callers guard expensive fields with `enabled()`:
+
+    if events.enabled(DEBUG):
+        events.debug("firmware.request", "...", headers=dict(request.headers))
+
+Output is the message line by default, one JSON object per line, or none
+at all (the ring only, without a writer thread; see klvr_emulator.testing).
+"""
+import itertools
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+LOG_FORMATS = ("text", "json", "none")
+EVENT_BUFFER = 1000  # events kept for the debug endpoint
+EVENT_QUEUE = 10000  # events waiting for the writer before output drops them
+
+
+def parse_level(level: str | int) -> int:
+    if level in LEVEL_NAMES:
+        return level
+    try:
+        return LEVELS[level.strip().lower()]
+    except (KeyError, AttributeError):
+        raise ValueError(f"Invalid log level. Must be one of: {', '.join(LEVELS)}") from None
+
+
+class EventLog:
+    def __init__(self, level: str | int = "info", fmt: str = "text", capacity: int = EVENT_BUFFER,
+                 queue_size: int = EVENT_QUEUE, stream=None):
+        if fmt not in LOG_FORMATS:
+            raise ValueError(f"Invalid log format. Must be one of: {', '.join(LOG_FORMATS)}")
+        self.level = parse_level(level)
+        self.format = fmt
+        self.stream = stream
+        self.buffer: deque[dict] = deque(maxlen=capacity)
+        self.queue: queue.Queue = queue.Queue(queue_size)
+        self._seq = itertools.count(1)
+        self._thread: threading.Thread | None = None
+        self.stats = {"emitted": 0, "written": 0, "dropped": 0}
+
+    def enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def set_level(self, level: str | int):
+        self.level = parse_level(level)
+
+    def emit(self, level: int, event: str, message: str, charger=None, **fields):
+        """Record an event; returns at once whatever the writer is doing."""
+        if level < self.level:
+            return
+        record = {"seq": next(self._seq), "time": time.time(), "level": LEVEL_NAMES[level],
+                  "event": event, "message": message}
+        if charger is not None:
+            record["charger"] = charger.id
+        if fields:
+            record.update(fields)
+        self.buffer.append(record)
+        self.stats["emitted"] += 1
+        if self.format == "none":
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def debug(self, event: str, message: str, charger=None, **fields):
+        self.emit(DEBUG, event, message, charger, **fields)
+
+    def info(self, event: str, message: str, charger=None, **fields):
+        self.emit(INFO, event, message, charger, **fields)
+
+    def warning(self, event: str, message: str, charger=None, **fields):
+        self.emit(WARNING, event, message, charger, **fields)
+
+    def error(self, event: str, message: str, charger=None, **fields):
+        self.emit(ERROR, event, message, charger, **fields)
+
+    def recent(self, level: str | int | None = None, since: int | None = None, charger: str | None = None,
+               event: str | None = None, limit: int | None = None) -> list[dict]:
+        """Buffered events, oldest first: at least `level`, after seq `since`, the newest `limit`."""
+        minimum = parse_level(level) if level is not None else None
+        found = [r for r in list(self.buffer)
+                 if (minimum is None or LEVELS.get(r["level"], 0) >= minimum)
+                 and (since is None or r["seq"] > since)
+                 and (charger is None or r.get("charger") == charger)
+                 and (event is None or r["event"] == event or r["event"].startswith(event + "."))]
+        return found[-limit:] if limit else found
+
+    def _format(self, record: dict) -> str:
+        if self.format == "json":
+            return json.dumps(record, default=str)
+        return record["message"]
+
+    def _write(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            try:
+                stream = self.stream if self.stream is not None else sys.stdout
+                stream.write(self._format(record) + "\n")
+                if self.queue.empty():
+                    stream.flush()
+                self.stats["written"] += 1
+            except Exception:  # a broken stdout must not kill the writer
+                self.stats["dropped"] += 1
+
+    def start(self):
+        if self._thread is None and self.format != "none":
+            self._thread = threading.Thread(target=self._write, daemon=True, name="event-writer")
+            self._thread.start()
+
+    def close(self, timeout: float = 2.0):
+        """Write out what is queued (for up to `timeout` seconds) and stop the writer."""
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
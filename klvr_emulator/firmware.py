@@ -0,0 +1,96 @@
+"""Streaming firmware upload handling.
+
+Images are consumed chunk by chunk from the request stream: size and
+SHA-256 are computed on the fly and the bytes are either discarded or
+spilled to a temp file, so memory stays flat whatever the image size or
+the number of concurrent uploads. Spilled bytes are collected into
+SPILL_CHUNK-sized blocks and written from a worker thread, so disk I/O
+never blocks the event loop. Transfer and flash time are modelled on the
+simulated clock from throughputs set per app (Config.firmware_throughput,
+Config.flash_throughput; spilling: Config.firmware_spill_dir).
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from fastapi import Request
+
+FIRMWARE_FLASH_SECONDS = 2.0  # fixed apply delay the emulator has always used
+SPILL_CHUNK = 1 << 20  # bytes buffered per write to the spill file
+
+
+@dataclass
+class FirmwareImage:
+    size: int
+    sha256: str
+    path: str | None = None
+
+
+async def receive_firmware(request: Request, clock, throughput: float = 0,
+                           spill_dir: str | None = None) -> FirmwareImage:
+    """Consume the request body, pacing reads to `throughput` bytes per simulated second (0: unpaced).
+
+    With a `spill_dir` the image is kept there; otherwise it is hashed and discarded.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    spill = None
+    pending = bytearray()  # spill bytes not yet written
+    if spill_dir:
+        spill = await asyncio.to_thread(tempfile.NamedTemporaryFile, dir=spill_dir, prefix="klvr-fw-",
+                                        suffix=".bin", delete=False)
+    start = clock.now()
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            digest.update(chunk)
+            if spill is not None:
+                pending += chunk
+                if len(pending) >= SPILL_CHUNK:
+                    block, pending = bytes(pending), bytearray()
+                    await asyncio.to_thread(spill.write, block)
+            if throughput > 0:
+                ahead = size / throughput - (clock.now() - start)
+                if ahead > 0:
+                    await clock.sleep(ahead)
+        if spill is not None:
+            await asyncio.to_thread(_finish_spill, spill, bytes(pending))
+    except BaseException:
+        if spill is not None:
+            await asyncio.shield(asyncio.to_thread(_discard_spill, spill))
+        raise
+    return FirmwareImage(size, digest.hexdigest(), spill.name if spill is not None else None)
+
+
+def _finish_spill(spill, tail: bytes):
+    spill.write(tail)
+    spill.close()
+
+
+def _discard_spill(spill):
+    spill.close()
+    try:
+        os.unlink(spill.name)
+    except OSError:
+        pass
+
+
+def flash_seconds(size: int, throughput: float = 0) -> float:
+    """Simulated time to write an image of `size` bytes to flash at `throughput` bytes/s (0: fixed delay only)."""
+    if throughput > 0:
+        return FIRMWARE_FLASH_SECONDS + size / throughput
+    return FIRMWARE_FLASH_SECONDS
+
+
+def store_image(firmware_state: dict, board: str, image: FirmwareImage):
+    """Record a received image for `board`, removing the previous spilled file."""
+    previous = firmware_state.get(f"{board}_firmware_path")
+    if previous and previous != image.path:
+        try:
+            os.unlink(previous)
+        except OSError:
+            pass
+    firmware_state[f"{board}_firmware_size"] = image.size
+    firmware_state[f"{board}_firmware_sha256"] = image.sha256
+    firmware_state[f"{board}_firmware_path"] = image.path
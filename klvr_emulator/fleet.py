@@ -0,0 +1,87 @@
+"""Fleet mode: serve many emulated chargers from one process and one event loop.
+
+Chargers are reachable either on their own TCP port ("ports" mode, one
+listening socket per charger on a single uvicorn server) or under
+/chargers/{id} on a shared port ("prefix" mode). Each charger gets its own
+Bonjour record, registered with the rest at startup; charger "0" is the
+app's default charger.
+"""
+import resource
+import socket
+import uvicorn
+
+FLEET_MODES = ("ports", "prefix")
+
+
+def bind_ports(count: int, start_port: int = 8000, host: str = "0.0.0.0") -> list[socket.socket]:
+    """Bind `count` listening sockets on the first free ports from `start_port`."""
+    socks = []
+    port = start_port
+    while len(socks) < count:
+        if port > 65535:
+            for s in socks:
+                s.close()
+            raise RuntimeError(f"❌ Only {len(socks)} of {count} ports available from {start_port}")
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.bind((host, port))
+            socks.append(s)
+        except OSError:
+            s.close()
+        port += 1
+    return socks
+
+
+def raise_fd_limit():
+    """Each charger port plus its connections needs a descriptor; lift the soft cap."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def add_chargers(emulator, count: int, mode: str, ports: list[int]):
+    """Grow the emulator's fleet to `count` chargers, numbered on from its default charger.
+
+    "ports" mode gives charger i ports[i]; "prefix" mode serves them all on
+    ports[0] under /chargers/<id>.
+    """
+    fleet = emulator.fleet
+    host_ip = emulator.host_ip
+    first = int(emulator.default_charger.id)
+    emulator.port = ports[0]
+
+    if mode == "ports":
+        fleet.assign_port(emulator.default_charger, ports[0])
+        for i, port in enumerate(ports[1:count], start=first + 1):
+            fleet.new_charger(str(i), host_ip, port=port)
+        return
+
+    for i in range(first + 1, first + count):
+        # 0x100000+ keeps prefix-mode MACs clear of the port-derived ones
+        fleet.new_charger(str(i), host_ip, prefix=f"/chargers/{i}", mac_suffix=0x100000 + i)
+
+
+def build_fleet(emulator, count: int, mode: str = "ports", base_port: int = 8000,
+                host: str = "0.0.0.0") -> list[socket.socket]:
+    """Add chargers 1..count-1 to the emulator's fleet and return the sockets to serve."""
+    if mode not in FLEET_MODES:
+        raise ValueError(f"Invalid fleet mode. Must be one of: {', '.join(FLEET_MODES)}")
+    socks = bind_ports(count if mode == "ports" else 1, base_port, host)
+    add_chargers(emulator, count, mode, [s.getsockname()[1] for s in socks])
+    return socks
+
+
+def run_fleet(app, count: int, mode: str = "ports", base_port: int = 8000, host: str = "0.0.0.0"):
+    raise_fd_limit()
+    socks = build_fleet(app.state.emulator, count, mode, base_port, host)
+    if mode == "ports":
+        first, last = socks[0].getsockname()[1], socks[-1].getsockname()[1]
+        print(f"✅ Fleet of {count} chargers on ports {first}–{last}")
+    else:
+        port = socks[0].getsockname()[1]
+        print(f"✅ Fleet of {count} chargers on port {port} under /chargers/<0–{count - 1}>")
+    try:
+        uvicorn.Server(uvicorn.Config(app, log_level="warning")).run(sockets=socks)
+    except KeyboardInterrupt:
+        pass  # re-raised by uvicorn after its graceful shutdown
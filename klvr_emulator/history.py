@@ -0,0 +1,221 @@
+"""Per-slot history of SoC, bay temperature and slot state.
+
+Every charger gets a ring of `capacity` samples, each holding all of its
+slots, in arrays laid out like the array engine's:
+
+  times  float64  (rows, capacity)             simulated seconds
+  soc    float32  (rows, capacity, NUM_SLOTS)
+  temp   float32  (rows, capacity, NUM_SLOTS)
+  state  uint8    (rows, capacity, NUM_SLOTS)  index into SLOT_STATES
+
+so memory is capacity × 440 bytes per charger (rows double as the fleet
+grows) and never depends on how long the emulator runs. The simulation
+tick samples the chargers it changed, at most once per `interval`
+simulated seconds; slot mutations sample their charger at once, replacing
+the last sample if it is less than MIN_GAP_SECONDS old. Between samples a
+slot is taken to be unchanged.
+
+`query()` downsamples a time window to a fixed number of points: the mean
+SoC and temperature of each bucket, the slot state at its end, and the
+last known values carried through buckets without samples.
+
+NumPy is slow to import, so the arrays are only allocated on the first
+slot change or query. Until then a charger's first sample (taken when it
+joins the fleet) is kept as plain lists.
+"""
+import threading
+from klvr_emulator.engine import NUM_SLOTS, SLOT_STATES, STATE_CODES
+
+HISTORY_SAMPLES = 720       # a sensible KLVR_HISTORY; history is off by default
+HISTORY_SECONDS = 10.0      # KLVR_HISTORY_INTERVAL; 720 × 10 s covers a 2-hour charge
+MIN_GAP_SECONDS = 1.0
+
+
+def read_slots(engine, rows: list[int]):
+    """(soc, temp, state code) arrays of every slot of `rows`, each shaped (len(rows), NUM_SLOTS)."""
+    import numpy as np
+
+    if engine.name == "array":
+        return engine.soc[rows], engine.temp[rows], engine.state[rows]
+    batteries = [b for row in rows for b in engine.batteries(row)]
+    shape = (len(rows), NUM_SLOTS)
+    soc = np.array([b["stateOfChargePercent"] for b in batteries], dtype=np.float32).reshape(shape)
+    temp = np.array([b["batteryBayTempC"] for b in batteries], dtype=np.float32).reshape(shape)
+    state = np.array([STATE_CODES[b["slotState"]] for b in batteries], dtype=np.uint8).reshape(shape)
+    return soc, temp, state
+
+
+class History:
+    def __init__(self, capacity: int = HISTORY_SAMPLES, interval: float = HISTORY_SECONDS, rows: int = 1):
+        if capacity < 1:
+            raise ValueError("History needs at least one sample per charger")
+        self.capacity = capacity
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.rows = rows
+        self.np = None  # numpy, once the arrays exist
+        self.times = self.soc = self.temp = self.state = self.head = self.size = None
+        self._first: dict[int, tuple] = {}  # row -> (time, soc, temp, state) taken before the arrays exist
+
+    @property
+    def nbytes(self) -> int:
+        if self.times is None:
+            return 0
+        return sum(a.nbytes for a in (self.times, self.soc, self.temp, self.state, self.head, self.size))
+
+    def _allocate(self):
+        """Create the arrays (importing numpy) and move the samples taken so far into them."""
+        if self.times is not None:
+            return
+        import numpy as np
+
+        self.np = np
+        rows, capacity = max(self.rows, max(self._first, default=0) + 1), self.capacity
+        self.times = np.zeros((rows, capacity), dtype=np.float64)
+        self.soc = np.zeros((rows, capacity, NUM_SLOTS), dtype=np.float32)
+        self.temp = np.zeros((rows, capacity, NUM_SLOTS), dtype=np.float32)
+        self.state = np.zeros((rows, capacity, NUM_SLOTS), dtype=np.uint8)
+        self.head = np.zeros(rows, dtype=np.int64)  # where each row writes next
+        self.size = np.zeros(rows, dtype=np.int64)  # samples held per row
+        for row, (now, soc, temp, state) in self._first.items():
+            self.times[row, 0] = now
+            self.soc[row, 0] = soc
+            self.temp[row, 0] = temp
+            self.state[row, 0] = state
+            self.head[row] = self.size[row] = 1
+        self._first.clear()
+
+    def add(self, engine, row: int, now: float):
+        """Take the first sample of a charger joining the fleet."""
+        with self.lock:
+            if self.times is None and engine.name != "array":
+                batteries = engine.batteries(row)
+                self._first[row] = (now, [b["stateOfChargePercent"] for b in batteries],
+                                    [b["batteryBayTempC"] for b in batteries],
+                                    [STATE_CODES[b["slotState"]] for b in batteries])
+                return
+        self.record(engine, [row], now)
+
+    def _fit(self, row: int):
+        rows = len(self.times)
+        if row < rows:
+            return
+        np = self.np
+        while rows <= row:
+            rows *= 2
+        for attr in ("times", "soc", "temp", "state", "head", "size"):
+            old = getattr(self, attr)
+            new = np.zeros((rows,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, attr, new)
+
+    def _last_time(self, rows):
+        """Time of each row's newest sample; -inf for rows without one."""
+        np = self.np
+        last = self.times[rows, (self.head[rows] - 1) % self.capacity]
+        return np.where(self.size[rows] > 0, last, -np.inf)
+
+    def tick(self, engine, rows: list[int], finished: list[int], now: float):
+        """Sample the rows a simulation step changed that are due, and every row where a slot finished."""
+        if not rows:
+            return
+        with self.lock:
+            self._allocate()
+            np = self.np
+            self._fit(max(rows))
+            rows = np.asarray(rows, dtype=np.int64)
+            due = self._last_time(rows) <= now - self.interval
+            if finished:
+                due |= np.isin(rows, finished)
+            self._store(engine, rows[due], now, replace=np.zeros(int(due.sum()), dtype=bool))
+
+    def record(self, engine, rows: list[int], now: float):
+        """Sample `rows` after a slot mutation."""
+        with self.lock:
+            self._allocate()
+            self._fit(max(rows))
+            rows = self.np.asarray(rows, dtype=self.np.int64)
+            self._store(engine, rows, now, replace=self._last_time(rows) > now - MIN_GAP_SECONDS)
+
+    def _store(self, engine, rows, now: float, replace):
+        if not len(rows):
+            return
+        np = self.np
+        soc, temp, state = read_slots(engine, rows.tolist())
+        # A replaced sample keeps the newest position; the others take the next one
+        head = self.head[rows]
+        positions = np.where(replace, head - 1, head) % self.capacity
+        self.times[rows, positions] = now
+        self.soc[rows, positions] = soc
+        self.temp[rows, positions] = temp
+        self.state[rows, positions] = state
+        appended = rows[~replace]
+        self.head[appended] = (self.head[appended] + 1) % self.capacity
+        self.size[appended] = np.minimum(self.size[appended] + 1, self.capacity)
+
+    def samples(self, row: int) -> tuple:
+        """Copies of one row's (times, soc, temp, state) arrays, oldest first."""
+        with self.lock:
+            self._allocate()
+            self._fit(row)
+            size = int(self.size[row])
+            order = (int(self.head[row]) - size + self.np.arange(size)) % self.capacity
+            return self.times[row, order], self.soc[row, order], self.temp[row, order], self.state[row, order]
+
+    def query(self, row: int, now: float, points: int, seconds: float | None = None,
+              slots: list[int] | None = None) -> dict:
+        """One charger's slots from `now - seconds` (default: its oldest sample) to `now`,
+        downsampled to `points` buckets of equal length."""
+        times, soc, temp, state = self.samples(row)
+        np = self.np
+        slots = list(range(NUM_SLOTS)) if slots is None else slots
+        if seconds is not None:
+            start = now - seconds
+        else:
+            start = float(times[0]) if len(times) else now
+        width = max(now - start, 0.0) / points
+        first = int(np.searchsorted(times, start, side="right"))  # first sample inside the window
+        # bucket -> index of the last sample at or before its end (-1: none yet);
+        # the sample before the window is the value in force when it opens
+        last = np.full(points, -1, dtype=np.int64)
+        last[0] = first - 1
+        soc_out = np.zeros((points, NUM_SLOTS))
+        temp_out = np.zeros((points, NUM_SLOTS))
+        own = np.zeros(points, dtype=bool)
+        n = len(times) - first
+        if n:
+            if width > 0:
+                buckets = np.clip(((times[first:] - start) / width).astype(np.int64), 0, points - 1)
+            else:
+                buckets = np.full(n, points - 1, dtype=np.int64)
+            starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            counts = np.diff(np.r_[starts, n])[:, None]
+            index = buckets[starts]
+            soc_out[index] = np.add.reduceat(soc[first:], starts, axis=0) / counts
+            temp_out[index] = np.add.reduceat(temp[first:], starts, axis=0) / counts
+            last[index] = first + starts + counts[:, 0] - 1
+            own[index] = True
+        last = np.maximum.accumulate(last)
+        known = (last >= 0).tolist()
+        if len(times):
+            # Buckets without samples of their own carry the last known values
+            carried = np.maximum(last, 0)
+            soc_out[~own] = soc[carried[~own]]
+            temp_out[~own] = temp[carried[~own]]
+            states = state[carried]
+        else:
+            states = np.zeros((points, NUM_SLOTS), dtype=np.uint8)
+        soc_out = np.round(soc_out, 3)
+        temp_out = np.round(temp_out, 2)
+        return {
+            "from": round(start, 3),
+            "to": round(now, 3),
+            "points": points,
+            "time": [round(start + width * (k + 1), 3) for k in range(points)],
+            "slots": [{
+                "index": slot,
+                "stateOfChargePercent": [v if k else None for v, k in zip(soc_out[:, slot].tolist(), known)],
+                "batteryBayTempC": [v if k else None for v, k in zip(temp_out[:, slot].tolist(), known)],
+                "slotState": [SLOT_STATES[v] if k else None for v, k in zip(states[:, slot].tolist(), known)],
+            } for slot in slots],
+        }
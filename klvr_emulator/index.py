@@ -0,0 +1,110 @@
+"""Secondary indexes over slot state, kept by the engines.
+
+For each indexed field (slotState, errorMsg, batteryDetected) the index
+maps value -> engine row -> set of slots, and remembers the current values
+of every slot to move it when they change. Engines update it on every
+write and on the charging -> done transition in step(), so a query costs
+the size of its smallest matching set, not a scan of every slot:
+
+    index.find(slotState="error", errorMsg="overtemp")          # fleet-wide
+    index.find(slotState="done", rows=[charger.row])             # one charger
+
+Request handlers write slots while the simulation thread steps, so the
+index takes its own lock for every change and lookup.
+"""
+import threading
+
+INDEXED_FIELDS = ("slotState", "errorMsg", "batteryDetected")
+
+
+class SlotIndex:
+    def __init__(self):
+        self.by: dict[str, dict[str, dict[int, set[int]]]] = {field: {} for field in INDEXED_FIELDS}
+        self.counts: dict[str, dict[str, int]] = {field: {} for field in INDEXED_FIELDS}
+        self.values: dict[int, list[tuple]] = {}  # row -> per slot (slotState, errorMsg, batteryDetected)
+        self.lock = threading.Lock()
+
+    def _add(self, field: str, value: str, row: int, slot: int):
+        self.by[field].setdefault(value, {}).setdefault(row, set()).add(slot)
+        counts = self.counts[field]
+        counts[value] = counts.get(value, 0) + 1
+
+    def _remove(self, field: str, value: str, row: int, slot: int):
+        rows = self.by[field][value]
+        slots = rows[row]
+        slots.discard(slot)
+        if not slots:
+            del rows[row]
+        counts = self.counts[field]
+        counts[value] -= 1
+        if not counts[value]:
+            del counts[value]
+            del self.by[field][value]
+
+    def load_row(self, row: int, batteries: list[dict]):
+        """(Re)index every slot of `row` from its battery dicts."""
+        new = [tuple(b[field] for field in INDEXED_FIELDS) for b in batteries]
+        with self.lock:
+            for slot, values in enumerate(self.values.get(row, ())):
+                for field, value in zip(INDEXED_FIELDS, values):
+                    self._remove(field, value, row, slot)
+            self.values[row] = new
+            for slot, values in enumerate(new):
+                for field, value in zip(INDEXED_FIELDS, values):
+                    self._add(field, value, row, slot)
+
+    def _set(self, row: int, slot: int, new: tuple):
+        old = self.values[row][slot]
+        if old == new:
+            return
+        for field, before, after in zip(INDEXED_FIELDS, old, new):
+            if before != after:
+                self._remove(field, before, row, slot)
+                self._add(field, after, row, slot)
+        self.values[row][slot] = new
+
+    def set(self, row: int, slot: int, slot_state: str, error_msg: str, battery_detected: str):
+        """Move a slot to its new indexed values."""
+        with self.lock:
+            self._set(row, slot, (slot_state, error_msg, battery_detected))
+
+    def set_state(self, row: int, slot: int, slot_state: str):
+        with self.lock:
+            _, error_msg, battery_detected = self.values[row][slot]
+            self._set(row, slot, (slot_state, error_msg, battery_detected))
+
+    def slot_states(self, row: int) -> list[str]:
+        with self.lock:
+            return [values[0] for values in self.values[row]]
+
+    def count(self, field: str, value: str) -> int:
+        return self.counts[field].get(value, 0)
+
+    def find(self, rows=None, **filters) -> list[tuple[int, int]]:
+        """(row, slot) of every slot matching each `field=value` filter.
+
+        Without filters, every slot that is not empty. `rows` restricts the
+        result to those engine rows.
+        """
+        filters = {f: v for f, v in filters.items() if v is not None}
+        unknown = set(filters) - set(INDEXED_FIELDS)
+        if unknown:
+            raise ValueError(f"Not indexed: {', '.join(sorted(unknown))}")
+        positions = [(INDEXED_FIELDS.index(f), v) for f, v in filters.items()]
+        found = []
+        with self.lock:
+            if filters:
+                # Drive the lookup from the smallest set; check the rest per slot
+                field = min(filters, key=lambda f: self.count(f, filters[f]))
+                sources = [self.by[field].get(filters[field], {})]
+            else:
+                sources = [rows_ for state, rows_ in self.by["slotState"].items() if state != "empty"]
+            for source in sources:
+                row_sets = source.items() if rows is None else [(r, source[r]) for r in rows if r in source]
+                for row, slots in row_sets:
+                    values = self.values[row]
+                    for slot in slots:
+                        if all(values[slot][i] == v for i, v in positions):
+                            found.append((row, slot))
+        found.sort()
+        return found
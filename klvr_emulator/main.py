@@ -1,14 +1,47 @@
 import socket
 import threading
-import time
-import atexit
 import asyncio
 import json
-from fastapi import FastAPI, Request, Query, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+import random
+import time
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, Depends, FastAPI, Request, Query, HTTPException, WebSocket, WebSocketDisconnect, WebSocketException
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-from zeroconf import ServiceInfo, Zeroconf
+from starlette.requests import HTTPConnection
+from klvr_emulator.broadcast import BroadcastScheduler
+from klvr_emulator.charger import ETAG_EPOCH, NUM_SLOTS, Charger, Fleet
+from klvr_emulator.clock import parse_clock
+from klvr_emulator.config import Config
+from klvr_emulator.encoding import FORMATS, FastJSONResponse, Frame, etag_matches, json_bytes, negotiate
+from klvr_emulator.engine import SLOT_STATES, TICK_SECONDS, make_engine
+from klvr_emulator.events import DEBUG, LEVEL_NAMES, EventLog
+from klvr_emulator.firmware import flash_seconds, receive_firmware, store_image
+from klvr_emulator.history import History
+from klvr_emulator.metrics import (
+    CONTENT_TYPE, FIRMWARE_BYTES, FIRMWARE_UPLOADS, LOOP_LAG_SECONDS, REGISTRY, TICK_DRIFT_SECONDS,
+    TICK_DURATION_SECONDS, WS_BROADCAST_BYTES, WS_BROADCAST_SECONDS, CallbackMetric, MetricsMiddleware,
+)
+from klvr_emulator.profile import DeviceProfileMiddleware, Profile, load_profile
+from klvr_emulator.ops import OpError, apply_batch, apply_slot_op, validate_batch
+from klvr_emulator.record import Recorder, replay
+from klvr_emulator.sampler import PROFILE_SECONDS, PROFILER, SAMPLE_INTERVAL, monitor_lag
+from klvr_emulator.ws import DELTA, HEARTBEAT, SNAPSHOT, STATUS, WSClient
+
+# The web UI's files, found wherever the emulator is run from
+ROOT = Path(__file__).resolve().parent.parent
+
+# Reported until the host address is detected at startup
+UNKNOWN_IP = "127.0.0.1"
+
+# Long-poll and SSE waits run on the wall clock. An open request holds up
+# server shutdown, so none stays open much longer than a minute
+LONG_POLL_SECONDS = 30.0
+LONG_POLL_MAX_SECONDS = 60.0
+SSE_KEEPALIVE_SECONDS = 15.0
+SSE_STREAM_SECONDS = 60.0  # EventSource reconnects with Last-Event-ID, so nothing is missed
+
 
 # Get local IP
 def get_host_ip():
@@ -21,152 +54,458 @@ def get_host_ip():
     finally:
         s.close()
 
-host_ip = get_host_ip()
-runtime_port = 8000  # Will be overwritten by run.py
-
-app = FastAPI()
-
-charger_state = {
-    "name": "KLVR Emulator",
-    "deviceInternalTemperatureC": 24.01,
-    "firmwareVersion": "0.1.0",
-    "firmwareBuild": "abc123",
-    "deviceStatus": "ok",
-    "network": {
-        "ipAddress": host_ip,
-        "gatewayAddress": "10.0.0.1",
-        "mask": "255.255.255.0",
-        "macAddress": "00:B0:D0:63:C2:26",
-        "method": "dhcp"
-    },
-    "batteries": [
-        {
-            "index": i,
-            "batteryBayTempC": 24.0,
-            "slotState": "empty",
-            "stateOfChargePercent": 0.0,
-            "timeRemainingSeconds": 0,
-            "errorMsg": "",
-            "batteryDetected": ""
-        } for i in range(48)
-    ]
-}
-
-# Firmware update state
-firmware_state = {
-    "main_firmware_pending": False,
-    "rear_firmware_pending": False,
-    "main_firmware_size": 0,
-    "rear_firmware_size": 0,
-    "main_firmware_version": None,
-    "rear_firmware_version": None,
-    "target_version": None,
-    "main_rebooting": False,
-    "rear_rebooting": False
-}
 
-# WebSocket state — firmware supports WS_MAX_CLIENTS=8; emulator caps at 2
-ws_clients: list[WebSocket] = []
-ws_lock = asyncio.Lock()
-pending_push: bool = False  # debounce flag
-_event_loop: asyncio.AbstractEventLoop | None = None  # captured at startup
+class Emulator:
+    """Everything one app serves: the fleet and its clock, push scheduler and profiles.
 
+    Building one is cheap and touches neither the network nor threads;
+    start() (the ASGI startup event) detects the host address, restores the
+    checkpoint, starts the simulation thread and registers Bonjour, and
+    stop() undoes all of it.
 
-async def ws_broadcast():
-    """Send current status to all connected WS clients."""
-    payload = {
-        "event": "battery_status",
-        "data": {
-            "deviceStatus": charger_state.get("deviceStatus", "ok"),
-            "batteries": charger_state["batteries"]
-        }
-    }
-    msg = json.dumps(payload)
-    async with ws_lock:
-        dead = []
-        for client in ws_clients:
-            try:
-                await client.send_text(msg)
-            except Exception:
-                dead.append(client)
-        for d in dead:
-            ws_clients.remove(d)
-
-
-async def ws_heartbeat():
-    """Push every 10 seconds regardless of state changes (WS_HEARTBEAT_MS=10000)."""
-    while True:
-        await asyncio.sleep(10)
-        await ws_broadcast()
-
-
-async def ws_debounce_push():
-    """Push 250 ms after a state change is flagged (WS_DEBOUNCE_MS=250)."""
-    global pending_push
-    await asyncio.sleep(0.25)
-    pending_push = False
-    await ws_broadcast()
-
+    The default charger answers on the bare /api/v2/... routes; fleet mode
+    adds more (see klvr_emulator.fleet).
+    """
 
-def notify_state_change():
-    """Call whenever battery state changes. Triggers a debounced WS push.
+    def __init__(self, config: Config):
+        self.config = config
+        # Log lines go through the event log (klvr_emulator.events), written off the event loop
+        self.events = EventLog(config.log_level, config.log_format)
+        self.port = config.port
+        self.host_ip = config.host_ip or UNKNOWN_IP
+        self.clock = parse_clock(config.clock)
+        # Slot history (klvr_emulator.history): config.history samples per charger
+        history = History(config.history, config.history_interval) if config.history > 0 else None
+        self.fleet = Fleet(make_engine(config.engine, self.clock), self.clock, history)
+        self.default_charger = self.fleet.new_charger(str(config.first_charger), self.host_ip)
+        # RNG behind bulk_insert; a seed makes a run's random scenarios reproducible
+        self.rng = random.Random(config.seed)
+        # Device performance profile (see klvr_emulator.profile): the config sets
+        # the fleet default, the admin endpoint can override it per charger
+        self.device_profile = load_profile(config.profile)
+        self.device_profiles: dict[str, Profile] = {}
+        self.broadcasts = BroadcastScheduler(self.clock, ws_broadcast, self.fleet)
+        self.checkpointer = None
+        self.started_in: float | None = None  # seconds start() took
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._zeroconf = None
+        self._mdns: asyncio.Task | None = None
+        self._lag: asyncio.Task | None = None
+
+    async def start(self):
+        started = time.perf_counter()
+        self.events.start()
+        if self.config.host_ip is None:
+            self.set_host_ip(get_host_ip())
+        self.broadcasts.start()
+        self._lag = asyncio.create_task(monitor_lag(LOOP_LAG_SECONDS))
+        if self.config.checkpoint:
+            # Imported here: the snapshot layout needs numpy, which is slow to import
+            from klvr_emulator.checkpoint import Checkpointer, restore
+            self.checkpointer = Checkpointer(self.fleet, self.config.checkpoint, self.config.checkpoint_interval)
+            restored = restore(self.fleet, self.checkpointer.path)
+            if restored is not None:
+                self.events.info("checkpoint.restored", f"♻️ Restored {restored['chargers']} chargers from "
+                                 f"{restored['path']} in {restored['ms']} ms", **restored)
+            self.checkpointer.start()
+        if self.config.record:
+            self.fleet.start_recording(Recorder(self.config.record, self.clock))
+            self.events.info("record.started", f"⏺ Recording state changes to {self.config.record}",
+                             path=self.config.record)
+        if self.config.simulate:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.loop, daemon=True, name="simulation")
+            self._thread.start()
+        if self.config.mdns:
+            # Registration probes the network for seconds; it runs in the background
+            self._mdns = asyncio.create_task(self.register_mdns())
+        running.append(self)
+        self.started_in = time.perf_counter() - started
+        self.events.info("emulator.started", f"✅ Emulator running at http://{self.host_ip}:{self.port}",
+                         host_ip=self.host_ip, port=self.port)
+
+    async def stop(self):
+        if self in running:
+            running.remove(self)
+        for task in (self._mdns, self._lag):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._mdns = self._lag = None
+        if self._zeroconf is not None:
+            await self._zeroconf.async_unregister_all_services()
+            await self._zeroconf.async_close()
+            self._zeroconf = None
+        if self._thread is not None:
+            self._stop.set()
+            self.fleet.engine.wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.broadcasts.stop()
+        self.fleet.stop_recording()
+        if self.checkpointer is not None:
+            saved = self.checkpointer.stop()
+            self.checkpointer = None
+            self.events.info("checkpoint.saved", f"💾 Checkpointed {saved['chargers']} chargers to {saved['path']}",
+                             **saved)
+        self.events.close()
+
+    def set_host_ip(self, host_ip: str):
+        self.host_ip = host_ip
+        for charger in self.fleet:
+            charger.host_ip = host_ip
+            charger.state["network"]["ipAddress"] = host_ip
+
+    # Charging simulation — one background thread steps the whole fleet's engine
+    # (the event engine sleeps until the next tick or deadline, or until woken)
+    def loop(self):
+        fleet = self.fleet
+        while not self._stop.is_set():
+            with TICK_DURATION_SECONDS.time():
+                changed = fleet.tick()
+            if changed:
+                self.broadcasts.request(*changed)
+
+            started = time.monotonic()
+            timeout = fleet.wait(TICK_SECONDS)
+            if timeout is not None:
+                TICK_DRIFT_SECONDS.observe(max(0.0, time.monotonic() - started - timeout))
+
+    def service_info(self, charger: Charger):
+        from zeroconf import ServiceInfo
+        port = charger.port if charger.port is not None else self.port
+        service_name = f"klvr{charger.service_mac(self.port)}"
+        properties = {"version": "0.1.0", "model": "emulator", "port": str(port)}
+        if charger.prefix:
+            properties["path"] = charger.prefix
+        return ServiceInfo(
+            type_="_klvrcharger._tcp.local.",
+            name=f"{service_name}._klvrcharger._tcp.local.",
+            addresses=[socket.inet_aton(charger.host_ip)],
+            port=port,
+            properties=properties,
+            server=f"klvr-emulator-{port}.local."
+        )
 
-    Safe to call from sync FastAPI endpoints (thread-pool executors): uses
-    run_coroutine_threadsafe so we always schedule on the uvicorn event loop
-    rather than calling asyncio.create_task(), which only works from inside
-    a running coroutine.
+    async def register_mdns(self):
+        """Register every charger concurrently so probing does not serialize."""
+        from zeroconf.asyncio import AsyncZeroconf
+        self._zeroconf = AsyncZeroconf()
+        infos = [self.service_info(c) for c in self.fleet]
+        pending = await asyncio.gather(*(self._zeroconf.async_register_service(info) for info in infos))
+        await asyncio.gather(*pending)
+        if len(infos) == 1:
+            self.events.info("mdns.registered", f"🔗 Bonjour service registered as: {infos[0].name.split('.')[0]}",
+                             services=1)
+        else:
+            self.events.info("mdns.registered", f"🔗 Bonjour registered {len(infos)} fleet chargers",
+                             services=len(infos))
+
+    def profile_for(self, charger: Charger) -> Profile:
+        return self.device_profiles.get(charger.id, self.device_profile)
+
+    def resolve_device(self, scope) -> tuple[str, str, Profile] | None:
+        """Charger, charger-relative path and profile for a device API request, before routing."""
+        fleet = self.fleet
+        path = scope["path"]
+        if path.startswith("/chargers/"):
+            parts = path.split("/", 3)
+            charger = fleet.get(parts[2])
+            path = "/" + parts[3] if len(parts) > 3 else "/"
+        else:
+            server = scope.get("server")
+            charger = fleet.for_port(server[1]) if server and fleet.by_port else None
+            charger = charger or self.default_charger
+        if charger is None or not path.startswith("/api/v2/") or path.startswith("/api/v2/emulator/"):
+            return None
+        return charger.id, path, self.profile_for(charger)
+
+    def notify_state_change(self, charger: Charger):
+        """Call whenever battery state changes. Triggers a debounced WS push.
+
+        Safe to call from sync FastAPI endpoints (thread-pool executors) and the
+        simulation thread: the scheduler hops onto the uvicorn event loop, and
+        merges the request with any push already pending for this window.
+        """
+        self.broadcasts.request(charger)
+
+    def ws_client_counts(self) -> dict:
+        delta = full = 0
+        for charger in self.fleet:
+            for client in charger.ws_clients:
+                if client.delta:
+                    delta += 1
+                else:
+                    full += 1
+        return {("full",): full, ("delta",): delta}
+
+
+# Started emulators, summed by the process-wide metrics below
+running: list[Emulator] = []
+
+
+def get_emulator(conn: HTTPConnection) -> Emulator:
+    return conn.app.state.emulator
+
+
+def get_charger(conn: HTTPConnection) -> Charger:
+    """Resolve the charger a request is for: path prefix, then local port."""
+    emulator = get_emulator(conn)
+    fleet = emulator.fleet
+    charger_id = conn.path_params.get("charger_id")
+    if charger_id is not None:
+        charger = fleet.get(charger_id)
+        if charger is None:
+            if conn.scope["type"] == "websocket":
+                raise WebSocketException(code=1008)
+            raise HTTPException(status_code=404, detail="Unknown charger")
+        return charger
+    server = conn.scope.get("server")
+    if server and fleet.by_port:
+        charger = fleet.for_port(server[1])
+        if charger is not None:
+            return charger
+    return emulator.default_charger
+
+
+async def ws_broadcast(charger: Charger, heartbeat: bool = False):
+    """Queue current status for all of a charger's connected WS clients.
+
+    Full clients get the battery_status frame; delta clients get a
+    battery_delta of the slots changed since the last one, or — on the
+    heartbeat, when nothing changed — a bare heartbeat carrying the seq.
+    Never waits on a client: each one drains its own queue.
     """
-    global pending_push
-    if not pending_push and _event_loop is not None:
-        pending_push = True
-        asyncio.run_coroutine_threadsafe(ws_debounce_push(), _event_loop)
-
-
-@app.websocket("/api/v2/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    async with ws_lock:
-        if len(ws_clients) >= 2:
-            await websocket.close(code=1008)  # Policy violation — max clients
-            return
-        ws_clients.append(websocket)
+    with WS_BROADCAST_SECONDS.time():
+        clients = charger.ws_clients
+        full = [c for c in clients if not c.delta]
+        if full:
+            frame = charger.status_event()
+            _encode_frame(frame, STATUS, full)
+            for client in full:
+                client.push(STATUS, frame)
+        delta = [c for c in clients if c.delta]
+        if delta:
+            taken = charger.take_delta()
+            if taken is not None:
+                kind, (seq, frame) = DELTA, taken
+            elif heartbeat:
+                kind, seq, frame = HEARTBEAT, charger.delta_seq, Frame({"event": "heartbeat", "seq": charger.delta_seq})
+            else:
+                return
+            _encode_frame(frame, kind, delta)
+            for client in delta:
+                client.push(kind, frame, seq)
+
+
+def _encode_frame(frame: Frame, kind: str, clients: list[WSClient]):
+    """Encode once per format in use, here rather than in each client's writer."""
+    for fmt in {c.format for c in clients}:
+        if fmt not in frame.encoded:
+            WS_BROADCAST_BYTES.labels(kind).observe(len(frame.encode(fmt)))
+
+
+def ws_send_snapshot(charger: Charger, client: WSClient):
+    """Start (or restart) a delta client from a full snapshot at the current seq.
+
+    Pending changes are flushed to the other delta clients first, so the
+    snapshot and the next delta share the same baseline.
+    """
+    delta = charger.take_delta()
+    if delta is not None:
+        seq, frame = delta
+        for other in charger.ws_clients:
+            if other.delta and other is not client:
+                other.push(DELTA, frame, seq)
+    client.delta = True
+    seq, frame = charger.delta_snapshot()
+    client.push(SNAPSHOT, frame, seq)
+
+
+def _summed(read) -> dict:
+    total: dict = {}
+    for emulator in running:
+        for labels, value in read(emulator).items():
+            total[labels] = total.get(labels, 0) + value
+    return total
+
+
+CallbackMetric("klvr_chargers", "Chargers served by this process.", lambda: sum(len(e.fleet) for e in running))
+CallbackMetric("klvr_history_bytes", "Memory held by slot history ring buffers.",
+               lambda: sum(e.fleet.history.nbytes for e in running if e.fleet.history is not None))
+CallbackMetric("klvr_events_dropped_total", "Log events not written because the writer fell behind.",
+               lambda: sum(e.events.stats["dropped"] for e in running), kind="counter")
+CallbackMetric("klvr_ws_clients", "Connected WebSocket clients by protocol.",
+               lambda: _summed(Emulator.ws_client_counts), labelnames=("mode",))
+CallbackMetric("klvr_ws_pushes_total", "WebSocket pushes issued, by trigger.",
+               lambda: _summed(lambda e: {("change",): e.broadcasts.stats["pushed"],
+                                          ("heartbeat",): e.broadcasts.stats["heartbeats_sent"]}),
+               kind="counter", labelnames=("trigger",))
+CallbackMetric("klvr_ws_pushes_suppressed_total", "WebSocket push triggers merged or skipped, by reason.",
+               lambda: _summed(lambda e: {("coalesced",): e.broadcasts.stats["coalesced"],
+                                          ("heartbeat_skipped",): e.broadcasts.stats["heartbeats_skipped"]}),
+               kind="counter", labelnames=("reason",))
+
+
+def ws_handle_command(charger: Charger, client: WSClient, text: str):
+    """Client commands: {"cmd": "subscribe", "mode": "delta" | "full"} and {"cmd": "resync"}."""
+    try:
+        command = json.loads(text)
+    except ValueError:
+        return  # Not a command — plain keep-alive text is ignored as before
+    if not isinstance(command, dict):
+        return
+    cmd = command.get("cmd")
+    if cmd == "resync" or (cmd == "subscribe" and command.get("mode") == "delta"):
+        ws_send_snapshot(charger, client)
+    elif cmd == "subscribe" and command.get("mode") == "full":
+        client.delta = False
+        client.push(STATUS, charger.status_event())
+
+
+router = APIRouter()
+# Emulator control — fleet-wide, so mounted once on the app rather than per charger
+admin = APIRouter()
+
+
+@router.websocket("/api/v2/ws")
+async def websocket_endpoint(websocket: WebSocket, mode: str = Query(default="full"),
+                             fmt: str = Query(default=None, alias="format"),
+                             charger: Charger = Depends(get_charger), emulator: Emulator = Depends(get_emulator)):
+    """Status push channel. `?mode=delta` opts into seq-numbered battery_delta events.
+
+    `?format=` or a `klvr.<format>` subprotocol selects the encoding (see
+    klvr_emulator.encoding); MessagePack formats arrive as binary frames.
+    """
+    subprotocol = next((p for p in websocket.scope.get("subprotocols", ())
+                        if p.startswith("klvr.") and p[5:] in FORMATS), None)
+    if fmt is None:
+        fmt = subprotocol[5:] if subprotocol else "json"
+    elif fmt not in FORMATS:
+        raise WebSocketException(code=1008, reason=f"Unknown format: {fmt}")
+    await websocket.accept(subprotocol=subprotocol)
+    if len(charger.ws_clients) >= emulator.config.ws_max_clients:
+        await websocket.close(code=1008)  # Policy violation — max clients
+        return
+    client = WSClient(websocket, charger, fmt=fmt)
+    charger.ws_clients.append(client)
+    client.start()
     # Send immediately on connect
-    await ws_broadcast()
+    if mode == "delta":
+        ws_send_snapshot(charger, client)
+    else:
+        await ws_broadcast(charger)
     try:
         while True:
-            await websocket.receive_text()  # Keep connection alive; ignore incoming
+            ws_handle_command(charger, client, await websocket.receive_text())
     except WebSocketDisconnect:
-        async with ws_lock:
-            if websocket in ws_clients:
-                ws_clients.remove(websocket)
-
-
-@app.on_event("startup")
-async def startup():
-    global _event_loop
-    _event_loop = asyncio.get_running_loop()
-    asyncio.create_task(ws_heartbeat())
+        pass
+    finally:
+        client.stop()
+        if client in charger.ws_clients:
+            charger.ws_clients.remove(client)
 
 
-@app.middleware("http")
 async def add_cors(request: Request, call_next):
     response = await call_next(request)
     response.headers['Access-Control-Allow-Origin'] = '*'
     return response
 
 
-@app.get("/api/v2/charger/status")
-def get_status():
-    return {
-        "deviceStatus": charger_state.get("deviceStatus", "ok"),
-        "batteries": charger_state["batteries"]
-    }
+def _cursor(since: int | None, charger: Charger) -> int:
+    """The version a client already has; -1 for none, or one from an earlier run."""
+    return -1 if since is None or since > charger.version else since
 
 
-@app.get("/api/v2/device/info")
-def get_device_info():
-    main_rebooting = firmware_state.get("main_rebooting", False)
-    rear_rebooting = firmware_state.get("rear_rebooting", False)
+@router.get("/api/v2/charger/status")
+async def get_status(request: Request, since: int = Query(default=None, ge=0),
+                     timeout: float = Query(default=LONG_POLL_SECONDS, gt=0, le=LONG_POLL_MAX_SECONDS),
+                     charger: Charger = Depends(get_charger), emulator: Emulator = Depends(get_emulator)):
+    """Serve the cached body for the current state version; 304 if the client has it.
+
+    `Accept` picks the encoding (klvr_emulator.encoding.FORMATS); without
+    one of the compact types it is the firmware's JSON. With `since`, a
+    long-poll: the request waits until the version passes that cursor (the
+    X-State-Version of an earlier response), or answers 304 after `timeout`.
+    """
+    if since is not None:
+        since = _cursor(since, charger)
+        await emulator.broadcasts.wait_for_change(charger, since, timeout)
+    media_type = negotiate(request.headers.get("accept"))
+    version, body = charger.status_snapshot(media_type)
+    headers = {"ETag": charger.etag(version, media_type), "Vary": "Accept", "X-State-Version": str(version)}
+    if (since is not None and version <= since) or etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+async def status_events(charger: Charger, broadcasts: BroadcastScheduler, since: int):
+    """Server-sent battery_status events, one per version the stream catches up to.
+
+    A slow reader skips versions rather than queueing them: each event is the
+    status current when it is written. Ends after SSE_STREAM_SECONDS.
+    """
+    loop = asyncio.get_running_loop()
+    ends = loop.time() + SSE_STREAM_SECONDS
+    yield b"retry: 1000\n\n"
+    while True:
+        version, body = charger.status_snapshot()
+        if version > since:
+            yield b"id: %d\nevent: battery_status\ndata: %s\n\n" % (version, body)
+            since = version
+        remaining = ends - loop.time()
+        if remaining <= 0:
+            return
+        if not await broadcasts.wait_for_change(charger, since, min(remaining, SSE_KEEPALIVE_SECONDS)):
+            yield b": keepalive\n\n"
+
+
+@router.get("/api/v2/charger/events")
+async def get_events(request: Request, since: int = Query(default=None, ge=0),
+                     charger: Charger = Depends(get_charger), emulator: Emulator = Depends(get_emulator)):
+    """Status as Server-Sent Events; `since` or Last-Event-ID skips versions the client has."""
+    if since is None:
+        last_event_id = request.headers.get("last-event-id", "")
+        since = int(last_event_id) if last_event_id.isdigit() else None
+    return StreamingResponse(status_events(charger, emulator.broadcasts, _cursor(since, charger)),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/api/v2/charger/query")
+def query_slots(slot_state: str = Query(default=None, alias="slotState"),
+                error_msg: str = Query(default=None, alias="errorMsg"),
+                battery_detected: str = Query(default=None, alias="batteryDetected"),
+                soc_min: float = Query(default=None, alias="socMin"), soc_max: float = Query(default=None, alias="socMax"),
+                limit: int = Query(default=None, ge=1), charger: Charger = Depends(get_charger),
+                emulator: Emulator = Depends(get_emulator)):
+    """This charger's slots matching every filter, e.g. ?slotState=charging&socMin=80"""
+    matches = emulator.fleet.query([charger], soc_min, soc_max, limit, slotState=slot_state, errorMsg=error_msg,
+                                   batteryDetected=battery_detected)
+    return {"count": len(matches), "batteries": [b for _, b in matches]}
+
+
+@router.get("/api/v2/charger/history")
+def get_history(points: int = Query(default=100, ge=1, le=1000), seconds: float = Query(default=None, gt=0),
+                slot: list[int] = Query(default=None), charger: Charger = Depends(get_charger)):
+    """Recent stateOfChargePercent, batteryBayTempC and slotState per slot, downsampled to `points`.
+
+    `seconds` limits the window to the most recent seconds of simulated
+    time (default: all samples kept); repeat `slot` to select slots.
+    """
+    history = charger.history
+    if history is None:
+        raise HTTPException(status_code=404, detail="Slot history is disabled")
+    if slot and any(not 0 <= s < NUM_SLOTS for s in slot):
+        raise HTTPException(status_code=400, detail="Invalid slot number")
+    return history.query(charger.row, charger.clock.now(), points, seconds, slot or None)
+
+
+@router.get("/api/v2/device/info")
+def get_device_info(charger: Charger = Depends(get_charger), emulator: Emulator = Depends(get_emulator)):
+    main_rebooting = charger.firmware.get("main_rebooting", False)
+    rear_rebooting = charger.firmware.get("rear_rebooting", False)
 
     if main_rebooting and rear_rebooting:
         status = "rebooting_both"
@@ -178,104 +517,100 @@ def get_device_info():
         status = "ready"
 
     return {
-        "name": f"KLVR Emulator Port {runtime_port}",
-        "firmwareVersion": charger_state["firmwareVersion"],
+        "name": charger.display_name(emulator.port),
+        "firmwareVersion": charger.state["firmwareVersion"],
         "ip": {
-            "ipAddress": charger_state["network"]["ipAddress"],
-            "networkMask": charger_state["network"]["mask"],
-            "gateway": charger_state["network"]["gatewayAddress"],
-            "method": charger_state["network"]["method"]
+            "ipAddress": charger.state["network"]["ipAddress"],
+            "networkMask": charger.state["network"]["mask"],
+            "gateway": charger.state["network"]["gatewayAddress"],
+            "method": charger.state["network"]["method"]
         },
         "status": status
     }
 
 
-@app.get("/api/v2/device/firmware_version")
-def get_firmware_version():
+@router.get("/api/v2/device/firmware_version")
+def get_firmware_version(charger: Charger = Depends(get_charger)):
     return {
-        "firmwareRear": charger_state["firmwareVersion"],
-        "firmwareMain": charger_state["firmwareVersion"]
+        "firmwareRear": charger.state["firmwareVersion"],
+        "firmwareMain": charger.state["firmwareVersion"]
     }
 
 
-@app.post("/api/v2/charger/insert/{slot}")
-async def insert(slot: int, type: str = Query(...)):
-    b = charger_state["batteries"][slot]
-    # Recovery: cold/warm batteries transition back to charging on re-insert
-    b["slotState"] = "charging"
-    b["stateOfChargePercent"] = 5.0
-    b["timeRemainingSeconds"] = 7200
-    b["batteryDetected"] = type
-    b["errorMsg"] = ""
-    notify_state_change()
+def _slot_op(charger: Charger, emulator: Emulator, **op):
+    """Run one slot operation through the same validation and fields as the batch endpoint."""
+    try:
+        # Hold the simulation lock, as the batch endpoint does, so no tick lands mid-op
+        with emulator.fleet.lock:
+            apply_slot_op(charger, op)
+    except OpError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    emulator.notify_state_change(charger)
+
+
+@router.post("/api/v2/charger/insert/{slot}")
+async def insert(slot: int, type: str = Query(...), charger: Charger = Depends(get_charger),
+                 emulator: Emulator = Depends(get_emulator)):
+    _slot_op(charger, emulator, op="insert", slot=slot, type=type)
     return {"ok": True}
 
 
-@app.post("/api/v2/charger/eject/{slot}")
-async def eject(slot: int):
-    b = charger_state["batteries"][slot]
-    b["slotState"] = "empty"
-    b["stateOfChargePercent"] = 0.0
-    b["timeRemainingSeconds"] = 0
-    b["batteryDetected"] = ""
-    b["errorMsg"] = ""
-    notify_state_change()
+@router.post("/api/v2/charger/eject/{slot}")
+async def eject(slot: int, charger: Charger = Depends(get_charger), emulator: Emulator = Depends(get_emulator)):
+    _slot_op(charger, emulator, op="eject", slot=slot)
     return {"ok": True}
 
 
-@app.post("/api/v2/charger/bulk_insert")
-async def bulk_insert():
+@router.post("/api/v2/charger/bulk_insert")
+async def bulk_insert(seed: int = Query(default=None), charger: Charger = Depends(get_charger),
+                      emulator: Emulator = Depends(get_emulator)):
     """Insert 37 batteries with random types (AA/AAA) and SOC levels, always including 4-5 full batteries"""
-    import random
-
-    for b in charger_state["batteries"]:
-        b["slotState"] = "empty"
-        b["stateOfChargePercent"] = 0.0
-        b["timeRemainingSeconds"] = 0
-        b["batteryDetected"] = ""
-        b["errorMsg"] = ""
-
-    battery_types = ["KLVR-AA", "KLVR-AAA"]
-    slots_to_fill = random.sample(range(48), 37)
-    full_batteries_count = random.randint(4, 5)
-    full_battery_slots = random.sample(slots_to_fill, full_batteries_count)
-
-    batteries_inserted = []
-    full_count = 0
-
-    for slot in slots_to_fill:
-        battery_type = random.choice(battery_types)
-
-        if slot in full_battery_slots:
-            soc = 100.0
-            full_count += 1
-            slot_state = "done"
-            time_remaining = 0
-        else:
-            soc = random.uniform(5.0, 95.0)
-            slot_state = "charging"
-            remaining_charge_needed = max(0, 100.0 - soc)
-            total_charge_range = 95.0
-            total_time_for_full_charge = 7200
-            time_remaining = int((remaining_charge_needed / total_charge_range) * total_time_for_full_charge)
-
-        b = charger_state["batteries"][slot]
-        b["slotState"] = slot_state
-        b["stateOfChargePercent"] = soc
-        b["timeRemainingSeconds"] = time_remaining
-        b["batteryDetected"] = battery_type
-        b["errorMsg"] = ""
-
-        batteries_inserted.append({
-            "index": slot,
-            "type": battery_type,
-            "soc": round(soc, 1),
-            "timeRemaining": time_remaining
-        })
-
-    print(f"🔋 Bulk inserted 37 batteries: {len([b for b in batteries_inserted if b['type'] == 'KLVR-AA'])} AA, {len([b for b in batteries_inserted if b['type'] == 'KLVR-AAA'])} AAA ({full_count} full)")
-
-    notify_state_change()
+    # ?seed= draws this call from its own RNG, so the same seed gives the same slots
+    rand = emulator.rng if seed is None else random.Random(seed)
+
+    with emulator.fleet.lock:
+        charger.clear_slots()
+
+        battery_types = ["KLVR-AA", "KLVR-AAA"]
+        slots_to_fill = rand.sample(range(NUM_SLOTS), 37)
+        full_batteries_count = rand.randint(4, 5)
+        full_battery_slots = rand.sample(slots_to_fill, full_batteries_count)
+
+        batteries_inserted = []
+        full_count = 0
+
+        for slot in slots_to_fill:
+            battery_type = rand.choice(battery_types)
+
+            if slot in full_battery_slots:
+                soc = 100.0
+                full_count += 1
+                slot_state = "done"
+                time_remaining = 0
+            else:
+                soc = rand.uniform(5.0, 95.0)
+                slot_state = "charging"
+                remaining_charge_needed = max(0, 100.0 - soc)
+                total_charge_range = 95.0
+                total_time_for_full_charge = 7200
+                time_remaining = int((remaining_charge_needed / total_charge_range) * total_time_for_full_charge)
+
+            charger.update_slot(slot, slotState=slot_state, stateOfChargePercent=soc,
+                                timeRemainingSeconds=time_remaining, batteryDetected=battery_type, errorMsg="")
+
+            batteries_inserted.append({
+                "index": slot,
+                "type": battery_type,
+                "soc": round(soc, 1),
+                "timeRemaining": time_remaining
+            })
+
+    aa = len([b for b in batteries_inserted if b['type'] == 'KLVR-AA'])
+    aaa = len(batteries_inserted) - aa
+    emulator.events.info("slots.bulk_insert", f"🔋 Bulk inserted 37 batteries: {aa} AA, {aaa} AAA ({full_count} full)",
+                         charger, aa=aa, aaa=aaa, full=full_count)
+
+    emulator.notify_state_change(charger)
     return {
         "ok": True,
         "message": f"Successfully inserted 37 batteries ({full_count} full)",
@@ -290,70 +625,91 @@ async def bulk_insert():
     }
 
 
-@app.post("/api/v2/charger/set_cold/{slot}")
-async def set_cold(slot: int):
+@router.post("/api/v2/charger/set_cold/{slot}")
+async def set_cold(slot: int, charger: Charger = Depends(get_charger), emulator: Emulator = Depends(get_emulator)):
     """Set a slot to cold state (BATTERY_STATE_TEMP_COLD)."""
-    if slot < 0 or slot >= 48:
-        raise HTTPException(status_code=400, detail="Invalid slot number")
-    b = charger_state["batteries"][slot]
-    b["slotState"] = "cold"
-    b["errorMsg"] = "cold"
-    notify_state_change()
+    _slot_op(charger, emulator, op="set_cold", slot=slot)
     return {"ok": True}
 
 
-@app.post("/api/v2/charger/set_warm/{slot}")
-async def set_warm(slot: int):
+@router.post("/api/v2/charger/set_warm/{slot}")
+async def set_warm(slot: int, charger: Charger = Depends(get_charger), emulator: Emulator = Depends(get_emulator)):
     """Set a slot to warm state (BATTERY_STATE_TEMP_WARM)."""
-    if slot < 0 or slot >= 48:
-        raise HTTPException(status_code=400, detail="Invalid slot number")
-    b = charger_state["batteries"][slot]
-    b["slotState"] = "warm"
-    b["errorMsg"] = "warm"
-    notify_state_change()
+    _slot_op(charger, emulator, op="set_warm", slot=slot)
     return {"ok": True}
 
 
-@app.post("/api/v2/charger/bulk_clear")
-async def bulk_clear():
+@router.post("/api/v2/charger/bulk_clear")
+async def bulk_clear(charger: Charger = Depends(get_charger), emulator: Emulator = Depends(get_emulator)):
     """Eject all batteries at once."""
-    for b in charger_state["batteries"]:
-        b["slotState"] = "empty"
-        b["stateOfChargePercent"] = 0.0
-        b["timeRemainingSeconds"] = 0
-        b["batteryDetected"] = ""
-        b["errorMsg"] = ""
-    notify_state_change()
+    charger.clear_slots()
+    emulator.notify_state_change(charger)
     return {"ok": True}
 
 
-VALID_ERROR_TYPES = {"overtemp", "undertemp", "overcurrent", "faulty", "detect_err"}
-
-@app.post("/api/v2/charger/set_error/{slot}")
-async def set_error(slot: int, type: str = Query(...)):
+@router.post("/api/v2/charger/set_error/{slot}")
+async def set_error(slot: int, type: str = Query(...), charger: Charger = Depends(get_charger),
+                    emulator: Emulator = Depends(get_emulator)):
     """Set a slot to error state with a specific errorMsg."""
-    if slot < 0 or slot >= 48:
-        raise HTTPException(status_code=400, detail="Invalid slot number")
-    if type not in VALID_ERROR_TYPES:
-        raise HTTPException(status_code=400, detail=f"Invalid error type. Must be one of: {', '.join(sorted(VALID_ERROR_TYPES))}")
-    b = charger_state["batteries"][slot]
-    b["slotState"] = "error"
-    b["errorMsg"] = type
-    notify_state_change()
+    _slot_op(charger, emulator, op="set_error", slot=slot, type=type)
     return {"ok": True}
 
 
+@router.post("/api/v2/charger/batch")
+async def batch(request: Request, charger: Charger = Depends(get_charger), emulator: Emulator = Depends(get_emulator)):
+    """Apply a list of slot operations atomically: one state version bump, one WebSocket push.
+
+    Body: {"ops": [{"op": "insert", "slot": 0, "type": "KLVR-AA"},
+                   {"op": "set_charge", "slot": 0, "percentage": 80}, ...]}
+    Ops: insert, eject, set_cold, set_warm, set_error, set_charge, bulk_clear.
+    Every op is validated before any is applied; a bad op rejects the whole batch.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    ops = data.get("ops") if isinstance(data, dict) else data
+    try:
+        validated = validate_batch(ops)
+    except OpError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not validated:
+        return {"ok": True, "applied": 0, "version": charger.version}  # nothing changed: no version bump, no push
+    # Hold the simulation lock so no tick lands between two ops
+    with emulator.fleet.lock:
+        apply_batch(charger, validated)
+    emulator.notify_state_change(charger)
+    return {"ok": True, "applied": len(validated), "version": charger.version}
+
+
 # Firmware Update Endpoints
 
-@app.post("/api/v2/device/firmware_charger")
-async def upload_main_firmware(request: Request, version: str = Query(default=None)):
+def _firmware_state_event(events: EventLog, charger: Charger):
+    firmware = charger.firmware
+    events.info("firmware.state", f"📊 Firmware State: main_pending={firmware['main_firmware_pending']}, "
+                f"rear_pending={firmware['rear_firmware_pending']}, target_version={firmware['target_version']}, "
+                f"version={charger.state['firmwareVersion']}", charger,
+                main_pending=firmware["main_firmware_pending"], rear_pending=firmware["rear_firmware_pending"],
+                target_version=firmware["target_version"], version=charger.state["firmwareVersion"])
+
+
+@router.post("/api/v2/device/firmware_charger")
+async def upload_main_firmware(request: Request, version: str = Query(default=None), charger: Charger = Depends(get_charger),
+                               emulator: Emulator = Depends(get_emulator)):
     """Upload main board firmware"""
     try:
-        firmware_data = await request.body()
-        firmware_size = len(firmware_data)
-
-        print(f"🔍 MAIN: Query params: {dict(request.query_params)}")
-        print(f"🔍 MAIN: All headers: {dict(request.headers)}")
+        config = emulator.config
+        image = await receive_firmware(request, charger.clock,
+                                       emulator.profile_for(charger).upload_bytes_per_second or config.firmware_throughput,
+                                       config.firmware_spill_dir)
+        firmware_size = image.size
+        FIRMWARE_BYTES.labels("main").inc(firmware_size)
+
+        events = emulator.events
+        if events.enabled(DEBUG):
+            query, headers = dict(request.query_params), dict(request.headers)
+            events.debug("firmware.request", f"🔍 MAIN: Query params: {query} All headers: {headers}", charger,
+                         board="main", query=query, headers=headers)
 
         simulated_version = (
             version or
@@ -362,62 +718,81 @@ async def upload_main_firmware(request: Request, version: str = Query(default=No
             "1.6.3"
         )
 
-        print(f"✅ Received main firmware: {firmware_size:,} bytes (version: {simulated_version})")
-        firmware_state["main_firmware_size"] = firmware_size
-        firmware_state["main_firmware_pending"] = True
-        firmware_state["main_firmware_version"] = simulated_version
+        events.info("firmware.received", f"✅ Received main firmware: {firmware_size:,} bytes, sha256 "
+                    f"{image.sha256[:12]}… (version: {simulated_version})", charger, board="main",
+                    bytes=firmware_size, sha256=image.sha256, version=simulated_version)
+        store_image(charger.firmware, "main", image)
+        charger.firmware["main_firmware_pending"] = True
+        charger.firmware["main_firmware_version"] = simulated_version
 
-        if not firmware_state["target_version"]:
-            firmware_state["target_version"] = simulated_version
+        if not charger.firmware["target_version"]:
+            charger.firmware["target_version"] = simulated_version
 
-        print(f"📊 Updated Firmware State: main_pending={firmware_state['main_firmware_pending']}, rear_pending={firmware_state['rear_firmware_pending']}, target_version={firmware_state['target_version']}")
+        _firmware_state_event(events, charger)
 
-        await asyncio.sleep(2)
+        await charger.clock.sleep(flash_seconds(firmware_size, config.flash_throughput))
 
+        FIRMWARE_UPLOADS.labels("main", "success").inc()
         return {"status": "success", "message": f"Main firmware uploaded successfully (version: {simulated_version})"}
     except Exception as e:
-        print(f"❌ Error uploading main firmware: {e}")
+        FIRMWARE_UPLOADS.labels("main", "error").inc()
+        emulator.events.error("firmware.failed", f"❌ Error uploading main firmware: {e}", charger, board="main",
+                              error=str(e))
         raise HTTPException(status_code=500, detail="Firmware upload failed")
 
 
-@app.post("/api/v2/device/firmware_rear")
-async def upload_rear_firmware(request: Request, version: str = Query(default=None)):
+@router.post("/api/v2/device/firmware_rear")
+async def upload_rear_firmware(request: Request, version: str = Query(default=None), charger: Charger = Depends(get_charger),
+                               emulator: Emulator = Depends(get_emulator)):
     """Upload rear board firmware"""
     try:
-        firmware_data = await request.body()
-        firmware_size = len(firmware_data)
-
-        print(f"🔍 REAR: Query params: {dict(request.query_params)}")
-        print(f"🔍 REAR: All headers: {dict(request.headers)}")
+        config = emulator.config
+        image = await receive_firmware(request, charger.clock,
+                                       emulator.profile_for(charger).upload_bytes_per_second or config.firmware_throughput,
+                                       config.firmware_spill_dir)
+        firmware_size = image.size
+        FIRMWARE_BYTES.labels("rear").inc(firmware_size)
+
+        events = emulator.events
+        if events.enabled(DEBUG):
+            query, headers = dict(request.query_params), dict(request.headers)
+            events.debug("firmware.request", f"🔍 REAR: Query params: {query} All headers: {headers}", charger,
+                         board="rear", query=query, headers=headers)
 
         simulated_version = (
             version or
             request.headers.get("x-firmware-version") or
             request.headers.get("firmware-version") or
-            firmware_state.get("target_version") or
+            charger.firmware.get("target_version") or
             "1.6.3"
         )
 
-        print(f"✅ Received rear firmware: {firmware_size:,} bytes (version: {simulated_version})")
-        firmware_state["rear_firmware_size"] = firmware_size
-        firmware_state["rear_firmware_pending"] = True
-        firmware_state["rear_firmware_version"] = simulated_version
+        events.info("firmware.received", f"✅ Received rear firmware: {firmware_size:,} bytes, sha256 "
+                    f"{image.sha256[:12]}… (version: {simulated_version})", charger, board="rear",
+                    bytes=firmware_size, sha256=image.sha256, version=simulated_version)
+        store_image(charger.firmware, "rear", image)
+        charger.firmware["rear_firmware_pending"] = True
+        charger.firmware["rear_firmware_version"] = simulated_version
 
-        if not firmware_state["target_version"]:
-            firmware_state["target_version"] = simulated_version
+        if not charger.firmware["target_version"]:
+            charger.firmware["target_version"] = simulated_version
 
-        print(f"📊 Updated Firmware State: main_pending={firmware_state['main_firmware_pending']}, rear_pending={firmware_state['rear_firmware_pending']}, target_version={firmware_state['target_version']}")
+        _firmware_state_event(events, charger)
 
-        await asyncio.sleep(2)
+        await charger.clock.sleep(flash_seconds(firmware_size, config.flash_throughput))
 
+        FIRMWARE_UPLOADS.labels("rear", "success").inc()
         return {"status": "success", "message": f"Rear firmware uploaded successfully (version: {simulated_version})"}
     except Exception as e:
-        print(f"❌ Error uploading rear firmware: {e}")
+        FIRMWARE_UPLOADS.labels("rear", "error").inc()
+        emulator.events.error("firmware.failed", f"❌ Error uploading rear firmware: {e}", charger, board="rear",
+                              error=str(e))
         raise HTTPException(status_code=500, detail="Firmware upload failed")
 
 
-@app.post("/api/v2/device/reboot")
-async def reboot_board(request: Request):
+@router.post("/api/v2/device/reboot")
+async def reboot_board(request: Request, charger: Charger = Depends(get_charger),
+                       emulator: Emulator = Depends(get_emulator)):
     """Reboot main or rear board — emulated with realistic delays"""
     try:
         board = (await request.body()).decode().strip()
@@ -425,30 +800,34 @@ async def reboot_board(request: Request):
         if board not in ["main", "rear"]:
             raise HTTPException(status_code=400, detail="Invalid board name. Use 'main' or 'rear'")
 
-        print(f"🔄 Emulating {board} board reboot...")
+        events = emulator.events
+        events.info("reboot.started", f"🔄 Emulating {board} board reboot...", charger, board=board)
 
         reboot_key = f"{board}_rebooting"
-        firmware_state[reboot_key] = True
+        charger.firmware[reboot_key] = True
 
         async def emulated_reboot():
-            await asyncio.sleep(2)
-
-            if board == "main" and firmware_state["main_firmware_pending"]:
-                firmware_state["main_firmware_pending"] = False
-                print(f"✅ Main firmware applied! ({firmware_state['main_firmware_size']:,} bytes)")
-            elif board == "rear" and firmware_state["rear_firmware_pending"]:
-                firmware_state["rear_firmware_pending"] = False
-                print(f"✅ Rear firmware applied! ({firmware_state['rear_firmware_size']:,} bytes)")
-
-            if not firmware_state["main_firmware_pending"] and not firmware_state["rear_firmware_pending"] and \
-               firmware_state["main_firmware_size"] > 0 and firmware_state["rear_firmware_size"] > 0:
-                target_version = firmware_state["target_version"] or "0.1.5"
-                charger_state["firmwareVersion"] = target_version
-                print(f"🎉 Firmware update complete! Version: {target_version}")
-
-            firmware_state[reboot_key] = False
-            print(f"✅ {board.capitalize()} board reboot complete")
-            print(f"📊 Firmware State: main_pending={firmware_state['main_firmware_pending']}, rear_pending={firmware_state['rear_firmware_pending']}, version={charger_state['firmwareVersion']}")
+            await charger.clock.sleep(2)
+
+            if board == "main" and charger.firmware["main_firmware_pending"]:
+                charger.firmware["main_firmware_pending"] = False
+                events.info("firmware.applied", f"✅ Main firmware applied! ({charger.firmware['main_firmware_size']:,} bytes)",
+                            charger, board="main", bytes=charger.firmware["main_firmware_size"])
+            elif board == "rear" and charger.firmware["rear_firmware_pending"]:
+                charger.firmware["rear_firmware_pending"] = False
+                events.info("firmware.applied", f"✅ Rear firmware applied! ({charger.firmware['rear_firmware_size']:,} bytes)",
+                            charger, board="rear", bytes=charger.firmware["rear_firmware_size"])
+
+            if not charger.firmware["main_firmware_pending"] and not charger.firmware["rear_firmware_pending"] and \
+               charger.firmware["main_firmware_size"] > 0 and charger.firmware["rear_firmware_size"] > 0:
+                target_version = charger.firmware["target_version"] or "0.1.5"
+                charger.state["firmwareVersion"] = target_version
+                events.info("firmware.updated", f"🎉 Firmware update complete! Version: {target_version}", charger,
+                            version=target_version)
+
+            charger.firmware[reboot_key] = False
+            events.info("reboot.completed", f"✅ {board.capitalize()} board reboot complete", charger, board=board)
+            _firmware_state_event(events, charger)
 
         asyncio.create_task(emulated_reboot())
         return {"status": "rebooting"}
@@ -456,143 +835,406 @@ async def reboot_board(request: Request):
     except UnicodeDecodeError:
         raise HTTPException(status_code=400, detail="Invalid request body format")
     except Exception as e:
-        print(f"❌ Error during reboot: {e}")
+        emulator.events.error("reboot.failed", f"❌ Error during reboot: {e}", charger, error=str(e))
         raise HTTPException(status_code=500, detail="Reboot failed")
 
 
-@app.get("/api/v2/device/firmware_state")
-def get_firmware_state():
+@router.get("/api/v2/device/firmware_state")
+def get_firmware_state(charger: Charger = Depends(get_charger)):
     """Debug endpoint to check current firmware state"""
     return {
-        "current_version": charger_state["firmwareVersion"],
-        "target_version": firmware_state["target_version"],
-        "main_firmware_pending": firmware_state["main_firmware_pending"],
-        "rear_firmware_pending": firmware_state["rear_firmware_pending"],
-        "main_firmware_size": firmware_state["main_firmware_size"],
-        "rear_firmware_size": firmware_state["rear_firmware_size"],
-        "main_firmware_version": firmware_state["main_firmware_version"],
-        "rear_firmware_version": firmware_state["rear_firmware_version"],
-        "main_rebooting": firmware_state["main_rebooting"],
-        "rear_rebooting": firmware_state["rear_rebooting"]
+        "current_version": charger.state["firmwareVersion"],
+        "target_version": charger.firmware["target_version"],
+        "main_firmware_pending": charger.firmware["main_firmware_pending"],
+        "rear_firmware_pending": charger.firmware["rear_firmware_pending"],
+        "main_firmware_size": charger.firmware["main_firmware_size"],
+        "rear_firmware_size": charger.firmware["rear_firmware_size"],
+        "main_firmware_sha256": charger.firmware["main_firmware_sha256"],
+        "rear_firmware_sha256": charger.firmware["rear_firmware_sha256"],
+        "main_firmware_version": charger.firmware["main_firmware_version"],
+        "rear_firmware_version": charger.firmware["rear_firmware_version"],
+        "main_rebooting": charger.firmware["main_rebooting"],
+        "rear_rebooting": charger.firmware["rear_rebooting"]
     }
 
 
-@app.post("/api/v2/device/set_firmware_version")
-async def set_firmware_version(request: Request):
+@router.post("/api/v2/device/set_firmware_version")
+async def set_firmware_version(request: Request, charger: Charger = Depends(get_charger),
+                               emulator: Emulator = Depends(get_emulator)):
     """Manually set firmware version for testing"""
     try:
         data = await request.json()
         version = data.get("version", "0.1.0")
-        charger_state["firmwareVersion"] = version
-        print(f"🔧 Manually set firmware version to: {version}")
+        charger.state["firmwareVersion"] = version
+        emulator.events.info("firmware.version_set", f"🔧 Manually set firmware version to: {version}", charger,
+                             version=version)
         return {"status": "success", "firmwareVersion": version}
     except Exception as e:
-        print(f"❌ Error setting firmware version: {e}")
+        emulator.events.warning("request.invalid", f"❌ Error setting firmware version: {e}", charger, error=str(e))
         raise HTTPException(status_code=400, detail="Invalid request")
 
 
-@app.post("/api/v2/device/set_target_version")
-async def set_target_version(request: Request):
+@router.post("/api/v2/device/set_target_version")
+async def set_target_version(request: Request, charger: Charger = Depends(get_charger),
+                             emulator: Emulator = Depends(get_emulator)):
     """Manually set target firmware version for testing firmware uploads"""
     try:
         data = await request.json()
         version = data.get("version", "1.6.3")
-        firmware_state["target_version"] = version
-        print(f"🎯 Manually set target firmware version to: {version}")
+        charger.firmware["target_version"] = version
+        emulator.events.info("firmware.target_set", f"🎯 Manually set target firmware version to: {version}", charger,
+                             version=version)
         return {"status": "success", "targetVersion": version}
     except Exception as e:
-        print(f"❌ Error setting target version: {e}")
+        emulator.events.warning("request.invalid", f"❌ Error setting target version: {e}", charger, error=str(e))
         raise HTTPException(status_code=400, detail="Invalid request")
 
 
-@app.post("/api/v2/charger/set_charge/{slot}")
-async def set_charge_percentage(slot: int, request: Request):
+@router.post("/api/v2/charger/set_charge/{slot}")
+async def set_charge_percentage(slot: int, request: Request, charger: Charger = Depends(get_charger),
+                                emulator: Emulator = Depends(get_emulator)):
     """Manually set charge percentage for a specific slot"""
     try:
         data = await request.json()
         percentage = float(data.get("percentage", 0.0))
-
-        if slot < 0 or slot >= 48:
-            raise HTTPException(status_code=400, detail="Invalid slot number")
-        if percentage < 0 or percentage > 100:
-            raise HTTPException(status_code=400, detail="Percentage must be between 0 and 100")
-
-        battery = charger_state["batteries"][slot]
-        battery["stateOfChargePercent"] = percentage
-
-        if battery["slotState"] == "charging" and percentage < 100:
-            remaining_charge_needed = max(0, 100.0 - percentage)
-            total_charge_range = 95.0
-            total_time_for_full_charge = 7200
-            battery["timeRemainingSeconds"] = int((remaining_charge_needed / total_charge_range) * total_time_for_full_charge)
-        elif percentage >= 100:
-            battery["slotState"] = "done"
-            battery["timeRemainingSeconds"] = 0
-        elif battery["slotState"] == "empty":
-            battery["timeRemainingSeconds"] = 0
-
-        print(f"🔋 Set slot {slot} charge to: {percentage}% (remaining: {battery['timeRemainingSeconds']}s)")
-        notify_state_change()
-        return {"status": "success", "index": slot, "percentage": percentage, "timeRemaining": battery["timeRemainingSeconds"]}
-    except ValueError:
+    except (ValueError, TypeError, AttributeError):
         raise HTTPException(status_code=400, detail="Invalid percentage value")
+    try:
+        _slot_op(charger, emulator, op="set_charge", slot=slot, percentage=percentage)
+        time_remaining = charger.battery(slot)["timeRemainingSeconds"]
+
+        emulator.events.info("slots.set_charge", f"🔋 Set slot {slot} charge to: {percentage}% (remaining: {time_remaining}s)",
+                             charger, slot=slot, percentage=percentage, remaining=time_remaining)
+        return {"status": "success", "index": slot, "percentage": percentage, "timeRemaining": time_remaining}
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error setting charge percentage: {e}")
+        emulator.events.error("slots.failed", f"❌ Error setting charge percentage: {e}", charger, error=str(e))
         raise HTTPException(status_code=500, detail="Failed to set charge percentage")
 
 
-@app.get("/", response_class=HTMLResponse)
-def ui():
-    return Path("templates/index.html").read_text()
+@admin.get("/api/v2/emulator/broadcasts")
+def get_broadcast_stats(emulator: Emulator = Depends(get_emulator)):
+    """WebSocket push counters: how many triggers were coalesced or heartbeats skipped."""
+    return emulator.broadcasts.stats
+
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@admin.get("/api/v2/emulator/events")
+def get_events_log(level: str = Query(default=None), since: int = Query(default=None),
+                   charger: str = Query(default=None), event: str = Query(default=None),
+                   limit: int = Query(default=100, ge=1), emulator: Emulator = Depends(get_emulator)):
+    """Recent log events, oldest first; `since` is the last seq already seen, `event` a name or prefix."""
+    events = emulator.events
+    try:
+        found = events.recent(level, since, charger, event, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"level": LEVEL_NAMES[events.level], **events.stats, "events": found}
 
 
-# Charging simulation — runs in a background thread
-def loop():
-    while True:
-        changed = False
-        for b in charger_state["batteries"]:
-            if b["slotState"] in ("cold", "warm"):
-                # Temperature-paused states — do not increment charge
-                continue
-            if b["slotState"] == "charging":
-                # 95% in 2 hours = 0.0264% every 2 seconds
-                b["stateOfChargePercent"] = min(100.0, b["stateOfChargePercent"] + 0.0264)
-                b["timeRemainingSeconds"] = max(0, b["timeRemainingSeconds"] - 2)
-                if b["stateOfChargePercent"] >= 100.0:
-                    b["slotState"] = "done"
-                    b["timeRemainingSeconds"] = 0
-                changed = True
-
-        if changed and _event_loop is not None:
-            try:
-                asyncio.run_coroutine_threadsafe(ws_broadcast(), _event_loop)
-            except Exception:
-                pass
-
-        time.sleep(2)
-
-
-def bonjour():
-    z = Zeroconf()
-    simulated_mac = f"0080e1{runtime_port:06x}"
-    service_name = f"klvr{simulated_mac}"
-
-    info = ServiceInfo(
-        type_="_klvrcharger._tcp.local.",
-        name=f"{service_name}._klvrcharger._tcp.local.",
-        addresses=[socket.inet_aton(host_ip)],
-        port=runtime_port,
-        properties={"version": "0.1.0", "model": "emulator", "port": str(runtime_port)},
-        server=f"klvr-emulator-{runtime_port}.local."
-    )
-    z.register_service(info)
-    atexit.register(lambda: z.unregister_service(info))
-    print(f"✅ Emulator running at http://{host_ip}:{runtime_port}")
-    print(f"🔗 Bonjour service registered as: {service_name}")
-
-
-# Start background threads
-threading.Thread(target=loop, daemon=True).start()
-threading.Thread(target=bonjour, daemon=True).start()
+@admin.post("/api/v2/emulator/events/level")
+async def set_log_level(request: Request, emulator: Emulator = Depends(get_emulator)):
+    """Change what is logged: {"level": "debug" | "info" | "warning" | "error"}"""
+    try:
+        data = await request.json()
+        emulator.events.set_level(data["level"])
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid log level: {e}")
+    return {"level": LEVEL_NAMES[emulator.events.level]}
+
+
+@admin.get("/api/v2/emulator/profiler")
+def get_profiler(top: int = Query(default=20, ge=1, le=1000)):
+    """The running or last profile: samples per thread and the functions most often on top."""
+    return PROFILER.info(top)
+
+
+@admin.get("/api/v2/emulator/profiler/stacks")
+def get_profiler_stacks(thread: str = Query(default=None)):
+    """The profile as collapsed stacks, for flamegraph.pl, speedscope or inferno."""
+    return Response(PROFILER.collapsed(thread), media_type="text/plain; charset=utf-8")
+
+
+@admin.post("/api/v2/emulator/profiler/start")
+async def start_profiler(request: Request, emulator: Emulator = Depends(get_emulator)):
+    """Sample every thread of the process: {"seconds": 30, "interval": 0.01}"""
+    try:
+        data = await request.json() if await request.body() else {}
+        seconds = float(data.get("seconds", PROFILE_SECONDS))
+        interval = float(data.get("interval", SAMPLE_INTERVAL))
+        PROFILER.start(seconds, interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (ValueError, TypeError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid profile: {e}")
+    emulator.events.info("profiler.started", f"🔬 Profiling all threads for {seconds:g} s every {interval:g} s",
+                         seconds=seconds, interval=interval)
+    return PROFILER.info()
+
+
+@admin.post("/api/v2/emulator/profiler/stop")
+async def stop_profiler(emulator: Emulator = Depends(get_emulator)):
+    """End the profile early, keeping what was sampled."""
+    if not PROFILER.running:
+        raise HTTPException(status_code=409, detail="Not profiling")
+    await asyncio.to_thread(PROFILER.stop)
+    info = PROFILER.info()
+    emulator.events.info("profiler.stopped", f"🔬 Profile stopped after {info['samples']} samples",
+                         samples=info["samples"])
+    return info
+
+
+@admin.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition of the emulator's metrics."""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@admin.get("/api/v2/emulator/startup")
+def get_startup(emulator: Emulator = Depends(get_emulator)):
+    """How long the app took to start, and which background services it runs."""
+    config = emulator.config
+    return {"started_in_ms": round(emulator.started_in * 1000, 2) if emulator.started_in is not None else None,
+            "host_ip": emulator.host_ip, "port": emulator.port, "mdns": config.mdns, "simulate": config.simulate,
+            "chargers": len(emulator.fleet)}
+
+
+@admin.get("/api/v2/emulator/chargers")
+def get_chargers(request: Request, emulator: Emulator = Depends(get_emulator)):
+    """Every charger and its slot states, one digit per slot indexing `states` — the UI's fleet view.
+
+    The ETag follows every charger's state version, so pollers get a 304
+    until something changed.
+    """
+    chargers = list(emulator.fleet)
+    etag = f'"{ETAG_EPOCH}-fleet-{len(chargers)}-{sum(c.version for c in chargers)}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    index = emulator.fleet.engine.index
+    digits = {state: str(code) for code, state in enumerate(SLOT_STATES)}
+    body = {"states": SLOT_STATES, "chargers": [
+        {"id": c.id, "port": c.port, "prefix": c.prefix, "version": c.version,
+         "slots": "".join(digits[state] for state in index.slot_states(c.row))} for c in chargers]}
+    return Response(json_bytes(body), media_type="application/json", headers={"ETag": etag})
+
+
+@admin.get("/api/v2/emulator/query")
+def query_fleet(slot_state: str = Query(default=None, alias="slotState"),
+                error_msg: str = Query(default=None, alias="errorMsg"),
+                battery_detected: str = Query(default=None, alias="batteryDetected"),
+                soc_min: float = Query(default=None, alias="socMin"), soc_max: float = Query(default=None, alias="socMax"),
+                limit: int = Query(default=None, ge=1), emulator: Emulator = Depends(get_emulator)):
+    """Slots across every charger matching every filter, e.g. ?slotState=error&errorMsg=overtemp
+
+    Answered from the engine's slot index, so the cost follows the number
+    of matches rather than the fleet size.
+    """
+    matches = emulator.fleet.query(None, soc_min, soc_max, limit, slotState=slot_state, errorMsg=error_msg,
+                                   batteryDetected=battery_detected)
+    return {"count": len(matches), "batteries": [{"charger": c.id, **b} for c, b in matches]}
+
+
+@admin.get("/api/v2/emulator/profile")
+def get_profile(charger: str = Query(default=None), emulator: Emulator = Depends(get_emulator)):
+    """The fleet default device profile and per-charger overrides, or one charger's effective profile."""
+    if charger is not None:
+        target = emulator.fleet.get(charger)
+        if target is None:
+            raise HTTPException(status_code=404, detail="Unknown charger")
+        return emulator.profile_for(target).to_dict()
+    return {"default": emulator.device_profile.to_dict(),
+            "overrides": {cid: p.to_dict() for cid, p in emulator.device_profiles.items()}}
+
+
+@admin.post("/api/v2/emulator/profile")
+async def set_profile(request: Request, charger: str = Query(default=None), emulator: Emulator = Depends(get_emulator)):
+    """Switch the device profile: {"preset": "firmware", "error_rate": 0.1, ...}
+
+    Applies to every charger, or only to `?charger=<id>`.
+    """
+    if charger is not None and emulator.fleet.get(charger) is None:
+        raise HTTPException(status_code=404, detail="Unknown charger")
+    try:
+        profile = Profile.from_dict(await request.json())
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid profile: {e}")
+    if charger is None:
+        emulator.device_profile = profile
+    else:
+        emulator.device_profiles[charger] = profile
+    emulator.events.info("profile.updated",
+                         f"🐢 Device profile for {'all chargers' if charger is None else 'charger ' + charger} updated",
+                         target=charger)
+    return profile.to_dict()
+
+
+@admin.delete("/api/v2/emulator/profile")
+def reset_profile(charger: str = Query(default=None), emulator: Emulator = Depends(get_emulator)):
+    """Drop a charger's override, or (without ?charger) reset the default to no shaping."""
+    if charger is None:
+        emulator.device_profile = Profile()
+    elif emulator.device_profiles.pop(charger, None) is None:
+        raise HTTPException(status_code=404, detail="No profile override for this charger")
+    return {"ok": True}
+
+
+@admin.post("/api/v2/emulator/checkpoint")
+async def save_checkpoint(emulator: Emulator = Depends(get_emulator)):
+    """Write the state snapshot now instead of waiting for the next periodic checkpoint."""
+    if emulator.checkpointer is None:
+        raise HTTPException(status_code=409, detail="Checkpointing is off (set KLVR_CHECKPOINT)")
+    return await asyncio.to_thread(emulator.checkpointer.save)
+
+
+@admin.get("/api/v2/emulator/record")
+def get_recording(emulator: Emulator = Depends(get_emulator)):
+    recorder = emulator.fleet.recorder
+    return {"recording": recorder is not None, **(recorder.info() if recorder is not None else {})}
+
+
+@admin.post("/api/v2/emulator/record")
+async def start_recording(request: Request, emulator: Emulator = Depends(get_emulator)):
+    """Start logging every slot change and simulation step: {"path": "scenario.klvrlog"}"""
+    try:
+        data = await request.json()
+        recorder = Recorder(str(data["path"]), emulator.clock)
+    except (ValueError, KeyError, TypeError, AttributeError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid recording: {e}")
+    try:
+        emulator.fleet.start_recording(recorder)
+    except ValueError as e:
+        recorder.close()
+        raise HTTPException(status_code=409, detail=str(e))
+    emulator.events.info("record.started", f"⏺ Recording state changes to {recorder.path}", path=recorder.path)
+    return recorder.info()
+
+
+@admin.post("/api/v2/emulator/record/stop")
+def stop_recording(emulator: Emulator = Depends(get_emulator)):
+    recorder = emulator.fleet.stop_recording()
+    if recorder is None:
+        raise HTTPException(status_code=409, detail="Not recording")
+    emulator.events.info("record.stopped", f"⏹ Recording saved to {recorder.path} ({recorder.records} records)",
+                         path=recorder.path, records=recorder.records)
+    return {"path": recorder.path, "records": recorder.records}
+
+
+@admin.post("/api/v2/emulator/replay")
+async def replay_recording(request: Request, emulator: Emulator = Depends(get_emulator)):
+    """Replay a recording: {"path": ..., "speed": null | 10, "charger": "3"}
+
+    `speed` null replays as fast as possible; `charger` replays every record
+    into that one charger instead of the recorded ones. Switches the clock to
+    manual.
+    """
+    try:
+        data = await request.json()
+        path = str(data["path"])
+        speed = data.get("speed")
+        speed = float(speed) if speed is not None else None
+        into = None
+        if data.get("charger") is not None:
+            into = emulator.fleet.get(str(data["charger"]))
+            if into is None:
+                raise HTTPException(status_code=404, detail="Unknown charger")
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid replay: {e}")
+    try:
+        result = await asyncio.to_thread(replay, emulator.fleet, path, speed, into, emulator.notify_state_change)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Replay failed: {e}")
+    emulator.events.info("record.replayed", f"⏯ Replayed {path}: {result['applied']} records in {result['real_seconds']}s",
+                         path=path, **result)
+    return result
+
+
+@admin.get("/api/v2/emulator/clock")
+def get_clock(emulator: Emulator = Depends(get_emulator)):
+    return emulator.clock.info()
+
+
+@admin.post("/api/v2/emulator/clock")
+async def set_clock(request: Request, emulator: Emulator = Depends(get_emulator)):
+    """Switch the simulated clock: {"mode": "real" | "scaled" | "manual", "scale": 100}"""
+    clock = emulator.clock
+    try:
+        data = await request.json()
+        mode = data.get("mode", "scaled" if "scale" in data else "real")
+        scale = data.get("scale")
+        clock.set_mode(mode, float(scale) if scale is not None else None)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid clock setting: {e}")
+    emulator.events.info("clock.set", f"⏱ Clock set to {clock.mode} (scale {clock.scale:g})", mode=clock.mode,
+                         scale=clock.scale)
+    return clock.info()
+
+
+@admin.post("/api/v2/emulator/clock/advance")
+async def advance_clock(request: Request, emulator: Emulator = Depends(get_emulator)):
+    """Step simulated time by hand: {"seconds": 7200}"""
+    try:
+        data = await request.json()
+        seconds = float(data.get("seconds", 0))
+        changed = emulator.fleet.advance(seconds)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid advance: {e}")
+    for charger in changed:
+        emulator.notify_state_change(charger)
+    return emulator.clock.info()
+
+
+@router.get("/", response_class=HTMLResponse)
+def ui(charger: Charger = Depends(get_charger)):
+    return (ROOT / "templates" / "index.html").read_text().replace("__API_BASE__", charger.prefix)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    emulator = app.state.emulator
+    await emulator.start()
+    try:
+        yield
+    finally:
+        await emulator.stop()
+
+
+def create_app(config: Config | None = None) -> FastAPI:
+    """Build an emulator app; `config` defaults to the KLVR_* environment.
+
+    Nothing runs until the ASGI startup event, so building (or importing)
+    an app is cheap and several can live in one process.
+    """
+    app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+    app.state.emulator = Emulator(config if config is not None else Config.from_env())
+    app.middleware("http")(add_cors)
+    # Outside add_cors so injected failures never reach the app, inside metrics so they are measured
+    app.add_middleware(DeviceProfileMiddleware, resolve=app.state.emulator.resolve_device)
+    # Outermost, so request latency includes the CORS middleware
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(admin)
+    app.include_router(router)
+    app.include_router(router, prefix="/chargers/{charger_id}")
+    app.mount("/static", StaticFiles(directory=ROOT / "static"), name="static")
+    return app
+
+
+# Module-level app for `uvicorn klvr_emulator.main:app`, and its state under
+# the names existing callers use; built from the environment on first access
+_ALIASES = {
+    "fleet": lambda e: e.fleet,
+    "clock": lambda e: e.clock,
+    "default_charger": lambda e: e.default_charger,
+    "charger_state": lambda e: e.default_charger.state,
+    "firmware_state": lambda e: e.default_charger.firmware,
+    "ws_clients": lambda e: e.default_charger.ws_clients,
+}
+
+
+def __getattr__(name: str):
+    global app
+    if name == "app":
+        app = create_app()
+        return app
+    if name in _ALIASES:
+        return _ALIASES[name](__getattr__("app").state.emulator)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
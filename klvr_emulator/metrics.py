@@ -0,0 +1,244 @@
+"""Prometheus-style metrics, cheap enough to leave on under full load.
+
+Hand-rolled rather than a client library: a counter increment is one dict
+lookup and an add, a histogram observation a bisect into fixed buckets.
+Nothing is locked — every series is written from one thread (the event
+loop or the simulation thread), and a scrape reading a value mid-update
+is off by one at worst. Values owned elsewhere (client counts, scheduler
+stats) are read through callbacks at scrape time instead of mirrored.
+"""
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 8192, 16384, 65536, 262144)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """Yield (suffix, label names, label values, value)."""
+        for values, child in list(self._children.items()):
+            yield "", self.labelnames, values, child.value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_label_text(names, values)} {_number(value)}")
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("target", "start")
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self.start)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS,
+                 registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        names = self.labelnames + ("le",)
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += n
+                yield "_bucket", names, values + (_number(float(bound)),), cumulative
+            yield "_sum", self.labelnames, values, child.sum
+            yield "_count", self.labelnames, values, child.count
+
+
+class CallbackMetric(Metric):
+    """A counter or gauge whose value is read at scrape time.
+
+    `read()` returns a number, or a dict of label-value tuples to numbers.
+    """
+
+    def __init__(self, name: str, help: str, read, kind: str = "gauge", labelnames: tuple = (), registry=None):
+        self.read = read
+        self.kind = kind
+        super().__init__(name, help, labelnames, registry)
+
+    def samples(self):
+        value = self.read()
+        if isinstance(value, dict):
+            for values, v in value.items():
+                yield "", self.labelnames, values, v
+        else:
+            yield "", (), (), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Emulator metrics. Callback metrics that need the app's fleet and
+# scheduler are registered by main.py.
+HTTP_REQUEST_SECONDS = Histogram(
+    "klvr_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route", "status"))
+WS_BROADCAST_SECONDS = Histogram(
+    "klvr_ws_broadcast_duration_seconds", "Time to serialize and enqueue one charger's WebSocket push.")
+WS_BROADCAST_BYTES = Histogram(
+    "klvr_ws_broadcast_bytes", "Size of pushed WebSocket frames.", ("kind",), buckets=SIZE_BUCKETS)
+WS_CLIENTS_PRUNED = Counter(
+    "klvr_ws_clients_pruned_total", "WebSocket clients dropped after a failed send.")
+TICK_DURATION_SECONDS = Histogram(
+    "klvr_tick_duration_seconds", "Duration of one simulation step over the whole fleet.")
+TICK_DRIFT_SECONDS = Histogram(
+    "klvr_tick_drift_seconds", "How late the simulation thread woke for a timed tick.")
+LOOP_LAG_SECONDS = Histogram(
+    "klvr_event_loop_lag_seconds", "How late the event loop ran a callback (sampled every 100 ms).")
+FIRMWARE_BYTES = Counter(
+    "klvr_firmware_bytes_total", "Firmware image bytes received.", ("board",))
+FIRMWARE_UPLOADS = Counter(
+    "klvr_firmware_uploads_total", "Firmware uploads by outcome.", ("board", "result"))
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware timing HTTP requests, labelled by the matched route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], path, status).observe(time.perf_counter() - start)
@@ -0,0 +1,166 @@
+"""Slot operations shared by the per-slot endpoints and the batch endpoint.
+
+An operation is validated into plain arguments first and applied later, so
+a batch can be rejected as a whole before any slot changes. Applying writes
+the engine without bumping the charger's state version; the caller does one
+`touch()` when it is done.
+"""
+import math
+from klvr_emulator.engine import EMPTY_SLOT, FULL_CHARGE_SECONDS, NUM_SLOTS
+
+VALID_ERROR_TYPES = {"overtemp", "undertemp", "overcurrent", "faulty", "detect_err"}
+MAX_BATCH_OPS = 1024
+
+
+class OpError(ValueError):
+    """An operation failed validation; `index` is its position in the batch."""
+
+    def __init__(self, message: str, index: int | None = None):
+        super().__init__(message)
+        self.index = index
+
+
+def insert_fields(battery_type: str) -> dict:
+    # Recovery: cold/warm batteries transition back to charging on re-insert
+    return {"slotState": "charging", "stateOfChargePercent": 5.0,
+            "timeRemainingSeconds": FULL_CHARGE_SECONDS, "batteryDetected": battery_type, "errorMsg": ""}
+
+
+def charge_fields(slot_state: str, percentage: float) -> dict:
+    """Fields for a manual set_charge, given the slot's current state."""
+    fields = {"stateOfChargePercent": percentage}
+    if slot_state == "charging" and percentage < 100:
+        remaining_charge_needed = max(0, 100.0 - percentage)
+        total_charge_range = 95.0
+        fields["timeRemainingSeconds"] = int((remaining_charge_needed / total_charge_range) * FULL_CHARGE_SECONDS)
+    elif percentage >= 100:
+        fields["slotState"] = "done"
+        fields["timeRemainingSeconds"] = 0
+    elif slot_state == "empty":
+        fields["timeRemainingSeconds"] = 0
+    return fields
+
+
+def _slot(op: dict) -> int:
+    slot = op.get("slot")
+    if isinstance(slot, bool) or not isinstance(slot, int):
+        raise OpError("slot must be an integer")
+    if slot < 0 or slot >= NUM_SLOTS:
+        raise OpError("Invalid slot number")
+    return slot
+
+
+def _validate_insert(op: dict) -> dict:
+    battery_type = op.get("type")
+    if not isinstance(battery_type, str) or not battery_type:
+        raise OpError("type must be a non-empty string")
+    return {"slot": _slot(op), "type": battery_type}
+
+
+def _validate_slot(op: dict) -> dict:
+    return {"slot": _slot(op)}
+
+
+def _validate_error(op: dict) -> dict:
+    slot = _slot(op)
+    if op.get("type") not in VALID_ERROR_TYPES:
+        raise OpError(f"Invalid error type. Must be one of: {', '.join(sorted(VALID_ERROR_TYPES))}")
+    return {"slot": slot, "type": op["type"]}
+
+
+def _validate_charge(op: dict) -> dict:
+    slot = _slot(op)
+    percentage = op.get("percentage")
+    if isinstance(percentage, bool) or not isinstance(percentage, (int, float)) or not math.isfinite(percentage):
+        raise OpError("Invalid percentage value")
+    if percentage < 0 or percentage > 100:
+        raise OpError("Percentage must be between 0 and 100")
+    return {"slot": slot, "percentage": float(percentage)}
+
+
+def _validate_none(op: dict) -> dict:
+    return {}
+
+
+def _apply_insert(charger, args):
+    charger.write_slot(args["slot"], insert_fields(args["type"]))
+
+
+def _apply_eject(charger, args):
+    charger.write_slot(args["slot"], EMPTY_SLOT)
+
+
+def _apply_cold(charger, args):
+    charger.write_slot(args["slot"], {"slotState": "cold", "errorMsg": "cold"})
+
+
+def _apply_warm(charger, args):
+    charger.write_slot(args["slot"], {"slotState": "warm", "errorMsg": "warm"})
+
+
+def _apply_error(charger, args):
+    charger.write_slot(args["slot"], {"slotState": "error", "errorMsg": args["type"]})
+
+
+def _apply_charge(charger, args):
+    slot = args["slot"]
+    charger.write_slot(slot, charge_fields(charger.battery(slot)["slotState"], args["percentage"]))
+
+
+def _apply_clear(charger, args):
+    for slot in range(NUM_SLOTS):
+        charger.write_slot(slot, EMPTY_SLOT)
+
+
+# op name -> (validate(op) -> args, apply(charger, args))
+OPS = {
+    "insert": (_validate_insert, _apply_insert),
+    "eject": (_validate_slot, _apply_eject),
+    "set_cold": (_validate_slot, _apply_cold),
+    "set_warm": (_validate_slot, _apply_warm),
+    "set_error": (_validate_error, _apply_error),
+    "set_charge": (_validate_charge, _apply_charge),
+    "bulk_clear": (_validate_none, _apply_clear),
+}
+
+
+def validate_op(op) -> tuple[str, dict]:
+    if not isinstance(op, dict):
+        raise OpError("operation must be an object")
+    name = op.get("op")
+    if name not in OPS:
+        raise OpError(f"Invalid op. Must be one of: {', '.join(OPS)}")
+    return name, OPS[name][0](op)
+
+
+def validate_batch(ops) -> list[tuple[str, dict]]:
+    """Validate every operation; the first failure raises OpError carrying its index."""
+    if not isinstance(ops, list):
+        raise OpError("ops must be a list")
+    if len(ops) > MAX_BATCH_OPS:
+        raise OpError(f"Too many operations (max {MAX_BATCH_OPS})")
+    validated = []
+    for index, op in enumerate(ops):
+        try:
+            validated.append(validate_op(op))
+        except OpError as e:
+            raise OpError(f"ops[{index}]: {e}", index) from None
+    return validated
+
+
+def apply_op(charger, name: str, args: dict):
+    OPS[name][1](charger, args)
+
+
+def apply_slot_op(charger, op: dict):
+    """Validate and apply one operation for a per-slot endpoint, then bump the state version."""
+    name, args = validate_op(op)
+    apply_op(charger, name, args)
+    charger.touch()
+
+
+def apply_batch(charger, ops: list[tuple[str, dict]]):
+    """Apply validated operations in order, then bump the state version once."""
+    for name, args in ops:
+        apply_op(charger, name, args)
+    charger.touch()
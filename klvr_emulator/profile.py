@@ -0,0 +1,248 @@
+"""Device performance profiles: make the emulator answer like the real hardware.
+
+The charger firmware serves HTTP from a microcontroller with a handful of
+concurrent connections and slow responses. A Profile reproduces that per
+emulated device:
+
+  max_connections    concurrent requests in flight (0: unlimited); extra
+                     requests wait in a queue (overflow "queue", up to
+                     queue_limit for queue_timeout seconds) or get 503 at
+                     once (overflow "refuse")
+  latency            per-endpoint response delay distributions, keyed by
+                     glob on the charger-relative path, "*" as fallback:
+                       {"fixed_ms": 40}
+                       {"uniform_ms": [20, 200]}
+                       {"normal_ms": [80, 20]}        mean, stddev
+                       {"lognormal_ms": [60, 0.5]}    median, sigma
+  upload_bytes_per_second
+                     firmware upload bandwidth cap, in bytes per simulated
+                     second like KLVR_FIRMWARE_THROUGHPUT
+  error_rate, error_status
+                     fraction of requests answered with an injected 5xx
+  reset_rate         fraction of requests whose connection is dropped
+                     mid-response
+
+Only the device API (/api/v2/..., not /api/v2/emulator/...) is affected, so
+the admin endpoints stay usable whatever the profile. Latency and queue
+timeouts are wall-clock time: they model the network, not the simulation.
+The upload cap paces the transfer on the simulated clock instead, so a
+scaled clock speeds up firmware updates as a whole.
+"""
+import asyncio
+import json
+import math
+import random
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from fnmatch import fnmatchcase
+from klvr_emulator.metrics import Counter
+
+OVERFLOW_POLICIES = ("queue", "refuse")
+
+PROFILE_EVENTS = Counter(
+    "klvr_profile_events_total", "Requests delayed, refused or failed by the device profile.", ("event",))
+
+# Named starting points for KLVR_PROFILE / the admin endpoint
+PRESETS = {
+    "instant": {},
+    "firmware": {
+        "max_connections": 4,
+        "overflow": "queue",
+        "latency": {
+            "/api/v2/charger/status": {"lognormal_ms": [60, 0.4]},
+            "/api/v2/device/firmware_*": {"uniform_ms": [100, 300]},
+            "*": {"lognormal_ms": [30, 0.4]},
+        },
+        "upload_bytes_per_second": 50_000,
+    },
+    "flaky": {
+        "max_connections": 2,
+        "overflow": "refuse",
+        "latency": {"*": {"lognormal_ms": [80, 0.8]}},
+        "error_rate": 0.05,
+        "reset_rate": 0.02,
+    },
+}
+
+
+def _sampler(spec: dict):
+    """Build a `sample(rng) -> seconds` function from a latency spec."""
+    if not isinstance(spec, dict) or len(spec) != 1:
+        raise ValueError(f"Invalid latency spec: {spec!r}")
+    (kind, value), = spec.items()
+    if kind == "fixed_ms":
+        ms = float(value)
+        return lambda rng: ms / 1000
+    a, b = (float(v) for v in value)
+    if kind == "uniform_ms":
+        return lambda rng: rng.uniform(a, b) / 1000
+    if kind == "normal_ms":
+        return lambda rng: max(0.0, rng.gauss(a, b)) / 1000
+    if kind == "lognormal_ms":
+        mu = math.log(a)
+        return lambda rng: rng.lognormvariate(mu, b) / 1000
+    raise ValueError(f"Invalid latency distribution: {kind}")
+
+
+@dataclass
+class Profile:
+    max_connections: int = 0
+    overflow: str = "queue"
+    queue_limit: int = 16
+    queue_timeout: float = 10.0
+    latency: dict = field(default_factory=dict)
+    upload_bytes_per_second: float = 0
+    error_rate: float = 0.0
+    error_status: int = 500
+    reset_rate: float = 0.0
+    seed: int | None = None
+
+    def __post_init__(self):
+        if self.overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy. Must be one of: {', '.join(OVERFLOW_POLICIES)}")
+        if not 0 <= self.error_rate <= 1 or not 0 <= self.reset_rate <= 1:
+            raise ValueError("error_rate and reset_rate must be between 0 and 1")
+        if not 500 <= self.error_status <= 599:
+            raise ValueError("error_status must be a 5xx status")
+        if self.max_connections < 0 or self.queue_limit < 0 or self.queue_timeout < 0 or self.upload_bytes_per_second < 0:
+            raise ValueError("Limits must not be negative")
+        self._samplers = [(pattern, _sampler(spec)) for pattern, spec in self.latency.items()]
+        self.rng = random.Random(self.seed)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Profile":
+        if not isinstance(data, dict):
+            raise ValueError("Profile must be an object")
+        data = dict(data)
+        preset = data.pop("preset", None)
+        if preset is not None:
+            if preset not in PRESETS:
+                raise ValueError(f"Invalid preset. Must be one of: {', '.join(PRESETS)}")
+            data = {**PRESETS[preset], **data}
+        unknown = set(data) - set(cls.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"Unknown profile fields: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @property
+    def inert(self) -> bool:
+        return not (self.max_connections or self._samplers or self.error_rate or self.reset_rate)
+
+    def delay(self, path: str) -> float:
+        for pattern, sample in self._samplers:
+            if pattern != "*" and fnmatchcase(path, pattern):
+                return sample(self.rng)
+        for pattern, sample in self._samplers:
+            if pattern == "*":
+                return sample(self.rng)
+        return 0.0
+
+
+def load_profile(spec: str | None) -> Profile:
+    """KLVR_PROFILE: a preset name, a JSON file path, or unset for no shaping."""
+    if not spec:
+        return Profile()
+    if spec in PRESETS:
+        return Profile.from_dict({"preset": spec})
+    with open(spec) as f:
+        return Profile.from_dict(json.load(f))
+
+
+class _Gate:
+    """Concurrent-request limit for one device, handing slots to queued requests in order."""
+
+    def __init__(self):
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self, profile: Profile) -> bool:
+        if self.active < profile.max_connections and not self.waiters:
+            self.active += 1
+            return True
+        if profile.overflow == "refuse" or len(self.waiters) >= profile.queue_limit:
+            return False
+        PROFILE_EVENTS.labels("queued").inc()
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters.append(fut)
+        try:
+            async with asyncio.timeout(profile.queue_timeout):
+                await fut
+            return True
+        except TimeoutError:
+            # release() may have handed over the slot just as the wait timed out
+            return fut.done() and not fut.cancelled()
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # handed a slot, but the request is gone: pass it on
+            raise
+        finally:
+            if fut in self.waiters:
+                self.waiters.remove(fut)
+
+    def release(self):
+        while self.waiters:
+            fut = self.waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)  # the slot passes straight to the next waiter
+                return
+        self.active -= 1
+
+
+class DeviceProfileMiddleware:
+    """Plain ASGI middleware applying each charger's Profile to its device API requests.
+
+    `resolve(scope)` returns (device key, charger-relative path, Profile), or
+    None for requests the profile does not apply to.
+    """
+
+    def __init__(self, app, resolve):
+        self.app = app
+        self.resolve = resolve
+        self.gates: dict = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        resolved = self.resolve(scope)
+        if resolved is None or resolved[2].inert:
+            return await self.app(scope, receive, send)
+        key, path, profile = resolved
+        gate = None
+        if profile.max_connections:
+            gate = self.gates.setdefault(key, _Gate())
+            if not await gate.acquire(profile):
+                PROFILE_EVENTS.labels("refused").inc()
+                return await _respond(send, 503, "Device busy")
+        try:
+            delay = profile.delay(path)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            roll = profile.rng.random()
+            if roll < profile.reset_rate:
+                PROFILE_EVENTS.labels("reset").inc()
+                return await _reset(send)
+            if roll < profile.reset_rate + profile.error_rate:
+                PROFILE_EVENTS.labels("error").inc()
+                return await _respond(send, profile.error_status, "Injected device fault")
+            await self.app(scope, receive, send)
+        finally:
+            if gate is not None:
+                gate.release()
+
+
+async def _respond(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                            (b"access-control-allow-origin", b"*")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _reset(send):
+    """Start a response and abandon it; the server then closes the connection mid-body."""
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", b"4096")]})
+    await send({"type": "http.response.body", "body": b"{", "more_body": True})
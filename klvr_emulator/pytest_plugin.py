@@ -0,0 +1,64 @@
+"""pytest fixtures for testing clients against an in-process emulator.
+
+Enable it in a conftest.py (or with `-p klvr_emulator.pytest_plugin`):
+
+    pytest_plugins = ["klvr_emulator.pytest_plugin"]
+
+    @pytest.mark.anyio
+    async def test_insert(klvr):
+        response = await klvr.client.post("/api/v2/charger/insert/0?type=AA")
+        assert response.status_code == 200
+
+`klvr` is a started klvr_emulator.testing.EmulatorHarness, new for every
+test. Override `klvr_config` to change its settings:
+
+    @pytest.fixture
+    def klvr_config():
+        return harness_config(engine="array", seed=1)
+
+Async tests run through anyio's pytest plugin (installed with starlette),
+on asyncio. Loaded with `-p`, this plugin registers before anyio's, whose
+`anyio_backend` fixture then wins and parametrizes tests over every
+installed backend; the non-asyncio copies of tests using `klvr` are
+deselected, so those run on asyncio either way (other tests are left
+alone). No ports, files or environment variables are used, so tests
+parallelize freely under pytest-xdist.
+"""
+import pytest
+from klvr_emulator.testing import EmulatorHarness, harness_config
+
+
+def _backend_name(item) -> str | None:
+    callspec = getattr(item, "callspec", None)
+    backend = callspec.params.get("anyio_backend") if callspec is not None else None
+    return backend[0] if isinstance(backend, tuple) else backend
+
+
+def pytest_collection_modifyitems(config, items):
+    """Drop the trio (or other non-asyncio) copies of `klvr` tests that anyio's `anyio_backend` makes."""
+    keep, drop = [], []
+    for item in items:
+        uses_klvr = "klvr" in getattr(item, "fixturenames", ())
+        (drop if uses_klvr and _backend_name(item) not in (None, "asyncio") else keep).append(item)
+    if drop:
+        config.hook.pytest_deselected(items=drop)
+        items[:] = keep
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def klvr_config():
+    """The Config each `klvr` harness is built with."""
+    return harness_config()
+
+
+@pytest.fixture
+async def klvr(klvr_config, anyio_backend):
+    if anyio_backend != "asyncio":
+        pytest.skip("the emulator runs on asyncio")
+    async with EmulatorHarness(klvr_config) as harness:
+        yield harness
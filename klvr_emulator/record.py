@@ -0,0 +1,254 @@
+"""Deterministic recording and replay of slot state.
+
+A recording is an append-only binary log of everything that changes slot
+state: every field written through `Charger.write_slot` (HTTP handlers,
+batches, bulk_insert's random draws) and every simulation step with its
+exact `dt`. Steps are deterministic given the state and `dt`, so replaying
+the log rebuilds the same slots bit for bit, whichever thread or task
+produced the changes originally. A log starts with a snapshot of every
+slot, so it does not depend on the state it was recorded from.
+
+Layout: the 8-byte magic, then records of a 1-byte kind and a float64
+simulated timestamp followed by
+
+  CHARGER  uint16 index, uint8 length, id (utf-8)     first use of a charger
+  STEP     float64 dt                                 one simulation step
+  SET      uint16 charger, uint8 slot, uint8 count, then count × (uint8 field,
+           value: float64, int64, or uint16 length + utf-8 by field) —
+           one write_slot() call, applied as one engine update
+  CARRY    float64 fractional second pending in the dict engine (snapshot only)
+
+    python -m klvr_emulator.record info scenario.klvrlog
+    python -m klvr_emulator.record replay scenario.klvrlog --engine array > final.json
+"""
+import struct
+import threading
+import time
+from klvr_emulator.engine import NUM_SLOTS
+
+MAGIC = b"KLVRREC1"
+
+CHARGER, STEP, SET, CARRY = 1, 2, 3, 4
+
+# field name -> struct code of its value ("s": length-prefixed string)
+FIELDS = (
+    ("batteryBayTempC", "d"),
+    ("slotState", "s"),
+    ("stateOfChargePercent", "d"),
+    ("timeRemainingSeconds", "q"),
+    ("errorMsg", "s"),
+    ("batteryDetected", "s"),
+)
+FIELD_CODES = {name: (code, kind) for code, (name, kind) in enumerate(FIELDS)}
+
+_HEAD = struct.Struct("<Bd")
+_CHARGER = struct.Struct("<HB")
+_STEP = struct.Struct("<d")
+_SET = struct.Struct("<HBB")
+_FIELD = struct.Struct("<B")
+_VALUES = {"d": struct.Struct("<d"), "q": struct.Struct("<q"), "s": struct.Struct("<H")}
+
+
+class Recorder:
+    """Appends state transitions to a log file; attach with Fleet.start_recording()."""
+
+    def __init__(self, path: str, clock):
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()  # orders log records exactly as they are applied
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.ids: dict[str, int] = {}
+        self.records = 0
+        self.started = clock.now()
+
+    def _charger(self, t: float, charger_id: str) -> int:
+        index = self.ids.get(charger_id)
+        if index is None:
+            index = self.ids[charger_id] = len(self.ids)
+            encoded = charger_id.encode("utf-8")
+            self.file.write(_HEAD.pack(CHARGER, t) + _CHARGER.pack(index, len(encoded)) + encoded)
+            self.records += 1
+        return index
+
+    def set(self, charger, slot: int, fields: dict):
+        """Log a slot write. Caller holds `lock` around the write and this call."""
+        t = self.clock.now()
+        index = self._charger(t, charger.id)
+        out = [_HEAD.pack(SET, t), _SET.pack(index, slot, len(fields))]
+        for name, value in fields.items():
+            code, kind = FIELD_CODES[name]
+            out.append(_FIELD.pack(code))
+            if kind == "s":
+                encoded = value.encode("utf-8")
+                out.append(_VALUES["s"].pack(len(encoded)) + encoded)
+            elif kind == "q":
+                out.append(_VALUES["q"].pack(int(value)))
+            else:
+                out.append(_VALUES["d"].pack(value))
+        self.file.write(b"".join(out))
+        self.records += 1
+
+    def step(self, dt: float):
+        """Log a simulation step. Caller holds `lock` around the step and this call."""
+        self.file.write(_HEAD.pack(STEP, self.clock.now()) + _STEP.pack(dt))
+        self.records += 1
+
+    def snapshot(self, engine, chargers):
+        """Log the full state of `chargers` so the log replays from empty slots."""
+        with self.lock:
+            if hasattr(engine, "carry"):
+                self.file.write(_HEAD.pack(CARRY, self.clock.now()) + _STEP.pack(engine.carry))
+                self.records += 1
+            for charger in chargers:
+                for slot, battery in enumerate(charger.batteries()):
+                    self.set(charger, slot, {name: battery[name] for name, _ in FIELDS})
+
+    def info(self) -> dict:
+        return {"path": self.path, "records": self.records, "bytes": self.file.tell(),
+                "seconds": round(self.clock.now() - self.started, 3)}
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_log(path: str):
+    """Yield (kind, t, charger_id, slot, fields, dt) for every STEP/SET/CARRY record."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a KLVR recording")
+    ids: dict[int, str] = {}
+    pos = len(MAGIC)
+    end = len(data)
+    while pos < end:
+        kind, t = _HEAD.unpack_from(data, pos)
+        pos += _HEAD.size
+        if kind in (STEP, CARRY):
+            (dt,) = _STEP.unpack_from(data, pos)
+            pos += _STEP.size
+            yield kind, t, None, None, None, dt
+        elif kind == SET:
+            index, slot, count = _SET.unpack_from(data, pos)
+            pos += _SET.size
+            fields = {}
+            for _ in range(count):
+                name, value_kind = FIELDS[data[pos]]
+                pos += _FIELD.size
+                (value,) = _VALUES[value_kind].unpack_from(data, pos)
+                pos += _VALUES[value_kind].size
+                if value_kind == "s":
+                    value, pos = data[pos:pos + value].decode("utf-8"), pos + value
+                fields[name] = value
+            yield SET, t, ids[index], slot, fields, None
+        elif kind == CHARGER:
+            index, length = _CHARGER.unpack_from(data, pos)
+            pos += _CHARGER.size
+            ids[index] = data[pos:pos + length].decode("utf-8")
+            pos += length
+        else:
+            raise ValueError(f"Corrupt recording at byte {pos - _HEAD.size}")
+
+
+def replay(fleet, path: str, speed: float | None = None, into=None, on_change=None) -> dict:
+    """Feed a recording into `fleet`.
+
+    `speed` None replays as fast as possible, otherwise at `speed` × the
+    recorded pace. `into` replays every charger's records into that one
+    charger. The fleet's clock is switched to manual and advanced to each
+    record's (relative) timestamp, so time-derived state matches too.
+    `on_change(charger)` is called once per charger per changed record batch.
+    """
+    clock = fleet.clock
+    clock.set_mode("manual")
+    base = clock.now()
+    start_real = time.monotonic()
+    first = None
+    applied = skipped = 0
+    pending = set()
+    for kind, t, charger_id, slot, fields, dt in read_log(path):
+        if first is None:
+            first = t
+        offset = t - first
+        if speed:
+            delay = start_real + offset / speed - time.monotonic()
+            if delay > 0:
+                _flush(pending, on_change)
+                time.sleep(delay)
+        with fleet.lock:
+            target = base + offset
+            if target > clock.now():
+                clock.advance(target - clock.now())
+            fleet.last_tick = clock.now()  # the live loop steps nothing extra
+            if kind == CARRY:
+                if hasattr(fleet.engine, "carry"):
+                    fleet.engine.carry = dt
+            elif kind == STEP:
+                for row in fleet.engine.step(dt):
+                    charger = fleet.by_row.get(row)
+                    if charger is not None:
+                        charger.touch()
+                        pending.add(charger)
+            else:
+                charger = into if into is not None else fleet.get(charger_id)
+                if charger is None or slot >= NUM_SLOTS:
+                    skipped += 1
+                    continue
+                charger.write_slot(slot, fields)
+                charger.touch()
+                pending.add(charger)
+        applied += 1
+    _flush(pending, on_change)
+    return {"applied": applied, "skipped": skipped, "seconds": round(clock.now() - base, 3),
+            "real_seconds": round(time.monotonic() - start_real, 3)}
+
+
+def _flush(pending: set, on_change):
+    if on_change is not None:
+        for charger in pending:
+            on_change(charger)
+    pending.clear()
+
+
+def _main(argv=None) -> int:
+    import argparse
+    import json
+    from klvr_emulator.charger import Fleet
+    from klvr_emulator.clock import Clock
+    from klvr_emulator.engine import make_engine
+
+    parser = argparse.ArgumentParser(prog="python -m klvr_emulator.record", description="KLVR state recordings")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="summarize a recording")
+    info.add_argument("log")
+    rep = sub.add_parser("replay", help="replay into a fresh fleet and print the final status of every charger")
+    rep.add_argument("log")
+    rep.add_argument("--engine", choices=("dict", "array", "event"), default="dict")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        counts = {STEP: 0, SET: 0, CARRY: 0}
+        chargers, first, last = set(), None, None
+        for kind, t, charger_id, *_ in read_log(args.log):
+            counts[kind] += 1
+            if charger_id is not None:
+                chargers.add(charger_id)
+            first = t if first is None else first
+            last = t
+        print(json.dumps({"chargers": len(chargers), "steps": counts[STEP], "sets": counts[SET],
+                          "seconds": round((last or 0) - (first or 0), 3)}))
+        return 0
+
+    clock = Clock(manual=True)
+    fleet = Fleet(make_engine(args.engine, clock), clock)
+    ids = {charger_id for _, _, charger_id, *_ in read_log(args.log) if charger_id is not None}
+    for charger_id in sorted(ids):
+        fleet.new_charger(charger_id, "127.0.0.1")
+    replay(fleet, args.log)
+    print(json.dumps({c.id: c.status() for c in fleet}))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
@@ -0,0 +1,166 @@
+"""A sampling profiler over every thread, and an event-loop lag monitor.
+
+The profiler is one background thread that, every `interval` seconds,
+reads the current stack of each thread in the process (the event loop,
+the simulation thread, the thread pool running sync endpoints, the event
+writer) and counts it. Nothing is traced or patched, so the cost is one
+stack walk per thread per sample, lost in the noise at the default 100 Hz.
+The sampler needs the GIL like any thread: while another thread holds it,
+a sample waits for the next switch (every 5 ms). It runs for a fixed
+window, never more than MAX_PROFILE_SECONDS, and the result is in the
+collapsed format flamegraph.pl, speedscope and inferno read, one line per
+distinct stack:
+
+    MainThread;run (asyncio/base_events.py:...);...;ws_broadcast (klvr_emulator/main.py:265) 42
+
+Frames are functions, not lines, so a flame graph merges a function's
+calls. Idle threads show up waiting (in select(), Event.wait() and the
+like); filter them out with `thread=`.
+
+The lag monitor is a task on the event loop that sleeps LAG_INTERVAL and
+records how much later than scheduled it woke up. That is how long any
+callback or request had to wait for the loop, and it feeds the
+klvr_event_loop_lag_seconds histogram.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+SAMPLE_INTERVAL = 0.01       # 100 Hz
+MIN_SAMPLE_INTERVAL = 0.001
+PROFILE_SECONDS = 30.0
+MAX_PROFILE_SECONDS = 300.0
+MAX_STACKS = 20000           # distinct stacks kept; later new ones are counted as "[other]"
+LAG_INTERVAL = 0.1
+
+
+def _frame_label(code) -> str:
+    """`function (package/module.py:line)`: the last two path parts keep labels short but unambiguous."""
+    path = code.co_filename.replace(os.sep, "/").rsplit("/", 2)
+    return f"{code.co_qualname} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+class Sampler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stacks: Counter[str] = Counter()
+        self.threads: Counter[str] = Counter()  # samples per thread name
+        self.samples = 0
+        self.interval = SAMPLE_INTERVAL
+        self.seconds = 0.0
+        self.started: float | None = None  # wall-clock time
+        self.elapsed = 0.0
+        self._labels: dict = {}  # code object -> frame label
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float = PROFILE_SECONDS, interval: float = SAMPLE_INTERVAL):
+        """Sample every thread for `seconds`, discarding the previous profile."""
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            raise ValueError(f"Profile length must be between 0 and {MAX_PROFILE_SECONDS:g} seconds")
+        if not MIN_SAMPLE_INTERVAL <= interval <= seconds:
+            raise ValueError(f"Sample interval must be between {MIN_SAMPLE_INTERVAL:g} s and the profile length")
+        with self.lock:
+            if self.running:
+                raise RuntimeError("Already profiling")
+            self.stacks.clear()
+            self.threads.clear()
+            self.samples = 0
+            self.interval = interval
+            self.seconds = seconds
+            self.started = time.time()
+            self.elapsed = 0.0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+            self._thread.start()
+
+    def stop(self):
+        """End the profile early; the samples taken so far are kept."""
+        thread = self._thread
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names: dict[int, str] = {}
+        labels = self._labels
+        begin = time.monotonic()
+        deadline = begin + self.seconds
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if not names.keys() >= frames.keys():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            sampled = []
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                name = names.get(ident, f"thread-{ident}")
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = _frame_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(name)
+                sampled.append((name, ";".join(reversed(stack))))
+            frames = frame = None  # don't keep the threads' frames alive between samples
+            with self.lock:
+                for name, stack in sampled:
+                    if stack not in self.stacks and len(self.stacks) >= MAX_STACKS:
+                        stack = f"{name};[other]"
+                    self.stacks[stack] += 1
+                    self.threads[name] += 1
+                self.samples += 1
+                self.elapsed = time.monotonic() - begin
+            if time.monotonic() >= deadline:
+                break
+
+    def collapsed(self, thread: str | None = None) -> str:
+        """The profile as collapsed stacks, most sampled first; `thread` keeps one thread's."""
+        with self.lock:
+            stacks = self.stacks.most_common()
+        prefix = thread + ";" if thread is not None else ""
+        return "".join(f"{stack} {n}\n" for stack, n in stacks if stack.startswith(prefix))
+
+    def info(self, top: int = 20) -> dict:
+        """State of the current or last profile, and the functions most often on top of a stack."""
+        with self.lock:
+            leaves = Counter()
+            for stack, n in self.stacks.items():
+                thread, _, frames = stack.partition(";")
+                leaves[(thread, frames.rpartition(";")[2])] += n
+            return {
+                "running": self.running,
+                "started": self.started,
+                "seconds": self.seconds,
+                "elapsed": round(self.elapsed, 3),
+                "interval": self.interval,
+                "samples": self.samples,
+                "stacks": len(self.stacks),
+                "threads": dict(self.threads.most_common()),
+                "top": [{"thread": thread, "function": function, "samples": n}
+                        for (thread, function), n in leaves.most_common(top)],
+            }
+
+
+async def monitor_lag(histogram, interval: float = LAG_INTERVAL):
+    """Run forever on the event loop, observing how late each `interval` sleep wakes up."""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + interval
+        await asyncio.sleep(interval)
+        histogram.observe(max(0.0, loop.time() - scheduled))
+
+
+# One per process: every thread is sampled whichever app asked
+PROFILER = Sampler()
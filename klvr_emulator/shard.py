@@ -0,0 +1,298 @@
+"""Multi-core fleet mode: chargers split across worker processes.
+
+    python run.py --fleet 2000 --workers 8
+
+A supervisor binds every listening socket, then forks one worker per core
+(--workers 0) or the given number. Each worker is a whole emulator app
+(create_app) for a contiguous range of charger ids, with its own event
+loop, simulation thread, WebSocket fan-out and Bonjour records, serving the
+sockets it inherited: one port per charger in "ports" mode, one port per
+worker with /chargers/<id> in "prefix" mode. Chargers never talk to each
+other, so throughput scales with the workers.
+
+Slot and firmware state is published into one shared-memory segment in the
+checkpoint layout (klvr_emulator.checkpoint), followed by one sequence
+counter per worker:
+
+  header | record × fleet size | uint64 seq × workers
+
+A worker rewrites its own range of records whenever its chargers changed,
+at most every PUBLISH_SECONDS (and every FULL_PUBLISH_SECONDS regardless,
+for firmware state). The counter is odd while it writes, so readers retry
+instead of seeing a half-written range; a counter left odd for
+READ_TIMEOUT_SECONDS (a worker that died while publishing) marks the worker
+stalled, and its range is read as it stands until it publishes again. The supervisor serves the fleet-wide
+view straight from the segment, without asking the workers:
+
+  GET /api/v2/fleet/summary         slot states counted over every charger
+  GET /api/v2/fleet/status          every charger's status
+  GET /api/v2/fleet/status/{id}     one charger's status
+  GET /api/v2/fleet/workers         worker pids, charger ranges, ports, publishes, stalls
+"""
+import multiprocessing
+import signal
+import threading
+import time
+from collections import Counter
+from dataclasses import replace
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from klvr_emulator.checkpoint import LAYOUT_VERSION, MAGIC, layout_size, record_status, views, write_records
+from klvr_emulator.engine import NUM_SLOTS, SLOT_STATES
+
+PUBLISH_SECONDS = 0.25
+FULL_PUBLISH_SECONDS = 5.0
+READ_TIMEOUT_SECONDS = 1.0
+
+
+class SharedFleet:
+    """The shared-memory segment: `count` charger records and `workers` sequence counters."""
+
+    def __init__(self, count: int, workers: int, name: str | None = None):
+        self.count = count
+        self.workers = workers
+        size = layout_size(count) + 8 * workers
+        self.shm = SharedMemory(name=name, create=name is None, size=size if name is None else 0)
+        data = np.ndarray((size,), dtype=np.uint8, buffer=self.shm.buf)
+        self.header, self.records = views(data, count)
+        self.seqs = data[layout_size(count):size].view("<u8")
+        self.stalled: dict[int, int] = {}  # worker -> the odd counter it stopped at
+        if name is None:
+            data[:] = 0
+            header = self.header
+            header["magic"] = MAGIC
+            header["version"] = LAYOUT_VERSION
+            header["slots"] = NUM_SLOTS
+            header["capacity"] = count
+            header["count"] = count
+            header["complete"] = 1
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def publish(self, worker: int, start: int, fleet, chargers):
+        """Write `chargers` into records[start:], as `worker`."""
+        self.seqs[worker] += 1
+        write_records(fleet, chargers, self.records[start:start + len(chargers)])
+        self.header["written_at"] = time.time()
+        self.seqs[worker] += 1
+
+    def read(self, worker: int, start: int, end: int, timeout: float = READ_TIMEOUT_SECONDS) -> np.ndarray:
+        """A consistent copy of records[start:end], all published by `worker`.
+
+        If the worker stays mid-write for `timeout` seconds it is marked stalled
+        and the records are returned as they stand, possibly half-written; later
+        reads do not wait for it again until its counter moves.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            before = int(self.seqs[worker])
+            if before % 2 == 0:
+                copy = self.records[start:end].copy()
+                if int(self.seqs[worker]) == before:
+                    self.stalled.pop(worker, None)
+                    return copy
+            elif self.stalled.get(worker) == before or time.monotonic() >= deadline:
+                self.stalled[worker] = before
+                return self.records[start:end].copy()
+            time.sleep(0.0005)
+
+    def close(self, unlink: bool = False):
+        del self.header, self.records, self.seqs
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def split(count: int, workers: int) -> list[tuple[int, int]]:
+    """Contiguous [start, end) charger ranges, sizes differing by at most one."""
+    base, extra = divmod(count, workers)
+    ranges, start = [], 0
+    for k in range(workers):
+        end = start + base + (1 if k < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _suffix(path: str | None, worker: int) -> str | None:
+    return f"{path}.{worker}" if path else None
+
+
+def _publisher(shared: SharedFleet, worker: int, start: int, fleet, stop: threading.Event) -> threading.Thread:
+    """Publish the worker's chargers while they change; once more when `stop` is set."""
+    def run():
+        chargers = list(fleet)
+        last_versions, last_full = None, 0.0
+        while True:
+            stopping = stop.wait(PUBLISH_SECONDS)
+            versions = [c.version for c in chargers]
+            now = time.monotonic()
+            if stopping or versions != last_versions or now - last_full >= FULL_PUBLISH_SECONDS:
+                shared.publish(worker, start, fleet, chargers)
+                last_versions, last_full = versions, now
+            if stopping:
+                return
+
+    thread = threading.Thread(target=run, daemon=True, name=f"publisher-{worker}")
+    thread.start()
+    return thread
+
+
+def _worker(worker: int, start: int, end: int, config, mode: str, socks, shm_name: str, total: int, workers: int):
+    import uvicorn
+    from klvr_emulator.fleet import add_chargers
+    from klvr_emulator.main import create_app
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor stops workers with SIGTERM
+    shared = SharedFleet(total, workers, shm_name)
+    app = create_app(config)
+    emulator = app.state.emulator
+    add_chargers(emulator, end - start, mode, [s.getsockname()[1] for s in socks])
+    stop = threading.Event()
+    publisher = _publisher(shared, worker, start, emulator.fleet, stop)
+    try:
+        uvicorn.Server(uvicorn.Config(app, log_level="warning")).run(sockets=socks)
+    finally:
+        stop.set()
+        publisher.join()
+        shared.close()
+
+
+class Supervisor:
+    """Binds the sockets, forks the workers and reads the shared fleet view."""
+
+    def __init__(self, count: int, workers: int, mode: str, config, base_port: int = 8000, host: str = "0.0.0.0"):
+        from klvr_emulator.fleet import FLEET_MODES, bind_ports
+
+        if mode not in FLEET_MODES:
+            raise ValueError(f"Invalid fleet mode. Must be one of: {', '.join(FLEET_MODES)}")
+        workers = max(1, min(workers, count))
+        self.count = count
+        self.mode = mode
+        self.ranges = split(count, workers)
+        self.socks = bind_ports(count if mode == "ports" else workers, base_port, host)
+        self.ports = [[s.getsockname()[1] for s in self.worker_socks(k)] for k in range(workers)]
+        self.shared = SharedFleet(count, workers)
+        self.config = config
+        self.processes: list[multiprocessing.Process] = []
+
+    def worker_socks(self, worker: int) -> list:
+        start, end = self.ranges[worker]
+        return self.socks[start:end] if self.mode == "ports" else [self.socks[worker]]
+
+    def start(self):
+        # fork: workers inherit the bound sockets and the already imported modules
+        context = multiprocessing.get_context("fork")
+        for k, (start, end) in enumerate(self.ranges):
+            config = replace(self.config, first_charger=start,
+                             seed=self.config.seed + k if self.config.seed is not None else None,
+                             record=_suffix(self.config.record, k), checkpoint=_suffix(self.config.checkpoint, k))
+            process = context.Process(
+                target=_worker, name=f"klvr-worker-{k}", daemon=True,
+                args=(k, start, end, config, self.mode, self.worker_socks(k), self.shared.name, self.count,
+                      len(self.ranges)))
+            process.start()
+            self.processes.append(process)
+        for sock in self.socks:
+            sock.close()  # the workers hold their own copies
+
+    def stop(self, timeout: float = 10.0):
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+        self.shared.close(unlink=True)
+
+    def worker_info(self) -> list[dict]:
+        info = []
+        for k, ((start, end), process) in enumerate(zip(self.ranges, self.processes)):
+            ports = self.ports[k]
+            info.append({"worker": k, "pid": process.pid, "alive": process.is_alive(),
+                         "stalled": k in self.shared.stalled,
+                         "chargers": [start, end], "ports": [ports[0], ports[-1]] if len(ports) > 1 else ports,
+                         "publishes": int(self.shared.seqs[k]) // 2})
+        return info
+
+    def records(self) -> np.ndarray:
+        return np.concatenate([self.shared.read(k, start, end) for k, (start, end) in enumerate(self.ranges)])
+
+    def summary(self) -> dict:
+        records = self.records()
+        codes = records["slots"]["state"]
+        counts = np.bincount(codes.ravel(), minlength=len(SLOT_STATES))
+        detected = Counter(records["slots"]["detected"].ravel().tolist())
+        return {
+            "chargers": self.count,
+            "workers": len(self.ranges),
+            "slots": {state: int(n) for state, n in zip(SLOT_STATES, counts)},
+            "batteries": {k.decode(): n for k, n in detected.items() if k},
+            "written_at": float(self.shared.header["written_at"][0]),
+        }
+
+    def status(self, charger_id: str) -> dict | None:
+        index = int(charger_id) if charger_id.isdigit() else -1
+        for k, (start, end) in enumerate(self.ranges):
+            if start <= index < end:
+                return record_status(self.shared.read(k, index, index + 1)[0])
+        return None
+
+
+def create_supervisor_app(supervisor: Supervisor):
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import Response
+    from klvr_emulator.encoding import FastJSONResponse, json_bytes
+
+    app = FastAPI(default_response_class=FastJSONResponse)
+
+    @app.get("/api/v2/fleet/workers")
+    def get_workers():
+        return supervisor.worker_info()
+
+    @app.get("/api/v2/fleet/summary")
+    def get_summary():
+        return supervisor.summary()
+
+    @app.get("/api/v2/fleet/status")
+    def get_fleet_status():
+        records = supervisor.records()
+        body = {rec["id"].decode(): record_status(rec) for rec in records}
+        return Response(json_bytes(body), media_type="application/json")
+
+    @app.get("/api/v2/fleet/status/{charger_id}")
+    def get_charger_status(charger_id: str):
+        status = supervisor.status(charger_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Unknown charger")
+        return status
+
+    return app
+
+
+def run_supervisor(count: int, workers: int, mode: str, config, base_port: int = 8000, host: str = "0.0.0.0"):
+    import uvicorn
+    from klvr_emulator.fleet import bind_ports, raise_fd_limit
+
+    raise_fd_limit()
+    supervisor = Supervisor(count, workers, mode, config, base_port, host)
+    supervisor.start()
+    ports = supervisor.ports
+    last = max(p for worker_ports in ports for p in worker_ports)
+    sock = bind_ports(1, last + 1, host)[0]
+    if mode == "ports":
+        print(f"✅ Fleet of {count} chargers on ports {ports[0][0]}–{last} across {len(ports)} workers")
+    else:
+        print(f"✅ Fleet of {count} chargers across {len(ports)} workers on ports "
+              f"{', '.join(str(p[0]) for p in ports)} under /chargers/<id>")
+    print(f"🧭 Fleet view at http://{host}:{sock.getsockname()[1]}/api/v2/fleet/summary")
+    try:
+        uvicorn.Server(uvicorn.Config(create_supervisor_app(supervisor), log_level="warning")).run(
+            sockets=[sock])
+    except KeyboardInterrupt:
+        pass  # re-raised by uvicorn after its graceful shutdown
+    finally:
+        supervisor.stop()
@@ -0,0 +1,241 @@
+"""In-process emulator for client tests: no sockets, threads or Bonjour.
+
+    async with EmulatorHarness() as klvr:
+        await klvr.client.post("/api/v2/charger/insert/0?type=AA")
+        async with klvr.websocket("/api/v2/ws") as ws:
+            status = await ws.receive_json()
+        klvr.advance(3600)  # an hour of charging, applied before it returns
+
+The harness builds its own app with create_app() (not the module-level
+`klvr_emulator.main.app`, which every test would share) and runs its
+lifespan on the test's event loop. HTTP goes through httpx's ASGI
+transport and WebSockets through an ASGI session in the same loop, so
+nothing binds a port and any number of harnesses can run side by side,
+in one process or across xdist workers.
+
+The harness config differs from the defaults in what a test cannot use:
+the clock is manual, the simulation thread, mDNS and host detection are
+off, and events stay in the ring (`klvr.emulator.events.recent()`)
+instead of going to stdout. WebSocket pushes are sent without the
+debounce, so they arrive without advancing the clock. Simulated time
+moves only through advance(), or run() for requests that wait on it
+(firmware flashing, reboots).
+
+klvr_emulator.pytest_plugin wraps this in a `klvr` fixture.
+"""
+import asyncio
+import json
+from dataclasses import replace
+from urllib.parse import urlsplit
+import httpx
+from klvr_emulator.config import Config
+from klvr_emulator.main import create_app
+
+BASE_URL = "http://testserver"
+RECEIVE_TIMEOUT = 5.0  # wall-clock seconds a WebSocket receive waits before failing the test
+
+
+def harness_config(**overrides) -> Config:
+    """The Config a harness runs with: the defaults (never the KLVR_* environment) made test-friendly."""
+    config = Config(clock="manual", host_ip="127.0.0.1", mdns=False, simulate=False, log_format="none")
+    return replace(config, **overrides)
+
+
+class WebSocketClosed(Exception):
+    """The emulator refused the WebSocket handshake or closed the connection."""
+
+    def __init__(self, code: int, reason: str = ""):
+        super().__init__(f"WebSocket closed with code {code}" + (f": {reason}" if reason else ""))
+        self.code = code
+        self.reason = reason
+
+
+class WebSocketSession:
+    """One WebSocket connection to an ASGI app, driven in the caller's event loop."""
+
+    def __init__(self, app, url: str, subprotocols: list[str] | None = None,
+                 headers: dict[str, str] | None = None):
+        parts = urlsplit(url)
+        self.app = app
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": parts.path,
+            "raw_path": parts.path.encode(),
+            "query_string": parts.query.encode(),
+            "root_path": "",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+            "subprotocols": list(subprotocols or ()),
+            "client": ("testclient", 50000),
+            "server": ("testserver", 80),
+            "state": {},
+        }
+        self.subprotocol: str | None = None
+        self.close_code: int | None = None
+        self._inbox: asyncio.Queue = asyncio.Queue()   # client -> app
+        self._outbox: asyncio.Queue = asyncio.Queue()  # app -> client; None once the app returned
+        self._task: asyncio.Task | None = None
+        self._error: BaseException | None = None
+
+    async def _run(self):
+        try:
+            await self.app(self.scope, self._inbox.get, self._outbox.put)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._outbox.put_nowait(None)
+
+    async def _next(self, timeout: float | None) -> dict:
+        if self.close_code is not None:
+            raise WebSocketClosed(self.close_code)
+        message = await asyncio.wait_for(self._outbox.get(), timeout)
+        if message is None:
+            if self._error is not None:
+                raise self._error
+            self.close_code = 1006
+            raise WebSocketClosed(1006, "handler returned without closing")
+        if message["type"] == "websocket.close":
+            self.close_code = message.get("code", 1000)
+            raise WebSocketClosed(self.close_code, message.get("reason") or "")
+        return message
+
+    async def connect(self, timeout: float = RECEIVE_TIMEOUT):
+        self._task = asyncio.create_task(self._run())
+        await self._inbox.put({"type": "websocket.connect"})
+        message = await self._next(timeout)
+        if message["type"] != "websocket.accept":
+            raise WebSocketClosed(1006, f"unexpected {message['type']} during the handshake")
+        self.subprotocol = message.get("subprotocol")
+        return self
+
+    async def receive(self, timeout: float = RECEIVE_TIMEOUT) -> str | bytes:
+        """The next frame: str for text frames, bytes for binary ones."""
+        message = await self._next(timeout)
+        return message["text"] if message.get("text") is not None else message["bytes"]
+
+    async def receive_text(self, timeout: float = RECEIVE_TIMEOUT) -> str:
+        data = await self.receive(timeout)
+        if not isinstance(data, str):
+            raise TypeError("Expected a text frame, got a binary one")
+        return data
+
+    async def receive_bytes(self, timeout: float = RECEIVE_TIMEOUT) -> bytes:
+        data = await self.receive(timeout)
+        if not isinstance(data, bytes):
+            raise TypeError("Expected a binary frame, got a text one")
+        return data
+
+    async def receive_json(self, timeout: float = RECEIVE_TIMEOUT):
+        return json.loads(await self.receive_text(timeout))
+
+    async def send_text(self, text: str):
+        await self._inbox.put({"type": "websocket.receive", "text": text})
+
+    async def send_bytes(self, data: bytes):
+        await self._inbox.put({"type": "websocket.receive", "bytes": data})
+
+    async def send_json(self, data):
+        await self.send_text(json.dumps(data))
+
+    async def close(self, code: int = 1000):
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        if not task.done():
+            await self._inbox.put({"type": "websocket.disconnect", "code": code})
+            try:
+                await asyncio.wait_for(task, RECEIVE_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass  # wait_for cancelled the handler
+        if self.close_code is None:
+            self.close_code = code
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class EmulatorHarness:
+    """A started emulator app with an HTTP client and WebSocket sessions; see the module docstring."""
+
+    def __init__(self, config: Config | None = None, **overrides):
+        self.config = replace(config, **overrides) if config is not None else harness_config(**overrides)
+        self.app = create_app(self.config)
+        self.emulator = self.app.state.emulator
+        self.emulator.broadcasts.debounce = 0.0
+        self.clock = self.emulator.clock
+        self.fleet = self.emulator.fleet
+        self.charger = self.emulator.default_charger
+        self.client: httpx.AsyncClient | None = None
+        self.sessions: list[WebSocketSession] = []
+        self._lifespan = None
+
+    async def start(self):
+        self._lifespan = self.app.router.lifespan_context(self.app)
+        await self._lifespan.__aenter__()
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app), base_url=BASE_URL)
+        return self
+
+    async def stop(self):
+        for session in self.sessions:
+            await session.close()
+        self.sessions.clear()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        if self._lifespan is not None:
+            lifespan, self._lifespan = self._lifespan, None
+            await lifespan.__aexit__(None, None, None)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def websocket(self, path: str = "/api/v2/ws", subprotocols: list[str] | None = None,
+                  headers: dict[str, str] | None = None) -> WebSocketSession:
+        """A session to `path`; connect with `async with` (or `await ws.connect()`).
+
+        Sessions still open when the harness stops are closed then.
+        """
+        session = WebSocketSession(self.app, path, subprotocols, headers)
+        self.sessions.append(session)
+        return session
+
+    def advance(self, seconds: float) -> list:
+        """Step simulated time and push the chargers it changed, as POST /api/v2/emulator/clock/advance does."""
+        changed = self.fleet.advance(seconds)
+        for charger in changed:
+            self.emulator.notify_state_change(charger)
+        return changed
+
+    async def run(self, awaitable, step: float = 1.0, limit: float = 3600.0):
+        """Await `awaitable` while advancing the clock `step` seconds whenever it is waiting.
+
+        For requests that sleep on simulated time, like firmware uploads:
+
+            response = await klvr.run(klvr.client.post("/api/v2/device/firmware_charger", content=image))
+
+        Raises TimeoutError once `limit` simulated seconds have passed.
+        """
+        task = asyncio.ensure_future(awaitable)
+        advanced = 0.0
+        try:
+            while True:
+                # Let the awaitable run until it blocks on something (sync
+                # dependencies hop through the thread pool, hence the timeout)
+                await asyncio.wait([task], timeout=0.001)
+                if task.done():
+                    return task.result()
+                if advanced >= limit:
+                    raise TimeoutError(f"Still waiting after {limit:g} simulated seconds")
+                self.advance(step)
+                advanced += step
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
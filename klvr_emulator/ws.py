@@ -0,0 +1,94 @@
+"""Per-client WebSocket send queues.
+
+Broadcasting only enqueues frames; each client has its own writer task, so
+a slow or stalled consumer delays nobody but itself. Queues are bounded:
+a queued battery_status frame is replaced by a newer one, and a delta
+client that falls too far behind has its backlog dropped in favour of a
+fresh snapshot.
+
+Frames are klvr_emulator.encoding.Frame objects shared by every client;
+each client sends them in its own format, encoded once per format.
+"""
+import asyncio
+from collections import deque
+from fastapi import WebSocket
+from klvr_emulator.encoding import Frame
+from klvr_emulator.metrics import WS_CLIENTS_PRUNED
+
+WS_QUEUE_SIZE = 32
+
+STATUS = "status"      # full battery_status frame — only the latest matters
+DELTA = "delta"        # battery_delta frame with a seq
+HEARTBEAT = "heartbeat"
+SNAPSHOT = "snapshot"  # delta-protocol battery_status with a seq
+RESYNC = "resync"      # placeholder: build a snapshot when it is sent
+
+
+class WSClient:
+    def __init__(self, websocket: WebSocket, charger, delta: bool = False, max_queue: int = WS_QUEUE_SIZE,
+                 fmt: str = "json"):
+        self.websocket = websocket
+        self.charger = charger
+        self.delta = delta
+        self.format = fmt
+        self.max_queue = max_queue
+        self.queue: deque[tuple[str, int, Frame | None]] = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.collapsed = 0  # frames replaced or dropped because the client lagged
+        self.task: asyncio.Task | None = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._writer())
+
+    def stop(self):
+        self.closed = True
+        if self.task is not None:
+            self.task.cancel()
+
+    def push(self, kind: str, frame: Frame | None, seq: int = 0):
+        """Queue a frame without blocking the caller."""
+        if self.closed:
+            return
+        queue = self.queue
+        if kind == STATUS:
+            before = len(queue)
+            self.queue = queue = deque(item for item in queue if item[0] != STATUS)
+            self.collapsed += before - len(queue)
+        elif kind == SNAPSHOT:
+            # A snapshot supersedes everything queued before it
+            self.collapsed += len(queue)
+            queue.clear()
+        elif len(queue) >= self.max_queue:
+            self.collapsed += len(queue)
+            queue.clear()
+            kind, frame = RESYNC, None
+        queue.append((kind, seq, frame))
+        self.ready.set()
+
+    async def _writer(self):
+        floor = 0  # deltas at or below the last snapshot's seq are already applied
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.queue:
+                    kind, seq, frame = self.queue.popleft()
+                    if kind == RESYNC:
+                        kind, seq, frame = SNAPSHOT, *self.charger.delta_snapshot()
+                    if kind == SNAPSHOT:
+                        floor = seq
+                    elif kind == DELTA and seq <= floor:
+                        continue
+                    data = frame.encode(self.format)
+                    if isinstance(data, bytes):
+                        await self.websocket.send_bytes(data)
+                    else:
+                        await self.websocket.send_text(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.closed = True
+            if self in self.charger.ws_clients:
+                self.charger.ws_clients.remove(self)
+                WS_CLIENTS_PRUNED.inc()
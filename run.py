@@ -1,6 +1,8 @@
+import argparse
+import os
 import socket
 import uvicorn
-from klvr_emulator.main import app
+from klvr_emulator.config import Config
 
 def find_available_port(start_port=8000, max_tries=50):
     for port in range(start_port, start_port + max_tries):
@@ -12,27 +14,64 @@ def find_available_port(start_port=8000, max_tries=50):
                 continue
     raise RuntimeError("❌ No available ports found in range 8000–8050")
 
-def get_local_ip():
-    try:
-        # Create a dummy socket connection to detect local IP (no traffic sent)
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except Exception:
-        return "localhost"
-
-
-from klvr_emulator import main as emulator_main
+def parse_args():
+    parser = argparse.ArgumentParser(description="KLVR Charger Pro emulator")
+    parser.add_argument("--fleet", type=int, default=0, metavar="N",
+                        help="serve N independent chargers from this process")
+    parser.add_argument("--fleet-mode", choices=("ports", "prefix"), default="ports",
+                        help="one port per charger, or /chargers/<id> on a single port")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="with --fleet: split the chargers across N worker processes (0: one per core)")
+    parser.add_argument("--port", type=int, default=8000, help="first port to try")
+    parser.add_argument("--engine", choices=("dict", "array", "event"), default=os.environ.get("KLVR_ENGINE", "dict"),
+                        help="slot simulation engine (array needs numpy)")
+    parser.add_argument("--clock", default=os.environ.get("KLVR_CLOCK", "real"), metavar="real|manual|SCALE",
+                        help="simulated clock: wall-clock, stepped by hand, or sped up e.g. 100")
+    parser.add_argument("--ws-max-clients", type=int, default=int(os.environ.get("KLVR_WS_MAX_CLIENTS", "2")),
+                        help="WebSocket clients allowed per charger (firmware: 8)")
+    parser.add_argument("--seed", type=int, default=os.environ.get("KLVR_SEED"),
+                        help="seed the RNG behind bulk_insert for reproducible scenarios")
+    parser.add_argument("--record", default=os.environ.get("KLVR_RECORD"), metavar="PATH",
+                        help="log every slot change and simulation step to PATH for replay")
+    parser.add_argument("--checkpoint", default=os.environ.get("KLVR_CHECKPOINT"), metavar="PATH",
+                        help="restore state from PATH at startup and checkpoint it periodically and on shutdown")
+    parser.add_argument("--checkpoint-interval", type=float,
+                        default=float(os.environ.get("KLVR_CHECKPOINT_INTERVAL", "30")),
+                        help="seconds between checkpoints (0: only on shutdown)")
+    parser.add_argument("--profile", default=os.environ.get("KLVR_PROFILE"), metavar="PRESET|FILE",
+                        help="device performance profile: firmware, flaky, instant or a JSON file")
+    parser.add_argument("--history", type=int, default=int(os.environ.get("KLVR_HISTORY", "0")), metavar="N",
+                        help="slot history samples kept per charger, about 440 bytes each: 720 (a 2-hour "
+                             "charge) is about 316 KB per charger (default 0: no history)")
+    parser.add_argument("--log-level", choices=("debug", "info", "warning", "error"),
+                        default=os.environ.get("KLVR_LOG_LEVEL", "info"),
+                        help="event log level; debug also logs firmware upload headers and query params")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    port = find_available_port()
-    ip = get_local_ip()
-
-    # Pass the actual port to main.py
-    emulator_main.runtime_port = port
-
-    print(f"✅ Emulator running at http://{ip}:{port}")
-    uvicorn.run(emulator_main.app, host="0.0.0.0", port=port, log_level="info")
+    args = parse_args()
+    config = Config.from_env(
+        engine=args.engine,
+        clock=args.clock,
+        ws_max_clients=args.ws_max_clients,
+        seed=int(args.seed) if args.seed is not None else None,
+        record=args.record,
+        checkpoint=args.checkpoint,
+        checkpoint_interval=args.checkpoint_interval,
+        profile=args.profile,
+        history=args.history,
+        log_level=args.log_level,
+    )
+    from klvr_emulator.main import create_app
 
+    workers = args.workers or os.cpu_count() or 1
+    if args.fleet > 1 and workers > 1:
+        from klvr_emulator.shard import run_supervisor
+        run_supervisor(args.fleet, workers, args.fleet_mode, config, args.port)
+    elif args.fleet > 1:
+        from klvr_emulator.fleet import run_fleet
+        run_fleet(create_app(config), args.fleet, args.fleet_mode, args.port)
+    else:
+        # The app reports and advertises the port it is actually served on
+        config.port = find_available_port(args.port)
+        uvicorn.run(create_app(config), host="0.0.0.0", port=config.port, log_level="info")
@@ -0,0 +1,18 @@
+import pytest
+from klvr_emulator.charger import Fleet
+from klvr_emulator.clock import Clock
+from klvr_emulator.engine import ENGINES, make_engine
+
+pytest_plugins = ["klvr_emulator.pytest_plugin", "pytester"]
+
+
+@pytest.fixture(params=list(ENGINES))
+def fleet(request):
+    """A fleet on a manual clock, once per simulation engine."""
+    clock = Clock(manual=True)
+    return Fleet(make_engine(request.param, clock), clock)
+
+
+@pytest.fixture
+def charger(fleet):
+    return fleet.new_charger("0", "127.0.0.1")
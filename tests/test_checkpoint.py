@@ -0,0 +1,109 @@
+import threading
+import numpy as np
+import pytest
+from klvr_emulator import checkpoint as ckp
+from klvr_emulator.charger import Fleet
+from klvr_emulator.clock import Clock
+from klvr_emulator.engine import make_engine
+
+
+def same_fleet(fleet, ids=("0",)) -> Fleet:
+    """A fresh fleet on the same engine type, with chargers `ids`."""
+    clock = Clock(manual=True)
+    restored = Fleet(make_engine(fleet.engine.name, clock), clock)
+    for charger_id in ids:
+        restored.new_charger(charger_id, "127.0.0.1")
+    return restored
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "state.ckp")
+
+
+def test_round_trip(fleet, charger, path):
+    charger.update_slot(3, slotState="charging", stateOfChargePercent=60.0, batteryDetected="KLVR-AA")
+    charger.update_slot(7, slotState="error", errorMsg="overtemp")
+    charger.firmware.update(main_firmware_pending=True, main_firmware_size=4096, main_firmware_version="2.0.0")
+    charger.state["firmwareVersion"] = "1.5.0"
+    assert ckp.checkpoint(fleet, path)["chargers"] == 1
+
+    restored = same_fleet(fleet)
+    assert ckp.restore(restored, path)["chargers"] == 1
+    copy = restored.get("0")
+    assert copy.batteries() == charger.batteries()
+    assert copy.firmware == charger.firmware
+    assert copy.state["firmwareVersion"] == "1.5.0"
+
+
+def test_unknown_chargers_are_skipped(fleet, path):
+    fleet.new_charger("0", "127.0.0.1").update_slot(0, slotState="cold")
+    fleet.new_charger("1", "127.0.0.1").update_slot(0, slotState="warm")
+    restored = same_fleet(fleet, ids=("1", "2"))
+    ckp.checkpoint(fleet, path)
+    info = ckp.restore(restored, path)
+    assert (info["chargers"], info["skipped"]) == (1, 1)
+    assert restored.get("1").battery(0)["slotState"] == "warm"
+    assert restored.get("2").battery(0)["slotState"] == "empty"
+
+
+def test_torn_checkpoint_is_ignored(fleet, charger, path):
+    ckp.checkpoint(fleet, path)
+    data = np.memmap(path, dtype=np.uint8, mode="r+")
+    data[:ckp.HEADER.itemsize].view(ckp.HEADER)["complete"] = 0
+    data.flush()
+    del data
+    assert ckp.restore(same_fleet(fleet), path) is None
+
+
+def test_missing_checkpoint(fleet, path):
+    assert ckp.restore(fleet, path) is None
+
+
+def test_reboot_in_progress_is_not_restored(fleet, charger, path):
+    charger.firmware.update(main_firmware_pending=True, main_rebooting=True, rear_rebooting=True)
+    ckp.checkpoint(fleet, path)
+    restored = same_fleet(fleet)
+    restored.get("0").firmware.update(main_rebooting=True)
+    ckp.restore(restored, path)
+    firmware = restored.get("0").firmware
+    assert firmware["main_firmware_pending"] is True
+    assert (firmware["main_rebooting"], firmware["rear_rebooting"]) == (False, False)
+
+
+def test_failed_checkpoint_keeps_the_previous_one(fleet, charger, path, monkeypatch):
+    charger.update_slot(0, slotState="cold")
+    ckp.checkpoint(fleet, path)
+    charger.update_slot(0, slotState="warm")
+
+    def crash(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(ckp, "write_records", crash)
+    with pytest.raises(OSError):
+        ckp.checkpoint(fleet, path)
+    monkeypatch.undo()
+    assert not ckp.os.path.exists(path + ".tmp")
+    restored = same_fleet(fleet)
+    ckp.restore(restored, path)
+    assert restored.get("0").battery(0)["slotState"] == "cold"
+
+
+def test_concurrent_saves_are_serialized(fleet, charger, path):
+    checkpointer = ckp.Checkpointer(fleet, path, interval=0)
+    errors = []
+
+    def save_repeatedly():
+        try:
+            for _ in range(10):
+                checkpointer.save()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save_repeatedly) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert ckp.restore(same_fleet(fleet), path)["chargers"] == 1
@@ -0,0 +1,53 @@
+import json
+import struct
+import pytest
+from klvr_emulator.encoding import (COLUMNAR_JSON, COLUMNAR_MSGPACK, JSON, MSGPACK, Frame, columnar, encode_status,
+                                    json_bytes, msgpack_bytes, negotiate)
+
+
+@pytest.mark.parametrize("value, packed", [
+    ({"a": 1}, b"\x81\xa1a\x01"),
+    ([None, True, False], b"\x93\xc0\xc3\xc2"),
+    (-1, b"\xff"),
+    (300, b"\xcf" + struct.pack(">Q", 300)),
+    (-300, b"\xd3" + struct.pack(">q", -300)),
+    (0.5, b"\xcb" + struct.pack(">d", 0.5)),
+    ("x" * 40, b"\xd9\x28" + b"x" * 40),
+])
+def test_msgpack_values(value, packed):
+    assert msgpack_bytes(value) == packed
+
+
+def test_msgpack_columns_match_item_by_item_packing():
+    floats = [k / 4 for k in range(16)]
+    assert msgpack_bytes(floats) == b"\xdc\x00\x10" + b"".join(b"\xcb" + struct.pack(">d", f) for f in floats)
+    ints = [k * 1000 - 3000 for k in range(16)]
+    assert msgpack_bytes(ints) == b"\xdc\x00\x10" + b"".join(b"\xd3" + struct.pack(">q", i) for i in ints)
+
+
+def test_columnar(charger):
+    status = charger.status()
+    table = columnar(status)["batteries"]
+    assert table["index"] == list(range(48))
+    assert json.loads(encode_status(status, COLUMNAR_JSON))["batteries"] == table
+    assert encode_status(status, JSON) == json_bytes(status)
+    assert encode_status(status, COLUMNAR_MSGPACK) == msgpack_bytes(columnar(status))
+
+
+@pytest.mark.parametrize("accept, media_type", [
+    (None, JSON),
+    ("*/*", JSON),
+    ("application/msgpack", MSGPACK),
+    ("application/x-msgpack", MSGPACK),
+    ("application/json;q=0.5, application/vnd.klvr.columnar+json", COLUMNAR_JSON),
+    ("text/html", JSON),
+])
+def test_negotiate(accept, media_type):
+    assert negotiate(accept) == media_type
+
+
+def test_frame_encodes_once_per_format():
+    frame = Frame({"event": "battery_status", "data": {"batteries": [{"index": 0}]}})
+    assert frame.encode() is frame.encode()
+    assert json.loads(frame.encode("columnar"))["data"]["batteries"] == {"index": [0]}
+    assert isinstance(frame.encode("msgpack"), bytes)
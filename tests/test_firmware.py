@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+from pathlib import Path
+import pytest
+from klvr_emulator.clock import Clock
+from klvr_emulator.config import Config
+from klvr_emulator.firmware import FIRMWARE_FLASH_SECONDS, flash_seconds, receive_firmware, store_image
+from klvr_emulator.testing import EmulatorHarness
+
+pytestmark = pytest.mark.anyio
+
+IMAGE = bytes(range(256)) * 4096  # 1 MiB
+
+
+class Upload:
+    """Stands in for the Request: its body in 64 KiB chunks."""
+
+    def __init__(self, data: bytes, chunk: int = 64 * 1024):
+        self.data = data
+        self.chunk = chunk
+
+    async def stream(self):
+        for k in range(0, len(self.data), self.chunk):
+            yield self.data[k:k + self.chunk]
+
+
+async def drive(clock: Clock, awaitable, step: float = 0.5):
+    """Await `awaitable`, advancing the manual clock whenever it is waiting on it."""
+    task = asyncio.ensure_future(awaitable)
+    while True:
+        await asyncio.wait([task], timeout=0.001)
+        if task.done():
+            return task.result()
+        clock.advance(step)
+
+
+async def test_upload_is_paced_on_the_simulated_clock():
+    clock = Clock(manual=True)
+    image = await drive(clock, receive_firmware(Upload(IMAGE), clock, throughput=256 * 1024))
+    assert clock.now() >= 4.0  # 1 MiB at 256 KiB/s
+    assert image.size == len(IMAGE)
+    assert image.sha256 == hashlib.sha256(IMAGE).hexdigest()
+    assert image.path is None
+
+
+async def test_unpaced_upload_does_not_wait():
+    clock = Clock(manual=True)
+    image = await receive_firmware(Upload(IMAGE), clock, throughput=0)
+    assert clock.now() == 0 and image.size == len(IMAGE)
+
+
+async def test_spilled_image_is_replaced(tmp_path):
+    clock = Clock(manual=True)
+    firmware = {}
+    first = await receive_firmware(Upload(IMAGE), clock, throughput=0, spill_dir=str(tmp_path))
+    store_image(firmware, "main", first)
+    assert Path(first.path).read_bytes() == IMAGE
+    second = await receive_firmware(Upload(b"\x01" * 10), clock, throughput=0, spill_dir=str(tmp_path))
+    store_image(firmware, "main", second)
+    assert list(tmp_path.iterdir()) == [Path(second.path)]
+    assert firmware["main_firmware_size"] == 10
+
+
+def test_flash_seconds():
+    assert flash_seconds(1 << 20, throughput=0) == FIRMWARE_FLASH_SECONDS
+    assert flash_seconds(1 << 20, throughput=512 * 1024) == FIRMWARE_FLASH_SECONDS + 2.0
+
+
+def test_settings_come_from_the_environment(tmp_path):
+    config = Config.from_env({"KLVR_FIRMWARE_THROUGHPUT": "1000", "KLVR_FLASH_THROUGHPUT": "500",
+                              "KLVR_FIRMWARE_SPILL_DIR": str(tmp_path), "KLVR_CHECKPOINT_INTERVAL": "5"})
+    assert (config.firmware_throughput, config.flash_throughput) == (1000, 500)
+    assert (config.firmware_spill_dir, config.checkpoint_interval) == (str(tmp_path), 5)
+
+
+async def test_upload_uses_the_app_config(tmp_path):
+    async with EmulatorHarness(firmware_throughput=256 * 1024, flash_throughput=512 * 1024,
+                               firmware_spill_dir=str(tmp_path)) as klvr:
+        response = await klvr.run(klvr.client.post("/api/v2/device/firmware_charger?version=2.0.0",
+                                                   content=IMAGE), step=0.5)
+        assert response.status_code == 200, response.text
+        # 4 s on the link at 256 KiB/s, then the 2 s apply delay plus 2 s of flashing at 512 KiB/s
+        assert klvr.clock.now() >= 8.0
+        assert klvr.charger.firmware["main_firmware_sha256"] == hashlib.sha256(IMAGE).hexdigest()
+        [spilled] = tmp_path.iterdir()
+        assert spilled.read_bytes() == IMAGE
@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from klvr_emulator.testing import EmulatorHarness, WebSocketClosed, harness_config
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_http(klvr):
+    response = await klvr.client.post("/api/v2/charger/insert/0?type=KLVR-AA")
+    assert response.json() == {"ok": True}
+    status = (await klvr.client.get("/api/v2/charger/status")).json()
+    assert status["batteries"][0]["batteryDetected"] == "KLVR-AA"
+
+
+async def test_pushes_arrive_without_advancing_the_clock(klvr):
+    async with klvr.websocket() as ws:
+        assert (await ws.receive_json())["event"] == "battery_status"
+        await klvr.client.post("/api/v2/charger/set_cold/4")
+        status = await ws.receive_json()
+        assert status["data"]["batteries"][4]["slotState"] == "cold"
+    assert klvr.clock.now() == 0
+
+
+async def test_delta_session_and_resync(klvr):
+    async with klvr.websocket("/api/v2/ws?mode=delta") as ws:
+        seq = (await ws.receive_json())["seq"]
+        await klvr.client.post("/api/v2/charger/insert/1?type=KLVR-AAA")
+        delta = await ws.receive_json()
+        assert (delta["event"], delta["seq"]) == ("battery_delta", seq + 1)
+        await ws.send_json({"cmd": "resync"})
+        snapshot = await ws.receive_json()
+        assert snapshot["seq"] == seq + 1
+        assert snapshot["data"]["batteries"][1]["batteryDetected"] == "KLVR-AAA"
+
+
+async def test_refused_handshake(klvr):
+    with pytest.raises(WebSocketClosed) as closed:
+        async with klvr.websocket("/api/v2/ws?format=xml"):
+            pass
+    assert closed.value.code == 1008
+
+
+async def test_dashboard_does_not_take_websocket_slots(klvr):
+    page = (await klvr.client.get("/")).text
+    assert "/api/v2/charger/events" in page
+    assert "new WebSocket" not in page
+
+
+async def test_advance_charges_and_pushes(klvr):
+    await klvr.client.post("/api/v2/charger/insert/2?type=KLVR-AA")
+    async with klvr.websocket() as ws:
+        await ws.receive_json()
+        assert klvr.advance(600) == [klvr.charger]
+        status = await ws.receive_json()
+        assert status["data"]["batteries"][2]["stateOfChargePercent"] > 5.0
+
+
+async def test_run_advances_while_a_request_sleeps(klvr):
+    response = await klvr.run(klvr.client.post("/api/v2/device/firmware_charger?version=2.0.0",
+                                               content=b"\x00" * 1024))
+    assert response.status_code == 200
+    assert klvr.clock.now() >= 2.0  # the apply delay
+    assert klvr.charger.firmware["main_firmware_pending"] is True
+    with pytest.raises(TimeoutError):
+        await klvr.run(asyncio.Event().wait(), limit=5)
+
+
+async def test_long_poll(klvr):
+    version = (await klvr.client.get("/api/v2/charger/status")).headers["X-State-Version"]
+    response = await klvr.client.get(f"/api/v2/charger/status?since={version}&timeout=0.01")
+    assert response.status_code == 304
+    poll = asyncio.ensure_future(klvr.client.get(f"/api/v2/charger/status?since={version}&timeout=5"))
+    await asyncio.sleep(0.01)
+    await klvr.client.post("/api/v2/charger/eject/0")
+    response = await asyncio.wait_for(poll, 5)
+    assert int(response.headers["X-State-Version"]) == int(version) + 1
+
+
+async def test_harnesses_are_independent(klvr):
+    async with EmulatorHarness(engine="array") as other:
+        await other.client.post("/api/v2/charger/set_warm/0")
+        assert other.fleet.engine.name == "array"
+    assert klvr.charger.battery(0)["slotState"] == "empty"
+
+
+def test_harness_config_ignores_the_environment(monkeypatch):
+    monkeypatch.setenv("KLVR_ENGINE", "array")
+    config = harness_config(seed=3)
+    assert (config.engine, config.clock, config.mdns, config.seed) == ("dict", "manual", False, 3)
@@ -0,0 +1,78 @@
+import pytest
+from klvr_emulator.charger import Fleet
+from klvr_emulator.clock import Clock
+from klvr_emulator.engine import ENGINES, make_engine
+from klvr_emulator.history import History
+from klvr_emulator.testing import EmulatorHarness
+
+
+@pytest.fixture(params=list(ENGINES))
+def fleet(request):
+    clock = Clock(manual=True)
+    return Fleet(make_engine(request.param, clock), clock, History(capacity=8, interval=10.0))
+
+
+def test_first_sample_when_a_charger_joins(fleet, charger):
+    times, soc, temp, state = fleet.history.samples(charger.row)
+    assert times.tolist() == [0.0]
+    history = fleet.history.query(charger.row, fleet.clock.now(), 4)
+    assert history["slots"][0]["slotState"] == ["empty"] * 4
+
+
+def test_charging_is_sampled_every_interval(fleet, charger):
+    charger.update_slot(2, slotState="charging", stateOfChargePercent=20.0, batteryDetected="KLVR-AA")
+    for _ in range(6):
+        fleet.advance(60)
+    history = fleet.history.query(charger.row, fleet.clock.now(), 6, seconds=360, slots=[2])
+    [slot] = history["slots"]
+    assert slot["index"] == 2
+    assert all(s is not None for s in slot["stateOfChargePercent"])
+    assert slot["stateOfChargePercent"][-1] > slot["stateOfChargePercent"][0] >= 20
+    assert slot["slotState"][-1] == "charging"
+
+
+def test_mutations_within_the_gap_replace_the_last_sample(fleet, charger):
+    charger.update_slot(0, slotState="cold")
+    charger.update_slot(0, slotState="warm")
+    times, soc, temp, state = fleet.history.samples(charger.row)
+    assert len(times) == 1  # the join sample was replaced too: all at t=0
+    fleet.clock.advance(5)
+    charger.update_slot(0, slotState="empty")
+    assert len(fleet.history.samples(charger.row)[0]) == 2
+
+
+def test_ring_keeps_the_newest_samples(fleet, charger):
+    for k in range(12):
+        fleet.clock.advance(10)
+        charger.update_slot(1, stateOfChargePercent=float(k))
+    times, soc, temp, state = fleet.history.samples(charger.row)
+    assert len(times) == 8
+    assert soc[:, 1].tolist() == [float(k) for k in range(4, 12)]
+
+
+def test_empty_window_carries_the_last_values(fleet, charger):
+    charger.update_slot(3, slotState="error", errorMsg="faulty")
+    fleet.clock.advance(100)
+    history = fleet.history.query(charger.row, fleet.clock.now(), 5, seconds=50, slots=[3])
+    assert history["slots"][0]["slotState"] == ["error"] * 5
+
+
+def test_arrays_allocated_on_first_change():
+    engine = make_engine("dict")
+    history = History(capacity=8)
+    row = engine.add_row()
+    history.add(engine, row, 0.0)
+    assert history.times is None and history.nbytes == 0
+    times, soc, temp, state = history.samples(row)
+    assert times.tolist() == [0.0]
+    assert history.nbytes > 0
+
+
+@pytest.mark.anyio
+async def test_history_is_opt_in(klvr):
+    assert klvr.fleet.history is None
+    response = await klvr.client.get("/api/v2/charger/history")
+    assert response.status_code == 404
+    async with EmulatorHarness(history=720) as enabled:
+        response = await enabled.client.get("/api/v2/charger/history?points=2")
+        assert response.json()["slots"][0]["slotState"] == ["empty", "empty"]
@@ -0,0 +1,98 @@
+import pytest
+from klvr_emulator.ops import MAX_BATCH_OPS, OpError, apply_batch, validate_batch
+
+
+def test_batch_applies_in_one_version(charger):
+    version = charger.version
+    apply_batch(charger, validate_batch([
+        {"op": "insert", "slot": 0, "type": "KLVR-AA"},
+        {"op": "set_charge", "slot": 0, "percentage": 100},
+        {"op": "set_cold", "slot": 1},
+        {"op": "set_error", "slot": 2, "type": "overcurrent"},
+    ]))
+    assert charger.version == version + 1
+    batteries = charger.batteries()
+    assert batteries[0]["slotState"] == "done"
+    assert batteries[0]["batteryDetected"] == "KLVR-AA"
+    assert batteries[1]["slotState"] == "cold"
+    assert (batteries[2]["slotState"], batteries[2]["errorMsg"]) == ("error", "overcurrent")
+
+
+def test_ops_apply_in_order(charger):
+    apply_batch(charger, validate_batch([
+        {"op": "insert", "slot": 5, "type": "KLVR-AAA"},
+        {"op": "bulk_clear"},
+        {"op": "insert", "slot": 6, "type": "KLVR-AA"},
+    ]))
+    assert [b["index"] for b in charger.batteries() if b["slotState"] != "empty"] == [6]
+
+
+@pytest.mark.parametrize("op, message", [
+    ({"op": "insert", "slot": 48, "type": "KLVR-AA"}, "Invalid slot number"),
+    ({"op": "insert", "slot": True, "type": "KLVR-AA"}, "slot must be an integer"),
+    ({"op": "insert", "slot": 3}, "type must be a non-empty string"),
+    ({"op": "set_error", "slot": 3, "type": "melted"}, "Invalid error type"),
+    ({"op": "set_charge", "slot": 3, "percentage": 101}, "Percentage must be between 0 and 100"),
+    ({"op": "set_charge", "slot": 3, "percentage": "50"}, "Invalid percentage value"),
+    ({"op": "set_charge", "slot": 3, "percentage": float("nan")}, "Invalid percentage value"),
+    ({"op": "set_charge", "slot": 3, "percentage": float("inf")}, "Invalid percentage value"),
+    ({"op": "explode", "slot": 3}, "Invalid op"),
+    ("insert", "operation must be an object"),
+])
+def test_bad_op_rejects_the_whole_batch(op, message):
+    with pytest.raises(OpError) as error:
+        validate_batch([{"op": "insert", "slot": 0, "type": "KLVR-AA"}, op])
+    assert error.value.index == 1
+    assert str(error.value).startswith(f"ops[1]: {message}")
+
+
+@pytest.mark.parametrize("ops, message", [
+    ("insert", "ops must be a list"),
+    ([{"op": "bulk_clear"}] * (MAX_BATCH_OPS + 1), "Too many operations"),
+])
+def test_batch_shape(ops, message):
+    with pytest.raises(OpError, match=message) as error:
+        validate_batch(ops)
+    assert error.value.index is None
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("value", ["NaN", "Infinity", "-Infinity"])
+async def test_non_finite_percentages_are_rejected(klvr, value):
+    body = '{"ops": [{"op": "set_charge", "slot": 0, "percentage": %s}]}' % value
+    response = await klvr.client.post("/api/v2/charger/batch", content=body)
+    assert response.status_code == 400
+    response = await klvr.client.post("/api/v2/charger/set_charge/0", content='{"percentage": %s}' % value)
+    assert response.json() == {"detail": "Invalid percentage value"}
+    response = await klvr.client.post("/api/v2/charger/set_charge/0", json={"percentage": value.lower()})
+    assert response.status_code == 400
+    assert (await klvr.client.get("/api/v2/charger/status")).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_slot_endpoints_hold_the_simulation_lock(klvr, monkeypatch):
+    held = []
+    write_slot = klvr.charger.write_slot
+
+    def spy(slot, fields):
+        held.append(klvr.fleet.lock.locked())
+        write_slot(slot, fields)
+
+    monkeypatch.setattr(klvr.charger, "write_slot", spy)
+    await klvr.client.post("/api/v2/charger/insert/0?type=KLVR-AA")
+    await klvr.client.post("/api/v2/charger/bulk_insert?seed=1")
+    assert held and all(held)
+
+
+@pytest.mark.anyio
+async def test_empty_batch_changes_nothing(klvr):
+    version = klvr.charger.version
+    async with klvr.websocket() as ws:
+        await ws.receive_json()
+        response = await klvr.client.post("/api/v2/charger/batch", json={"ops": []})
+        assert response.json() == {"ok": True, "applied": 0, "version": version}
+        assert klvr.charger.version == version
+        await klvr.client.post("/api/v2/charger/insert/0?type=KLVR-AA")
+        # the first push is the insert's: the empty batch sent none
+        assert (await ws.receive_json())["data"]["batteries"][0]["batteryDetected"] == "KLVR-AA"
+        assert klvr.charger.version == version + 1
@@ -0,0 +1,29 @@
+import os
+from pathlib import Path
+
+ROOT = str(Path(__file__).resolve().parents[1])
+
+HOST_TESTS = """
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_host():
+    pass
+
+
+async def test_emulator(klvr):
+    assert (await klvr.client.get("/api/v2/charger/status")).status_code == 200
+"""
+
+
+def test_loaded_with_p_only_pins_klvr_tests(pytester, monkeypatch):
+    monkeypatch.setenv("PYTHONPATH", ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    pytester.makepyfile(test_host=HOST_TESTS)
+    result = pytester.runpytest_subprocess("-p", "klvr_emulator.pytest_plugin", "--collect-only", "-q")
+    collected = [line for line in result.outlines if "::" in line]
+    assert "test_host.py::test_host[asyncio]" in collected
+    assert "test_host.py::test_host[trio]" in collected  # not ours to drop
+    assert "test_host.py::test_emulator[asyncio]" in collected
+    assert "test_host.py::test_emulator[trio]" not in collected
@@ -0,0 +1,102 @@
+import asyncio
+import httpx
+import pytest
+from klvr_emulator.profile import PRESETS, DeviceProfileMiddleware, Profile, _Gate
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_gate_queues_in_order():
+    profile = Profile(max_connections=1, queue_timeout=1)
+    gate = _Gate()
+    assert await gate.acquire(profile)
+    second = asyncio.ensure_future(gate.acquire(profile))
+    third = asyncio.ensure_future(gate.acquire(profile))
+    await asyncio.sleep(0)
+    assert not second.done()
+    gate.release()
+    assert await second is True
+    assert not third.done()
+    gate.release()
+    assert await third is True
+    gate.release()
+    assert gate.active == 0
+
+
+async def test_cancelled_waiter_passes_its_slot_on():
+    profile = Profile(max_connections=1, queue_timeout=1)
+    gate = _Gate()
+    assert await gate.acquire(profile)
+    cancelled = asyncio.ensure_future(gate.acquire(profile))
+    third = asyncio.ensure_future(gate.acquire(profile))
+    await asyncio.sleep(0)
+    gate.release()     # the slot goes to `cancelled`...
+    cancelled.cancel()  # ...whose request disconnects before it resumes
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    assert await third is True
+    gate.release()
+    assert gate.active == 0 and not gate.waiters
+
+
+async def test_gate_refuses_when_full():
+    profile = Profile(max_connections=1, overflow="refuse")
+    gate = _Gate()
+    assert await gate.acquire(profile)
+    assert await gate.acquire(profile) is False
+    queued = Profile(max_connections=1, queue_limit=0)
+    assert await gate.acquire(queued) is False
+
+
+async def test_gate_wait_times_out():
+    profile = Profile(max_connections=1, queue_timeout=0.01)
+    gate = _Gate()
+    assert await gate.acquire(profile)
+    assert await gate.acquire(profile) is False
+    assert not gate.waiters
+
+
+@pytest.mark.parametrize("data", [
+    {"overflow": "drop"},
+    {"error_rate": 2},
+    {"error_status": 404},
+    {"max_connections": -1},
+    {"latency": {"*": {"poisson_ms": [1, 2]}}},
+    {"preset": "unknown"},
+    {"bandwidth": 1},
+])
+def test_invalid_profiles(data):
+    with pytest.raises(ValueError):
+        Profile.from_dict(data)
+
+
+def test_presets_build():
+    for name in PRESETS:
+        Profile.from_dict({"preset": name})
+    assert Profile.from_dict({"preset": "flaky", "error_rate": 0}).error_rate == 0
+    assert Profile().inert
+
+
+def test_delay_matches_the_most_specific_pattern():
+    profile = Profile(latency={"*": {"fixed_ms": 10}, "/api/v2/device/*": {"fixed_ms": 250}})
+    assert profile.delay("/api/v2/device/info") == 0.25
+    assert profile.delay("/api/v2/charger/status") == 0.01
+
+
+async def ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def test_injected_faults_only_on_resolved_paths():
+    profile = Profile(error_rate=1, error_status=503)
+
+    def resolve(scope):
+        return ("0", scope["path"], profile) if scope["path"].startswith("/api/v2/charger") else None
+
+    app = DeviceProfileMiddleware(ok, resolve)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver") as client:
+        response = await client.get("/api/v2/charger/status")
+        assert response.status_code == 503
+        assert response.json() == {"detail": "Injected device fault"}
+        assert (await client.get("/api/v2/emulator/clock")).text == "ok"
@@ -0,0 +1,65 @@
+import threading
+import time
+import pytest
+from klvr_emulator.checkpoint import record_status
+from klvr_emulator.shard import SharedFleet, split
+
+
+@pytest.fixture
+def shared():
+    shared = SharedFleet(2, 2)
+    yield shared
+    shared.close(unlink=True)
+
+
+def test_split():
+    assert split(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert split(2, 2) == [(0, 1), (1, 2)]
+
+
+def test_publish_and_read(fleet, charger, shared):
+    charger.update_slot(6, slotState="charging", stateOfChargePercent=40.0, batteryDetected="KLVR-AAA")
+    charger.update_slot(7, slotState="error", errorMsg="overtemp")
+    shared.publish(1, 1, fleet, [charger])
+    assert int(shared.seqs[1]) == 2 and int(shared.seqs[0]) == 0
+
+    reader = SharedFleet(2, 2, shared.name)  # attached by name, as the supervisor's workers are
+    try:
+        [record] = reader.read(1, 1, 2)
+    finally:
+        reader.close()
+    assert record["id"] == b"0"
+    status = record_status(record)
+    assert status["batteries"][6]["batteryDetected"] == "KLVR-AAA"
+    assert status["batteries"][7]["errorMsg"] == "overtemp"
+    assert [b["slotState"] for b in status["batteries"]] == [b["slotState"] for b in charger.batteries()]
+
+
+def test_read_waits_for_a_write_in_progress(shared):
+    shared.seqs[0] += 1  # a writer is halfway through
+    done = []
+    reader = threading.Thread(target=lambda: done.append(shared.read(0, 0, 1)))
+    reader.start()
+    time.sleep(0.02)
+    assert not done
+    shared.records["id"][0] = b"0"
+    shared.seqs[0] += 1
+    reader.join(5)
+    assert done and done[0]["id"][0] == b"0"
+
+
+def test_read_gives_up_on_a_dead_writer(shared):
+    shared.seqs[0] += 1  # the writer died halfway through
+    shared.records["id"][0] = b"0"
+    started = time.monotonic()
+    assert shared.read(0, 0, 1, timeout=0.05)["id"][0] == b"0"
+    assert time.monotonic() - started >= 0.05
+    assert shared.stalled == {0: 1}
+    started = time.monotonic()
+    shared.read(0, 0, 1, timeout=5)  # already stalled: no second wait
+    assert time.monotonic() - started < 1
+    assert shared.read(1, 1, 2, timeout=0.05) is not None and 1 not in shared.stalled
+
+    shared.seqs[0] += 1  # it came back and finished
+    shared.read(0, 0, 1)
+    assert shared.stalled == {}
@@ -0,0 +1,13 @@
+import subprocess
+import sys
+
+
+def test_numpy_not_imported_at_startup():
+    # Only the array engine, slot history and MessagePack columns need numpy
+    code = ("import sys\n"
+            "from klvr_emulator.main import create_app\n"
+            "from klvr_emulator.testing import harness_config\n"
+            "create_app(harness_config())\n"
+            "print('numpy' in sys.modules)\n")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import pytest
+from klvr_emulator.broadcast import BroadcastScheduler
+from klvr_emulator.encoding import COLUMNAR_JSON, etag_matches
+from klvr_emulator.main import status_events
+
+
+def test_status_serialized_once_per_version(charger):
+    version, body = charger.status_snapshot()
+    assert charger.status_snapshot() == (version, body)
+    assert charger.status_snapshot()[1] is body
+    assert json.loads(body) == charger.status()
+
+
+def test_mutation_invalidates_the_cache(charger):
+    version, body = charger.status_snapshot()
+    etag = charger.etag(version)
+    charger.update_slot(3, slotState="charging", stateOfChargePercent=40.0, batteryDetected="KLVR-AA")
+    new_version, new_body = charger.status_snapshot()
+    assert new_version == version + 1
+    assert json.loads(new_body)["batteries"][3]["batteryDetected"] == "KLVR-AA"
+    assert charger.etag(new_version) != etag
+
+
+def test_simulation_step_bumps_version(fleet, charger):
+    charger.update_slot(0, slotState="charging", stateOfChargePercent=40.0, batteryDetected="KLVR-AA")
+    version, body = charger.status_snapshot()
+    assert fleet.advance(60) == [charger]
+    assert charger.version > version
+    assert json.loads(charger.status_snapshot()[1])["batteries"][0]["stateOfChargePercent"] > 40.0
+
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False),
+    ("", False),
+    ('"a-0-1"', True),
+    ('W/"a-0-1"', True),
+    ('"a-0-2", "a-0-1"', True),
+    ('"a-0-2"', False),
+    ("*", True),
+])
+def test_etag_matches(header, matches):
+    assert etag_matches(header, '"a-0-1"') is matches
+
+
+def test_each_format_has_its_own_body_and_etag(charger):
+    version, body = charger.status_snapshot()
+    columnar_version, columnar_body = charger.status_snapshot(COLUMNAR_JSON)
+    assert columnar_version == version
+    assert json.loads(columnar_body)["batteries"]["index"] == list(range(48))
+    assert charger.etag(version, COLUMNAR_JSON) != charger.etag(version)
+
+
+@pytest.fixture
+async def broadcasts(fleet):
+    async def send(charger, heartbeat=False):
+        pass
+
+    broadcasts = BroadcastScheduler(fleet.clock, send, fleet)
+    broadcasts.start()
+    yield broadcasts
+    broadcasts.stop()
+
+
+def change(broadcasts, charger, slot: int = 2):
+    charger.update_slot(slot, slotState="charging", batteryDetected="KLVR-AA")
+    broadcasts.request(charger)
+
+
+@pytest.mark.anyio
+async def test_wait_for_change(broadcasts, charger):
+    assert await broadcasts.wait_for_change(charger, charger.version - 1, 5) is True  # already past
+    assert await broadcasts.wait_for_change(charger, charger.version, 0.01) is False
+    assert not broadcasts.waiters
+    waiting = asyncio.ensure_future(broadcasts.wait_for_change(charger, charger.version, 5))
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+    change(broadcasts, charger)
+    assert await asyncio.wait_for(waiting, 5) is True
+    assert broadcasts.stats["woken"] == 1
+
+
+@pytest.mark.anyio
+async def test_sse_sends_each_new_version(broadcasts, charger):
+    events = status_events(charger, broadcasts, -1)
+    assert await anext(events) == b"retry: 1000\n\n"
+    first = await anext(events)
+    assert first.startswith(b"id: %d\nevent: battery_status\ndata: {" % charger.version)
+    change(broadcasts, charger)
+    second = await asyncio.wait_for(anext(events), 5)
+    assert second.startswith(b"id: %d\n" % charger.version)
+    assert b'"KLVR-AA"' in second
+    await events.aclose()
+
+
+@pytest.mark.anyio
+async def test_sse_cursor_skips_versions_the_client_has(broadcasts, charger):
+    events = status_events(charger, broadcasts, charger.version)
+    await anext(events)
+    waiting = asyncio.ensure_future(anext(events))
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+    change(broadcasts, charger)
+    assert (await asyncio.wait_for(waiting, 5)).startswith(b"id: %d\n" % charger.version)
+    await events.aclose()
+
+
+@pytest.mark.anyio
+async def test_heartbeat_keeps_wall_clock_time(fleet, charger):
+    sent = []
+
+    async def send(charger, heartbeat=False):
+        sent.append(heartbeat)
+
+    broadcasts = BroadcastScheduler(fleet.clock, send, fleet, heartbeat=0.05)
+    charger.ws_clients.append(object())
+    broadcasts.start()
+    try:
+        fleet.clock.advance(3600)  # an hour of emulated time is not a heartbeat interval
+        await asyncio.sleep(0)
+        assert sent == []
+        await asyncio.sleep(0.12)
+        assert sent and all(sent)
+    finally:
+        broadcasts.stop()
@@ -0,0 +1,48 @@
+import json
+
+
+def decode(taken) -> tuple[int, dict]:
+    seq, frame = taken
+    return seq, json.loads(frame.encode())
+
+
+def test_first_delta_is_none_and_sets_the_baseline(charger):
+    assert charger.take_delta() is None
+    seq, snapshot = decode(charger.delta_snapshot())
+    assert snapshot["event"] == "battery_status"
+    assert snapshot["seq"] == seq == 0
+    assert snapshot["data"]["batteries"] == charger.batteries()
+
+
+def test_delta_carries_only_changed_fields(charger):
+    charger.take_delta()
+    charger.update_slot(4, slotState="charging", batteryDetected="KLVR-AA")
+    seq, delta = decode(charger.take_delta())
+    assert delta["event"] == "battery_delta"
+    assert delta["seq"] == seq == 1
+    assert delta["data"]["batteries"] == [{"index": 4, "slotState": "charging", "batteryDetected": "KLVR-AA"}]
+    assert charger.take_delta() is None  # nothing changed since
+
+
+def test_seq_counts_deltas_not_versions(charger):
+    charger.take_delta()
+    charger.update_slot(1, slotState="cold")
+    charger.update_slot(2, slotState="warm")
+    seq, delta = decode(charger.take_delta())
+    assert seq == 1
+    assert [b["index"] for b in delta["data"]["batteries"]] == [1, 2]
+    charger.update_slot(2, slotState="warm")  # same value: a new version, but no change
+    assert charger.take_delta() is None
+
+
+def test_snapshot_matches_the_baseline_of_the_next_delta(charger):
+    charger.take_delta()
+    charger.update_slot(7, slotState="error", errorMsg="faulty")
+    charger.take_delta()
+    seq, snapshot = decode(charger.delta_snapshot())
+    assert seq == snapshot["seq"] == 1
+    assert snapshot["data"]["batteries"][7]["errorMsg"] == "faulty"
+    charger.update_slot(7, slotState="empty", errorMsg="")
+    seq, delta = decode(charger.take_delta())
+    assert seq == 2
+    assert delta["data"]["batteries"] == [{"index": 7, "slotState": "empty", "errorMsg": ""}]